@@ -0,0 +1,46 @@
+"""
+Replaying a capture through the connection, the decode throughput on recorded
+traffic.
+
+    python -m pytest benchmarks/bench_capture.py
+"""
+import pytest
+
+from enron_modbus.capture import CaptureWriter, CapturingTransport, replay_frames
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.connection import EnronModbusConnection
+from enron_modbus.simulator import LoopbackTransport
+
+from conftest import MAX_BOOLEANS, MAX_FLOAT32, MAX_INT16, SLAVE_ADDRESS
+
+POLLS = 200
+
+
+@pytest.fixture
+def capture_path(slave, tmp_path):
+    path = tmp_path / "poll.capture"
+    transport = LoopbackTransport()
+    transport.add_slave(slave)
+    writer = CaptureWriter.open(path)
+    client = EnronModbusClient(
+        CapturingTransport(transport, writer),
+        EnronModbusConnection(hot_path_logging=False),
+        hot_path_logging=False,
+    )
+    client.connect()
+    for index in range(POLLS):
+        client.read_booleans(SLAVE_ADDRESS, 1001, MAX_BOOLEANS)
+        client.read_numerics(SLAVE_ADDRESS, 3001, MAX_INT16)
+        client.read_numerics(SLAVE_ADDRESS, 7001, MAX_FLOAT32)
+        client.read_history(SLAVE_ADDRESS, 701, index)
+    client.disconnect()
+    writer.close()
+    return path
+
+
+def test_replay_capture(benchmark, capture_path):
+    benchmark.group = "replay"
+    benchmark.extra_info["exchanges"] = POLLS * 4
+    exchanges = benchmark(lambda: list(replay_frames(capture_path)))
+    assert len(exchanges) == POLLS * 4
+    assert not any(exchange.error for exchange in exchanges)
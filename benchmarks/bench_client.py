@@ -0,0 +1,74 @@
+"""
+Full client round trips against an in-memory simulated slave. Measures everything
+in the library between the API call and the transport.
+
+    python -m pytest benchmarks/bench_client.py
+"""
+import pytest
+
+from enron_modbus.planner import ReadPlanner
+from enron_modbus.templates import PollTemplate
+
+from conftest import MAX_BOOLEANS, MAX_FLOAT32, MAX_INT16, SLAVE_ADDRESS
+
+NUMERIC_READS = {
+    "small": (7001, 2),
+    "max_int16": (3001, MAX_INT16),
+    "max_float32": (7001, MAX_FLOAT32),
+}
+
+
+@pytest.mark.parametrize("name", NUMERIC_READS)
+def test_read_numerics(benchmark, client, name):
+    benchmark.group = "client read_numerics"
+    start_register, amount = NUMERIC_READS[name]
+    result = benchmark(client.read_numerics, SLAVE_ADDRESS, start_register, amount)
+    assert len(result) == amount
+
+
+@pytest.mark.parametrize("amount", [8, MAX_BOOLEANS], ids=["small", "max"])
+def test_read_booleans(benchmark, client, amount):
+    benchmark.group = "client read_booleans"
+    result = benchmark(client.read_booleans, SLAVE_ADDRESS, 1001, amount)
+    assert len(result) == amount
+
+
+def test_write_numeric(benchmark, client):
+    benchmark.group = "client writes"
+    benchmark(client.write_numeric, SLAVE_ADDRESS, 7001, 1.5)
+
+
+def test_write_boolean(benchmark, client):
+    benchmark.group = "client writes"
+    benchmark(client.write_boolean, SLAVE_ADDRESS, 1001, True)
+
+
+def test_read_history(benchmark, client):
+    benchmark.group = "client read_history"
+    assert len(benchmark(client.read_history, SLAVE_ADDRESS, 701, 5)) == 48
+
+
+def test_read_numerics_partial_reads(benchmark, client):
+    """Response arriving 16 bytes at a time, like from a slow serial port."""
+    benchmark.group = "client read_numerics"
+    client.transport.chunk_size = 16
+    result = benchmark(client.read_numerics, SLAVE_ADDRESS, 7001, MAX_FLOAT32)
+    assert len(result) == MAX_FLOAT32
+
+
+POLL_REGISTERS = [1001, 1004, 1010, 3001, 3002, 3010, 5001, 7001, 7002, 7003, 7050]
+
+
+def test_poll_read_plan(benchmark, client):
+    benchmark.group = "client poll"
+    plan = ReadPlanner().plan(POLL_REGISTERS)
+    result = benchmark(plan.execute, client, SLAVE_ADDRESS)
+    assert len(result) == len(POLL_REGISTERS)
+
+
+def test_poll_template(benchmark, client):
+    """Same reads as test_poll_read_plan from pre-encoded frames."""
+    benchmark.group = "client poll"
+    template = PollTemplate.compile(SLAVE_ADDRESS, POLL_REGISTERS)
+    result = benchmark(template.execute, client)
+    assert result == ReadPlanner().read(client, SLAVE_ADDRESS, POLL_REGISTERS)
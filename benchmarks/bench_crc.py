@@ -0,0 +1,59 @@
+"""
+CRC micro benchmarks. Run with pytest-benchmark:
+
+    python -m pytest benchmarks/bench_crc.py
+
+`bytewise` is the one byte per step kernel the library used before, kept here as
+the baseline to compare against.
+"""
+import os
+
+import pytest
+
+from enron_modbus import crc
+
+FRAME_SIZES = [8, 256]
+
+
+def bytewise_crc(data: bytes) -> bytes:
+    value = 0xFFFF
+    for _byte in data:
+        idx = crc.crc16_table[(value ^ _byte) & 0xFF]
+        value = ((value >> 8) & 0xFF) ^ idx
+    swapped = ((value << 8) & 0xFF00) | ((value >> 8) & 0x00FF)
+    return swapped.to_bytes(2, "big")
+
+
+@pytest.fixture(params=FRAME_SIZES, ids=lambda size: f"{size}B")
+def frame(request):
+    data = os.urandom(request.param - 2)
+    return data + crc.calculate_crc(data)
+
+
+def test_bytewise(benchmark, frame):
+    benchmark.group = f"crc {len(frame)}B"
+    assert benchmark(bytewise_crc, frame[:-2]) == frame[-2:]
+
+
+def test_calculate_crc(benchmark, frame):
+    benchmark.group = f"crc {len(frame)}B"
+    assert benchmark(crc.calculate_crc, frame[:-2]) == frame[-2:]
+
+
+def test_frame_crc_is_valid(benchmark, frame):
+    benchmark.group = f"crc {len(frame)}B"
+    assert benchmark(crc.frame_crc_is_valid, frame)
+
+
+def test_incremental_in_chunks(benchmark, frame):
+    """Frame arriving in 16 byte chunks, as from a serial port."""
+    benchmark.group = f"crc {len(frame)}B"
+    chunks = [frame[i : i + 16] for i in range(0, len(frame), 16)]
+
+    def run():
+        check = crc.Crc16()
+        for chunk in chunks:
+            check.update(chunk)
+        return check.frame_is_valid
+
+    assert benchmark(run)
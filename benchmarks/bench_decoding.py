@@ -0,0 +1,64 @@
+"""
+Decoding response data to register values.
+
+    python -m pytest benchmarks/bench_decoding.py
+"""
+import pytest
+
+from enron_modbus import utils
+
+from conftest import MAX_BOOLEANS, MAX_FLOAT32, MAX_INT16, MAX_INT32
+
+NUMERIC_READS = {
+    "int16_small": (3001, 4),
+    "int16_max": (3001, MAX_INT16),
+    "int32_max": (5001, MAX_INT32),
+    "float32_small": (7001, 4),
+    "float32_max": (7001, MAX_FLOAT32),
+}
+
+
+@pytest.mark.parametrize("name", NUMERIC_READS)
+def test_map_numeric_response(benchmark, name):
+    benchmark.group = "numeric decoding"
+    start_register, amount = NUMERIC_READS[name]
+    raw_data = bytes(amount * utils.get_numeric_value_size(start_register))
+    result = benchmark(utils.map_numeric_response, start_register, amount, raw_data)
+    assert len(result) == amount
+
+
+@pytest.mark.parametrize("name", ["int16_max", "float32_max"])
+def test_numeric_array_from_response(benchmark, name):
+    benchmark.group = "numeric decoding"
+    start_register, amount = NUMERIC_READS[name]
+    raw_data = bytes(amount * utils.get_numeric_value_size(start_register))
+    result = benchmark(
+        utils.numeric_array_from_response, start_register, amount, raw_data
+    )
+    assert len(result) == amount
+
+
+@pytest.mark.parametrize("amount", [8, MAX_BOOLEANS], ids=["small", "max"])
+def test_map_boolean_response(benchmark, amount):
+    benchmark.group = "boolean decoding"
+    raw_data = bytes([0x5A]) * utils.number_of_bytes_containing_booleans(amount)
+    result = benchmark(utils.map_boolean_response, 1001, amount, raw_data)
+    assert len(result) == amount
+
+
+@pytest.mark.parametrize("amount", [8, MAX_BOOLEANS], ids=["small", "max"])
+def test_boolean_bits_from_response(benchmark, amount):
+    benchmark.group = "boolean decoding"
+    raw_data = bytes([0x5A]) * utils.number_of_bytes_containing_booleans(amount)
+    result = benchmark(utils.boolean_bits_from_response, 1001, amount, raw_data)
+    assert len(result) == amount
+
+
+def test_boolean_bits_changed(benchmark):
+    benchmark.group = "boolean change detection"
+    size = utils.number_of_bytes_containing_booleans(MAX_BOOLEANS)
+    previous = utils.boolean_bits_from_response(1001, MAX_BOOLEANS, bytes(size))
+    current = utils.boolean_bits_from_response(
+        1001, MAX_BOOLEANS, bytes([0x01]) + bytes(size - 2) + bytes([0x40])
+    )
+    assert benchmark(current.changed, previous) == [1001, 1001 + MAX_BOOLEANS - 1]
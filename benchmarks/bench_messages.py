@@ -0,0 +1,85 @@
+"""
+Request encoding and response parsing.
+
+    python -m pytest benchmarks/bench_messages.py
+"""
+import tracemalloc
+
+import pytest
+
+from enron_modbus import messages
+
+from conftest import MAX_FLOAT32, MAX_INT16
+
+REQUESTS = {
+    "boolean_read": messages.BooleanReadRequest(1, 1001, 16),
+    "numeric_read": messages.NumericReadRequest(1, 7001, 10),
+    "boolean_write": messages.BooleanWriteRequest(1, 1001, True),
+    "numeric_write": messages.NumericWriteRequest(1, 7001, 1.5),
+    "history": messages.HistoryRequest(1, 701, 10),
+    "numeric_multiple_write": messages.NumericMultipleWriteRequest(
+        1, 7001, [1.5] * 10
+    ),
+}
+
+RESPONSES = {
+    "boolean_read_small": messages.BooleanReadResponse(1, b"\x55\x01"),
+    "boolean_read_max": messages.BooleanReadResponse(1, bytes(range(125))),
+    "numeric_read_small": messages.NumericReadResponse(1, bytes(8)),
+    "numeric_read_max_int16": messages.NumericReadResponse(1, bytes(2 * MAX_INT16)),
+    "numeric_read_max_float32": messages.NumericReadResponse(
+        1, bytes(4 * MAX_FLOAT32)
+    ),
+    "boolean_write": messages.BooleanWriteResponse(1, 1001, True),
+    "numeric_write": messages.NumericWriteResponse(1, 7001, 1.5),
+    "exception": messages.ExceptionResponse(1, 0x03, messages.ILLEGAL_DATA_ADDRESS),
+}
+
+
+@pytest.mark.parametrize("name", REQUESTS)
+def test_encode_request(benchmark, name):
+    benchmark.group = "encode request"
+    request = REQUESTS[name]
+    assert benchmark(request.to_bytes)
+
+
+@pytest.mark.parametrize("name", RESPONSES)
+def test_parse_response(benchmark, name):
+    benchmark.group = "parse response"
+    frame = RESPONSES[name].to_bytes()
+    response = benchmark(
+        messages.StandardResponseFactory.make_response_from_bytes, frame
+    )
+    assert response == RESPONSES[name]
+
+
+def test_parse_history_response(benchmark):
+    benchmark.group = "parse response"
+    frame = messages.HistoryResponse(1, bytes(48)).to_bytes()
+    assert benchmark(messages.HistoryResponse.from_bytes, frame)
+
+
+def test_parse_response_batch(benchmark):
+    """
+    Parse and keep a poll cycle's worth of responses. The memory held by the parsed
+    messages is in extra_info.
+    """
+    benchmark.group = "parse response batch"
+    frames = [
+        messages.NumericWriteResponse(1, 7001 + number % 999, 1.5).to_bytes()
+        for number in range(1000)
+    ]
+    parse = messages.StandardResponseFactory.make_response_from_bytes
+
+    def parse_all():
+        return [parse(frame) for frame in frames]
+
+    result = benchmark(parse_all)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = parse_all()
+    benchmark.extra_info["bytes_per_message"] = (
+        tracemalloc.get_traced_memory()[0] - before
+    ) / len(kept)
+    tracemalloc.stop()
+    assert len(result) == 1000
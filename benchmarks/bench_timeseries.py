@@ -0,0 +1,33 @@
+"""
+Storing polled values and downsampling them.
+
+    python -m pytest benchmarks/bench_timeseries.py
+"""
+import pytest
+
+from enron_modbus import utils
+from enron_modbus.timeseries import SampleRing, SampleStore
+
+from conftest import MAX_FLOAT32
+
+DAY = 86400
+
+
+def test_store_add_poll_result(benchmark):
+    benchmark.group = "sample store"
+    store = SampleStore(DAY)
+    raw_data = bytes(MAX_FLOAT32 * 4)
+    values = utils.map_numeric_response(7001, MAX_FLOAT32, raw_data)
+    timestamps = iter(range(10 ** 9))
+    benchmark(lambda: store.add(1, values, next(timestamps)))
+    assert len(store) == MAX_FLOAT32
+
+
+@pytest.mark.parametrize("interval", [60, 3600], ids=["minute", "hour"])
+def test_downsample_day(benchmark, interval):
+    benchmark.group = "downsample"
+    ring = SampleRing(DAY, "f")
+    for second in range(DAY + DAY // 2):
+        ring.append(second, second % 600)
+    result = benchmark(ring.downsample, interval)
+    assert len(result) == DAY // interval
@@ -0,0 +1,51 @@
+import logging
+
+import pytest
+import structlog
+
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.connection import EnronModbusConnection
+from enron_modbus.simulator import LoopbackTransport, SimulatedSlave
+
+SLAVE_ADDRESS = 1
+
+# Largest reads that fit in one response: byte count is a single byte and the
+# boolean table has 999 registers.
+MAX_BOOLEANS = 999
+MAX_INT16 = 125
+MAX_INT32 = 63
+MAX_FLOAT32 = 63
+
+
+@pytest.fixture(autouse=True, scope="session")
+def quiet_logging():
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+    )
+
+
+@pytest.fixture
+def slave():
+    slave = SimulatedSlave(SLAVE_ADDRESS)
+    for register in range(1001, 2000, 3):
+        slave.tables.set(register, True)
+    for offset in range(999):
+        slave.tables.set(3001 + offset, offset - 500)
+        slave.tables.set(5001 + offset, offset * 100_000)
+        slave.tables.set(7001 + offset, offset / 7)
+    slave.history[701] = [bytes(range(48))] * 840
+    return slave
+
+
+@pytest.fixture
+def client(slave):
+    transport = LoopbackTransport()
+    transport.add_slave(slave)
+    client = EnronModbusClient(
+        transport,
+        EnronModbusConnection(hot_path_logging=False),
+        hot_path_logging=False,
+    )
+    client.connect()
+    yield client
+    client.disconnect()
@@ -0,0 +1,324 @@
+import asyncio
+import struct
+import attr
+from typing import *
+import structlog
+from enron_modbus import events, history, messages, utils
+from enron_modbus.async_transports import AsyncEnronModbusTransport
+from enron_modbus.client import ClientOperationsMixin, Operation, T
+from enron_modbus.connection import EnronModbusConnection
+from enron_modbus.metrics import TransactionObserver
+from enron_modbus.retry import RetryPolicy
+
+
+LOG = structlog.get_logger()
+
+
+@attr.s(auto_attribs=True)
+class AsyncEnronModbusClient(ClientOperationsMixin):
+    """
+    asyncio version of `EnronModbusClient`. Uses the same sans-IO connection so
+    one event loop can drive many buses, one client per bus.
+
+    Requests made concurrently on the same client are sent one at a time since a
+    bus can only have one outstanding request.
+
+    `metrics`, `hot_path_logging` and `retry_policy` work as on
+    `EnronModbusClient`.
+    """
+
+    transport: AsyncEnronModbusTransport
+    connection: EnronModbusConnection = attr.ib(factory=EnronModbusConnection)
+    # Record size in bytes per (slave address, history table).
+    history_record_sizes: Dict[Tuple[int, int], int] = attr.ib(factory=dict)
+    metrics: Optional[TransactionObserver] = attr.ib(default=None)
+    hot_path_logging: bool = attr.ib(default=True)
+    # (slave address, function code) of multiple writes the slave doesn't support.
+    multiple_write_unsupported: Set[Tuple[int, int]] = attr.ib(factory=set)
+    retry_policy: Optional[RetryPolicy] = attr.ib(default=None)
+    _recv_calls: int = attr.ib(init=False, default=0, repr=False)
+    _bytes_received: int = attr.ib(init=False, default=0, repr=False)
+    _lock: asyncio.Lock = attr.ib(init=False, factory=asyncio.Lock, repr=False)
+
+    async def connect(self):
+        LOG.info("Client connecting", client=self)
+        await self.transport.connect()
+
+    async def disconnect(self):
+        LOG.info("Client disconnecting", client=self)
+        await self.transport.disconnect()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.disconnect()
+
+    async def read_booleans(
+        self,
+        slave_address: int,
+        start_register: int,
+        amount: int,
+        as_bitset: bool = False,
+    ) -> Union[Dict[int, bool], utils.BooleanBits]:
+        """
+        Get all booleans and return them as a dict with the register as key.
+        With `as_bitset` the values are returned as a `utils.BooleanBits` instead,
+        which is cheaper for large reads and compares quickly to an earlier read.
+        """
+        return await self._run(
+            self._read_booleans(slave_address, start_register, amount, as_bitset)
+        )
+
+    async def read_boolean(self, slave_address: int, register: int) -> bool:
+        """
+        Just read one boolean
+        """
+        return (await self.read_booleans(slave_address, register, 1))[register]
+
+    async def write_boolean(
+        self, slave_address: int, register: int, value: bool
+    ) -> None:
+        """
+        Set a boolean value
+        """
+        req = messages.BooleanWriteRequest(slave_address, register, value)
+        await self.make_request(req)
+
+    async def read_numerics(
+        self,
+        slave_address: int,
+        start_register: int,
+        amount: int,
+        as_array: bool = False,
+    ) -> Union[Dict[int, Union[int, float]], utils.NumericArray]:
+        """
+        Get all numerics and return them as a dict with the register as key.
+        With `as_array` the values are returned as a `utils.NumericArray` instead,
+        which is cheaper for large reads.
+        """
+        return await self._run(
+            self._read_numerics(slave_address, start_register, amount, as_array)
+        )
+
+    async def read_numeric(
+        self, slave_address: int, register: int
+    ) -> Union[int, float]:
+        """
+        Just read one numeric
+        """
+        return (await self.read_numerics(slave_address, register, amount=1))[register]
+
+    async def write_numeric(
+        self, slave_address: int, register: int, value: Union[int, float]
+    ):
+        """
+        Write a numeric value
+        """
+        req = messages.NumericWriteRequest(slave_address, register, value)
+        await self.make_request(req)
+
+    async def write_numerics(
+        self, slave_address: int, values: Mapping[int, Union[int, float]]
+    ) -> None:
+        """
+        Write numerics given as a dict with the register as key. Consecutive
+        registers are written with one preset multiple registers (0x10) request.
+        """
+        await self._run(
+            self._write_multiple(
+                slave_address,
+                values,
+                messages.NumericMultipleWriteRequest,
+                messages.NumericWriteRequest,
+            )
+        )
+
+    async def write_booleans(self, slave_address: int, values: Mapping[int, bool]) -> None:
+        """
+        Write booleans given as a dict with the register as key. Consecutive
+        registers are written with one force multiple (0x0F) request.
+        """
+        await self._run(
+            self._write_multiple(
+                slave_address,
+                values,
+                messages.BooleanMultipleWriteRequest,
+                messages.BooleanWriteRequest,
+            )
+        )
+
+    async def read_history(self, slave_address: int, table: int, index: int) -> bytes:
+        """
+        Read a history entry
+        Uses function code 0x03
+
+        The record size is learned from the first response so later reads of the
+        table can ask the transport for the exact response length. It can also be
+        set up front in `history_record_sizes` from the device's modbus map.
+        """
+        return await self._run(self._read_history(slave_address, table, index))
+
+    async def iter_history(
+        self,
+        slave_address: int,
+        table: int,
+        start_index: int,
+        count: int,
+        table_size: int,
+        prefetch: int = 8,
+    ) -> AsyncIterator[history.HistoryRecord]:
+        """
+        Read `count` history records from `start_index`, rolling over at
+        `table_size`, and yield them as they arrive.
+
+        Records are read ahead, up to `prefetch` of them, while the consumer handles
+        the earlier ones so the bus is kept busy. On failure a
+        `history.HistoryReadoutError` is raised telling where to resume.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(prefetch, 1))
+        stopped = asyncio.Event()
+
+        async def read_records():
+            remaining = count
+            for index in history.get_history_indices(start_index, count, table_size):
+                if stopped.is_set():
+                    return
+                try:
+                    raw_data = await self.read_history(slave_address, table, index)
+                except Exception as e:
+                    await queue.put(
+                        self._make_readout_error(table, index, remaining, e)
+                    )
+                    return
+                remaining -= 1
+                await queue.put(history.HistoryRecord(table, index, raw_data))
+            await queue.put(None)
+
+        reader = asyncio.ensure_future(read_records())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                if isinstance(item, history.HistoryReadoutError):
+                    raise item
+                yield item
+        finally:
+            # Let a read in flight finish, cancelling it would leave its response
+            # to be read by the next request.
+            stopped.set()
+            while not queue.empty():
+                queue.get_nowait()
+            await reader
+
+    async def read_events(
+        self,
+        slave_address: int,
+        record_struct: struct.Struct = events.EVENT_RECORD_STRUCT,
+    ) -> List[events.EventRecord]:
+        """
+        Read the next batch of events and alarms. The same batch is read again
+        until it is acknowledged with `acknowledge_events`.
+        """
+        return await self._run(self._read_events(slave_address, record_struct))
+
+    async def acknowledge_events(self, slave_address: int) -> None:
+        """
+        Acknowledge the batch last read so the next read gets the following events.
+        """
+        await self._run(self._acknowledge_events(slave_address))
+
+    async def iter_events(
+        self,
+        slave_address: int,
+        max_batches: Optional[int] = None,
+        record_struct: struct.Struct = events.EVENT_RECORD_STRUCT,
+    ) -> AsyncIterator[events.EventRecord]:
+        """
+        Read and acknowledge batches until the log is empty, or `max_batches` were
+        read, and yield each record. A batch is acknowledged once all its records
+        were consumed so records not handled because of an error are read again.
+        """
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = await self.read_events(slave_address, record_struct)
+            if not batch:
+                return
+            batches += 1
+            for record in batch:
+                yield record
+            await self.acknowledge_events(slave_address)
+
+    async def drain_events(
+        self,
+        slave_addresses: Iterable[int],
+        on_error: Optional[Callable[[int, Exception], None]] = None,
+        max_batches: Optional[int] = None,
+        record_struct: struct.Struct = events.EVENT_RECORD_STRUCT,
+    ) -> AsyncIterator[events.EventRecord]:
+        """
+        `iter_events` for each slave in turn. If a slave fails `on_error` is called
+        with the slave address and the error and the next slave is read. Without
+        `on_error` the error is raised.
+        """
+        for slave_address in slave_addresses:
+            try:
+                async for record in self.iter_events(
+                    slave_address, max_batches, record_struct
+                ):
+                    yield record
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(slave_address, e)
+
+    async def make_request(
+        self,
+        request,
+        approx_data_size: Optional[int] = None,
+        frame: Optional[bytes] = None,
+    ):
+        """
+        Send a request and return the response. `frame` is the request already
+        encoded, to skip encoding it again, like `templates.PollTemplate` does.
+        """
+        return await self._run(self._request(request, approx_data_size, frame))
+
+    async def receive(self, size: int) -> None:
+        """
+        Read up to `size` bytes from the transport into the connection.
+        """
+        await self._drive(self._receive(size))
+
+    async def next_event(self):
+        return await self._drive(self._next_event())
+
+    async def _run(self, operation: Operation[T]) -> T:
+        """
+        Run an operation holding `_lock`, so it has the bus to itself.
+        """
+        async with self._lock:
+            return await self._drive(operation)
+
+    async def _drive(self, operation: Operation[T]) -> T:
+        received: Optional[bytes] = None
+        error: Optional[BaseException] = None
+        while True:
+            try:
+                if error is None:
+                    action = operation.send(received)
+                else:
+                    action = operation.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            received = error = None
+            try:
+                if isinstance(action, int):
+                    received = await self.transport.recv(action)
+                else:
+                    await self.transport.send(action)
+            except BaseException as e:
+                # Includes cancellation, the operation resets the connection.
+                error = e
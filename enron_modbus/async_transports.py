@@ -0,0 +1,179 @@
+import asyncio
+from typing import *
+import attr
+import structlog
+
+from enron_modbus import messages
+from enron_modbus.transports import (
+    DISCARDING_SENDS_AFTER_TIMEOUT,
+    NotConnectedError,
+    TransportException,
+    TransportTimeoutError,
+)
+
+LOG = structlog.get_logger()
+
+# Seconds to wait for late data to drop before the first request after a timeout.
+DISCARD_TIMEOUT = 0.01
+
+
+class AsyncEnronModbusTransport(Protocol):
+    async def connect(self) -> None:
+        ...
+
+    async def disconnect(self) -> None:
+        ...
+
+    async def send(self, data: bytes):
+        ...
+
+    async def recv(self, size: int):
+        ...
+
+    def set_timeout(self, timeout: float) -> None:
+        """Seconds `recv` waits for data. Used by `retry.RetryPolicy`."""
+        ...
+
+
+async def read_request_frame(reader: asyncio.StreamReader) -> bytes:
+    """
+    Read one RTU request frame from a stream, for the serving side.
+    """
+    frame = await reader.readexactly(2)
+    length = messages.get_request_frame_length(frame)
+    while length is None:
+        frame += await reader.readexactly(1)
+        length = messages.get_request_frame_length(frame)
+    return frame + await reader.readexactly(length - len(frame))
+
+
+class AsyncStreamMixin:
+    """
+    Send and receive over an asyncio stream reader/writer pair. The transport
+    using it needs to set `reader`, `writer`, `timeout` and `hot_path_logging`.
+    """
+
+    reader: Optional[asyncio.StreamReader]
+    writer: Optional[asyncio.StreamWriter]
+    timeout: float
+    hot_path_logging: bool
+    # A response arriving after a timeout must not be read as the next response.
+    _discarding_sends: int = 0
+
+    def set_timeout(self, timeout: float) -> None:
+        self.timeout = timeout
+
+    async def send(self, data: bytes) -> None:
+        if not self.writer:
+            raise NotConnectedError(f"{self} is not connected")
+        if self._discarding_sends:
+            await self._discard_input()
+            self._discarding_sends -= 1
+        if self.hot_path_logging:
+            LOG.debug("Sending data", data=data)
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def recv(self, size: int) -> bytes:
+        if not self.reader:
+            raise NotConnectedError(f"{self} is not connected")
+        if self.hot_path_logging:
+            LOG.debug("Reading data", size=size)
+        try:
+            result = await asyncio.wait_for(self.reader.read(size), self.timeout)
+        except asyncio.TimeoutError:
+            self._discarding_sends = DISCARDING_SENDS_AFTER_TIMEOUT
+            raise TransportTimeoutError(f"No data received within {self.timeout}s")
+        except asyncio.CancelledError:
+            self._discarding_sends = DISCARDING_SENDS_AFTER_TIMEOUT
+            raise
+        if not result:
+            raise TransportException(f"{self} was closed by the other end")
+        if self.hot_path_logging:
+            LOG.debug("Received data", data=result)
+        return result
+
+    async def _discard_input(self) -> None:
+        """
+        Drop what arrived late for an earlier request.
+        """
+        reader = cast(asyncio.StreamReader, self.reader)
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(4096), DISCARD_TIMEOUT)
+            except asyncio.TimeoutError:
+                return
+            if not data:
+                return
+            LOG.debug("Dropping late data", data=data)
+
+    async def close_stream(self) -> None:
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = None
+        self.writer = None
+        self._discarding_sends = 0
+
+
+@attr.s(auto_attribs=True)
+class AsyncSerialTransport(AsyncStreamMixin):
+    """
+    Serial transport for asyncio. Needs pyserial-asyncio to be installed.
+
+    Set `hot_path_logging` to False to skip the debug logs of every read and write.
+    """
+
+    port: str
+    baudrate: int
+    timeout: float = attr.ib(default=5)
+    extra_settings: Dict = attr.ib(factory=dict)
+    hot_path_logging: bool = attr.ib(default=True)
+    reader: Optional[asyncio.StreamReader] = attr.ib(init=False, default=None)
+    writer: Optional[asyncio.StreamWriter] = attr.ib(init=False, default=None)
+
+    async def connect(self) -> None:
+        import serial_asyncio  # type: ignore
+
+        LOG.debug("Opening serial port", serial_port=self.port, baudrate=self.baudrate)
+        self.reader, self.writer = await serial_asyncio.open_serial_connection(
+            url=self.port, baudrate=self.baudrate, **self.extra_settings
+        )
+
+    async def disconnect(self) -> None:
+        LOG.debug("Closing serial port", serial_port=self.port)
+        await self.close_stream()
+
+
+@attr.s(auto_attribs=True)
+class AsyncTcpTransport(AsyncStreamMixin):
+    """
+    RTU frames over a TCP socket, for example to a serial-to-Ethernet gateway.
+
+    Set `hot_path_logging` to False to skip the debug logs of every read and write.
+    """
+
+    host: str
+    port: int
+    timeout: float = attr.ib(default=5)
+    hot_path_logging: bool = attr.ib(default=True)
+    reader: Optional[asyncio.StreamReader] = attr.ib(init=False, default=None)
+    writer: Optional[asyncio.StreamWriter] = attr.ib(init=False, default=None)
+
+    async def connect(self) -> None:
+        LOG.debug("Opening TCP connection", host=self.host, port=self.port)
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+        except asyncio.TimeoutError:
+            raise TransportTimeoutError(
+                f"Could not connect to {self.host}:{self.port} within {self.timeout}s"
+            )
+
+    async def disconnect(self) -> None:
+        LOG.debug("Closing TCP connection", host=self.host, port=self.port)
+        await self.close_stream()
@@ -0,0 +1,203 @@
+import collections
+import threading
+import time
+from concurrent.futures import Future
+import attr
+from typing import *
+from enron_modbus import utils
+
+# (kind, slave address, start register, amount)
+CacheKey = Tuple[str, int, int, int]
+
+
+@attr.s(auto_attribs=True)
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+
+
+@attr.s(auto_attribs=True)
+class CachedEnronModbusClient:
+    """
+    Read-through cache around an `EnronModbusClient` that can be shared between
+    threads.
+
+    Reads are cached per (slave, start register, amount) for the shortest TTL of the
+    registers read. TTLs are looked up per register in `register_ttls`, then per
+    data table (1000, 3000, 5000, 7000) in `table_ttls`, falling back to
+    `default_ttl`. A TTL of 0 disables caching for that register.
+
+    Identical reads made while one is already on the bus wait for its result
+    instead of making another request. Writes drop the cached reads covering the
+    written register. At most `max_entries` reads are kept, the least recently used
+    are evicted first.
+    """
+
+    client: Any
+    default_ttl: float = attr.ib(default=1.0)
+    table_ttls: Dict[int, float] = attr.ib(factory=dict)
+    register_ttls: Dict[int, float] = attr.ib(factory=dict)
+    max_entries: int = attr.ib(default=1024)
+    stats: CacheStats = attr.ib(factory=CacheStats)
+    _entries: "collections.OrderedDict[CacheKey, Tuple[float, Dict]]" = attr.ib(
+        init=False, factory=collections.OrderedDict, repr=False
+    )
+    _in_flight: Dict[CacheKey, Future] = attr.ib(init=False, factory=dict, repr=False)
+    # Bumped on every write to a slave so reads started before the write are not
+    # stored after it.
+    _generations: Dict[int, int] = attr.ib(init=False, factory=dict, repr=False)
+    _lock: threading.Lock = attr.ib(init=False, factory=threading.Lock, repr=False)
+    # The client can only have one request on the bus at a time.
+    _client_lock: threading.Lock = attr.ib(
+        init=False, factory=threading.Lock, repr=False
+    )
+
+    def connect(self):
+        self.client.connect()
+
+    def disconnect(self):
+        self.client.disconnect()
+
+    def read_booleans(
+        self, slave_address: int, start_register: int, amount: int
+    ) -> Dict[int, bool]:
+        return self._read(
+            ("boolean", slave_address, start_register, amount),
+            lambda: self.client.read_booleans(slave_address, start_register, amount),
+        )
+
+    def read_boolean(self, slave_address: int, register: int) -> bool:
+        return self.read_booleans(slave_address, register, 1)[register]
+
+    def read_numerics(
+        self, slave_address: int, start_register: int, amount: int
+    ) -> Dict[int, Union[int, float]]:
+        return self._read(
+            ("numeric", slave_address, start_register, amount),
+            lambda: self.client.read_numerics(slave_address, start_register, amount),
+        )
+
+    def read_numeric(self, slave_address: int, register: int) -> Union[int, float]:
+        return self.read_numerics(slave_address, register, 1)[register]
+
+    def write_boolean(self, slave_address: int, register: int, value: bool) -> None:
+        self._write(
+            slave_address,
+            [register],
+            lambda: self.client.write_boolean(slave_address, register, value),
+        )
+
+    def write_numeric(
+        self, slave_address: int, register: int, value: Union[int, float]
+    ) -> None:
+        self._write(
+            slave_address,
+            [register],
+            lambda: self.client.write_numeric(slave_address, register, value),
+        )
+
+    def write_booleans(self, slave_address: int, values: Mapping[int, bool]) -> None:
+        self._write(
+            slave_address, values, lambda: self.client.write_booleans(slave_address, values)
+        )
+
+    def write_numerics(
+        self, slave_address: int, values: Mapping[int, Union[int, float]]
+    ) -> None:
+        self._write(
+            slave_address, values, lambda: self.client.write_numerics(slave_address, values)
+        )
+
+    def _write(
+        self, slave_address: int, registers: Iterable[int], write: Callable[[], None]
+    ) -> None:
+        """
+        Invalidate once the write is done, still holding the client, so no read
+        can cache a value from before the write. A failed write may still have
+        reached the slave so it invalidates too.
+        """
+        with self._client_lock:
+            try:
+                write()
+            finally:
+                for register in registers:
+                    self.invalidate(slave_address, register)
+
+    def invalidate(
+        self, slave_address: Optional[int] = None, register: Optional[int] = None
+    ) -> None:
+        """
+        Drop cached reads of a register, of a whole slave or, without arguments,
+        everything.
+        """
+        with self._lock:
+            if slave_address is None:
+                self._entries.clear()
+                for slave in self._generations:
+                    self._generations[slave] += 1
+                return
+            self._generations[slave_address] = self._generations.get(slave_address, 0) + 1
+            for key in list(self._entries):
+                _, slave, start_register, amount = key
+                if slave != slave_address:
+                    continue
+                if register is None or start_register <= register < start_register + amount:
+                    del self._entries[key]
+
+    def get_ttl(self, start_register: int, amount: int) -> float:
+        ttl = None
+        for register in range(start_register, start_register + amount):
+            register_ttl = self.register_ttls.get(register)
+            if register_ttl is None:
+                register_ttl = self.table_ttls.get(
+                    utils.get_register_table(register), self.default_ttl
+                )
+            ttl = register_ttl if ttl is None else min(ttl, register_ttl)
+        return ttl or 0.0
+
+    def _read(self, key: CacheKey, fetch: Callable[[], Dict]) -> Dict:
+        _, slave_address, start_register, amount = key
+        is_leader = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    return dict(value)
+                del self._entries[key]
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.stats.coalesced += 1
+            else:
+                self.stats.misses += 1
+                flight = Future()
+                self._in_flight[key] = flight
+                generation = self._generations.get(slave_address, 0)
+                is_leader = True
+
+        if not is_leader:
+            return dict(flight.result())
+
+        try:
+            with self._client_lock:
+                value = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            flight.set_exception(e)
+            raise
+
+        ttl = self.get_ttl(start_register, amount)
+        with self._lock:
+            del self._in_flight[key]
+            if ttl > 0 and generation == self._generations.get(slave_address, 0):
+                self._entries[key] = (time.monotonic() + ttl, value)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats.evictions += 1
+        flight.set_result(value)
+        return dict(value)
@@ -0,0 +1,320 @@
+import mmap
+import os
+import struct
+import time
+import attr
+import structlog
+from typing import *
+from enron_modbus import messages, state
+from enron_modbus.connection import EnronModbusConnection
+from enron_modbus.transports import (
+    EnronModbusTransport,
+    NotConnectedError,
+    TransportException,
+    TransportTimeoutError,
+)
+
+LOG = structlog.get_logger()
+
+# A capture file starts with FILE_MAGIC followed by records appended as they
+# happen: a RECORD_HEADER and the data. Sent records hold request frames, received
+# records the data of each transport read as it came in and timeout records mark
+# reads that got nothing.
+FILE_MAGIC = b"ENRNCAP1"
+# time.time(), record kind, data length.
+RECORD_HEADER = struct.Struct("<dBH")
+
+SENT = 1
+RECEIVED = 2
+TIMEOUT = 3
+
+
+class CaptureFormatError(Exception):
+    """The file is not a capture"""
+
+
+class ReplayMismatchError(TransportException):
+    """A request sent to a `ReplayTransport` is not the one in the capture"""
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class CaptureRecord:
+    timestamp: float
+    kind: int
+    data: bytes
+
+
+@attr.s(auto_attribs=True)
+class CaptureWriter:
+    """
+    Appends records to a binary file. Records go through the file's buffer, call
+    `flush` to make sure they are on disk.
+    """
+
+    file: BinaryIO
+    clock: Callable[[], float] = attr.ib(default=time.time, repr=False)
+
+    @classmethod
+    def open(cls, path: Union[str, os.PathLike]) -> "CaptureWriter":
+        """
+        Open a capture file for appending, starting it if it is new.
+        """
+        file = open(path, "ab")
+        if file.tell() == 0:
+            file.write(FILE_MAGIC)
+        return cls(file)
+
+    def write(self, kind: int, data: bytes) -> None:
+        self.file.write(RECORD_HEADER.pack(self.clock(), kind, len(data)) + data)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def iter_records(capture: Union[bytes, mmap.mmap]) -> Iterator[CaptureRecord]:
+    """
+    Records of a capture in the order they were written. A record cut short, from
+    a writer that didn't get to finish it, ends the capture.
+    """
+    if capture[: len(FILE_MAGIC)] != FILE_MAGIC:
+        raise CaptureFormatError("Capture doesn't start with the capture magic")
+    offset = len(FILE_MAGIC)
+    end = len(capture)
+    while offset + RECORD_HEADER.size <= end:
+        timestamp, kind, length = RECORD_HEADER.unpack_from(capture, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > end:
+            break
+        yield CaptureRecord(timestamp, kind, capture[offset : offset + length])
+        offset += length
+    if offset != end:
+        LOG.warning("Capture ends with an incomplete record", offset=offset)
+
+
+@attr.s(auto_attribs=True)
+class CapturingTransport:
+    """
+    Wraps a transport and records all data sent and received through it.
+    """
+
+    transport: EnronModbusTransport
+    writer: CaptureWriter
+
+    def connect(self) -> None:
+        self.transport.connect()
+
+    def disconnect(self) -> None:
+        self.transport.disconnect()
+        self.writer.flush()
+
+    def set_timeout(self, timeout: float) -> None:
+        self.transport.set_timeout(timeout)
+
+    def send(self, data: bytes) -> None:
+        self.writer.write(SENT, data)
+        self.transport.send(data)
+
+    def recv(self, size: int) -> bytes:
+        try:
+            data = self.transport.recv(size)
+        except TransportTimeoutError:
+            self.writer.write(TIMEOUT, b"")
+            raise
+        self.writer.write(RECEIVED, data)
+        return data
+
+
+@attr.s(auto_attribs=True)
+class AsyncCapturingTransport:
+    """
+    `CapturingTransport` for an `async_transports.AsyncEnronModbusTransport`.
+    """
+
+    transport: Any
+    writer: CaptureWriter
+
+    async def connect(self) -> None:
+        await self.transport.connect()
+
+    async def disconnect(self) -> None:
+        await self.transport.disconnect()
+        self.writer.flush()
+
+    def set_timeout(self, timeout: float) -> None:
+        self.transport.set_timeout(timeout)
+
+    async def send(self, data: bytes) -> None:
+        self.writer.write(SENT, data)
+        await self.transport.send(data)
+
+    async def recv(self, size: int) -> bytes:
+        try:
+            data = await self.transport.recv(size)
+        except TransportTimeoutError:
+            self.writer.write(TIMEOUT, b"")
+            raise
+        self.writer.write(RECEIVED, data)
+        return data
+
+
+@attr.s(auto_attribs=True)
+class ReplayTransport:
+    """
+    Plays a capture back to a client, without waiting. Each request the client
+    sends is answered with the data received after that request in the capture
+    and reads that timed out time out again. The capture is memory mapped, not
+    read into memory.
+
+    The client has to make the requests of the capture in the same order. With
+    `strict` a different request raises `ReplayMismatchError`, otherwise the
+    request is only checked to be the next one sent.
+    """
+
+    path: Union[str, os.PathLike]
+    strict: bool = attr.ib(default=True)
+    _file: Optional[BinaryIO] = attr.ib(init=False, default=None, repr=False)
+    _mapped: Optional[mmap.mmap] = attr.ib(init=False, default=None, repr=False)
+    _records: Optional[Iterator[CaptureRecord]] = attr.ib(
+        init=False, default=None, repr=False
+    )
+    _next_record: Optional[CaptureRecord] = attr.ib(init=False, default=None, repr=False)
+    # Received data of the current record not read yet.
+    _pending: bytes = attr.ib(init=False, default=b"", repr=False)
+
+    def connect(self) -> None:
+        self._file = open(self.path, "rb")
+        try:
+            self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise CaptureFormatError(f"{self.path} is empty")
+        self._records = iter_records(self._mapped)
+        self._advance()
+
+    def disconnect(self) -> None:
+        self._records = None
+        self._next_record = None
+        self._pending = b""
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def set_timeout(self, timeout: float) -> None:
+        pass
+
+    def _advance(self) -> None:
+        assert self._records is not None
+        self._next_record = next(self._records, None)
+
+    def send(self, data: bytes) -> None:
+        if self._records is None:
+            raise NotConnectedError(f"{self} is not connected")
+        # Whatever the previous request didn't read belongs to that request.
+        self._pending = b""
+        while self._next_record is not None and self._next_record.kind != SENT:
+            self._advance()
+        if self._next_record is None:
+            raise TransportException("The capture has no more requests")
+        if self.strict and self._next_record.data != bytes(data):
+            raise ReplayMismatchError(
+                f"Request {bytes(data)!r} doesn't match {self._next_record.data!r} "
+                f"in the capture"
+            )
+        self._advance()
+
+    def recv(self, size: int) -> bytes:
+        if self._records is None:
+            raise NotConnectedError(f"{self} is not connected")
+        if not self._pending:
+            record = self._next_record
+            if record is None or record.kind == SENT:
+                raise TransportTimeoutError("No more data in the capture for this request")
+            self._advance()
+            if record.kind == TIMEOUT:
+                raise TransportTimeoutError("The read timed out in the capture")
+            self._pending = record.data
+        data = self._pending[:size]
+        self._pending = self._pending[size:]
+        return data
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ReplayedExchange:
+    """
+    A request from a capture and what the connection made of the data received
+    after it: the response, or the error parsing it raised. Requests that got no
+    complete response have a `TransportTimeoutError`.
+    """
+
+    timestamp: float
+    request: Any
+    response: Any = None
+    error: Optional[Exception] = None
+
+
+def replay_frames(
+    path: Union[str, os.PathLike],
+    connection: Optional[EnronModbusConnection] = None,
+) -> Iterator[ReplayedExchange]:
+    """
+    Feed the exchanges of a capture file through an `EnronModbusConnection` as
+    fast as it parses them, for post-mortem debugging or to benchmark decoding
+    with real traffic.
+    """
+    connection = connection or EnronModbusConnection(hot_path_logging=False)
+    with open(path, "rb") as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise CaptureFormatError(f"{path} is empty")
+        with mapped:
+            yield from _replay_records(iter_records(mapped), connection)
+
+
+def _replay_records(
+    records: Iterable[CaptureRecord], connection: EnronModbusConnection
+) -> Iterator[ReplayedExchange]:
+    exchange: Optional[ReplayedExchange] = None
+    for record in records:
+        if record.kind == SENT:
+            if exchange is not None:
+                yield _unanswered(exchange)
+            connection.reset()
+            try:
+                request = messages.StandardRequestFactory.make_request_from_bytes(
+                    record.data
+                )
+            except messages.EnronModbusParsingException as e:
+                yield ReplayedExchange(record.timestamp, None, error=e)
+                exchange = None
+                continue
+            connection.send_encoded(request, record.data)
+            exchange = ReplayedExchange(record.timestamp, request)
+        elif record.kind == RECEIVED and exchange is not None:
+            connection.receive_data(record.data)
+            try:
+                event = connection.next_event()
+            except messages.EnronModbusParsingException as e:
+                yield attr.evolve(exchange, error=e)
+                exchange = None
+                continue
+            if event is not state.NEED_DATA:
+                yield attr.evolve(exchange, response=event)
+                exchange = None
+        elif record.kind == TIMEOUT and exchange is not None:
+            yield _unanswered(exchange)
+            exchange = None
+    if exchange is not None:
+        yield _unanswered(exchange)
+
+
+def _unanswered(exchange: ReplayedExchange) -> ReplayedExchange:
+    return attr.evolve(
+        exchange, error=TransportTimeoutError("No complete response in the capture")
+    )
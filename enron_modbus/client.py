@@ -1,7 +1,11 @@
+import struct
+import time
 import attr
 from typing import *
 import structlog
-from enron_modbus import messages, state, utils
+from enron_modbus import events, history, messages, state, utils
+from enron_modbus.metrics import TransactionObserver
+from enron_modbus.retry import RetryPolicy
 from enron_modbus.transports import EnronModbusTransport
 from enron_modbus.connection import EnronModbusConnection
 
@@ -10,12 +14,254 @@ LOG = structlog.get_logger()
 
 MINIMAL_REQUEST_SIZE = 5
 
+T = TypeVar("T")
+
+# A client operation. It yields the bytes to send, or the number of bytes to
+# receive and gets the received bytes sent back, and returns its result.
+Operation = Generator[Union[bytes, int], Optional[bytes], T]
+
+
+class ClientOperationsMixin:
+    """
+    Request building, response decoding and retries shared by `EnronModbusClient`
+    and `async_client.AsyncEnronModbusClient`. The operations only yield the I/O
+    they need, the client runs them against its transport with `_run`.
+
+    The client using it needs to set `connection`, `history_record_sizes`,
+    `metrics`, `hot_path_logging`, `multiple_write_unsupported` and
+    `retry_policy`, and have a `transport` with a `set_timeout` method.
+    """
+
+    transport: Any
+    connection: EnronModbusConnection
+    history_record_sizes: Dict[Tuple[int, int], int]
+    metrics: Optional[TransactionObserver]
+    hot_path_logging: bool
+    multiple_write_unsupported: Set[Tuple[int, int]]
+    retry_policy: Optional[RetryPolicy]
+    _recv_calls: int = 0
+    _bytes_received: int = 0
+
+    def _read_booleans(
+        self, slave_address: int, start_register: int, amount: int, as_bitset: bool
+    ) -> Operation[Union[Dict[int, bool], utils.BooleanBits]]:
+        req = messages.BooleanReadRequest(slave_address, start_register, amount)
+        response = yield from self._request(req)
+        if as_bitset:
+            return utils.boolean_bits_from_response(
+                start_register, amount, response.raw_data
+            )
+        return utils.map_boolean_response(start_register, amount, response.raw_data)
+
+    def _read_numerics(
+        self, slave_address: int, start_register: int, amount: int, as_array: bool
+    ) -> Operation[Union[Dict[int, Union[int, float]], utils.NumericArray]]:
+        # TODO: should we limit the read to registers that are numeric?
+        req = messages.NumericReadRequest(slave_address, start_register, amount)
+        response = yield from self._request(req)
+        if as_array:
+            return utils.numeric_array_from_response(
+                start_register, amount, response.raw_data
+            )
+        return utils.map_numeric_response(start_register, amount, response.raw_data)
+
+    def _write_multiple(
+        self, slave_address: int, values: Mapping, request_class, single_request_class
+    ) -> Operation[None]:
+        """
+        Slaves answering a multiple write with an illegal function exception get
+        single writes instead, from then on.
+        """
+        key = (slave_address, request_class.FUNCTION_CODE)
+        for start_register, run in utils.iter_register_runs(values):
+            step = messages.get_max_multiple_write_amount(start_register)
+            for offset in range(0, len(run), step):
+                chunk = run[offset : offset + step]
+                register = start_register + offset
+                if len(chunk) > 1 and key not in self.multiple_write_unsupported:
+                    try:
+                        yield from self._request(
+                            request_class(slave_address, register, chunk)
+                        )
+                        continue
+                    except messages.SlaveExceptionError as e:
+                        if e.exception_code != messages.ILLEGAL_FUNCTION:
+                            raise
+                        LOG.info(
+                            "Slave doesn't support multiple writes, writing one by one",
+                            slave_address=slave_address,
+                            function_code=request_class.FUNCTION_CODE,
+                        )
+                        self.multiple_write_unsupported.add(key)
+                for number, value in enumerate(chunk):
+                    yield from self._request(
+                        single_request_class(slave_address, register + number, value)
+                    )
+
+    def _read_history(
+        self, slave_address: int, table: int, index: int
+    ) -> Operation[bytes]:
+        req = messages.HistoryRequest(slave_address, table, index)
+        record_size = self.history_record_sizes.get((slave_address, table))
+        response = yield from self._request(req, req.response_length(record_size))
+        self.history_record_sizes[(slave_address, table)] = len(response.raw_data)
+        return response.raw_data
+
+    def _make_readout_error(
+        self, table: int, index: int, remaining: int, error: Exception
+    ) -> history.HistoryReadoutError:
+        readout_error = history.HistoryReadoutError(
+            f"Reading record {index} of table {table} failed: {error!r}",
+            table,
+            index,
+            remaining,
+            error,
+        )
+        readout_error.__cause__ = error
+        return readout_error
+
+    def _read_events(
+        self, slave_address: int, record_struct: struct.Struct
+    ) -> Operation[List[events.EventRecord]]:
+        response = yield from self._request(messages.EventRequest(slave_address))
+        return events.decode_events(slave_address, response.raw_data, record_struct)
+
+    def _acknowledge_events(self, slave_address: int) -> Operation[None]:
+        req = messages.BooleanWriteRequest(slave_address, events.EVENT_REGISTER, True)
+        yield from self._request(req)
+
+    def _request(
+        self,
+        request,
+        approx_data_size: Optional[int] = None,
+        frame: Optional[bytes] = None,
+    ) -> Operation[Any]:
+        if approx_data_size is None:
+            approx_data_size = request.response_length()
+        policy = self.retry_policy
+        if policy is None:
+            return (yield from self._transact(request, approx_data_size, frame))
+
+        slave_address = request.slave_address
+        attempts = policy.get_attempts(slave_address)
+        request_size = len(frame or request.to_bytes())
+        attempt = 0
+        while True:
+            self.transport.set_timeout(
+                policy.get_timeout(slave_address, request_size, approx_data_size, attempt)
+            )
+            started_at = time.perf_counter()
+            try:
+                response = yield from self._transact(request, approx_data_size, frame)
+            except Exception as e:
+                attempt += 1
+                if attempt < attempts and policy.should_retry(e):
+                    if self.metrics:
+                        self.metrics.record_retry(slave_address, request.FUNCTION_CODE)
+                    LOG.info("Retrying request", request=request, error=e, attempt=attempt)
+                    continue
+                # Other errors, like a closed connection, are not the slave's fault.
+                if policy.should_retry(e):
+                    policy.record_failure(slave_address)
+                raise
+            policy.record_success(
+                slave_address,
+                time.perf_counter() - started_at,
+                request_size,
+                self._bytes_received,
+                attempt,
+            )
+            return response
+
+    def _transact(
+        self, request, approx_data_size: int, frame: Optional[bytes] = None
+    ) -> Operation[Any]:
+        if self.hot_path_logging:
+            LOG.info("Sending read request", request=request)
+        started_at = time.perf_counter()
+        self._recv_calls = 0
+        self._bytes_received = 0
+        try:
+            if frame is None:
+                to_send = self.connection.send(request)
+            else:
+                to_send = self.connection.send_encoded(request, frame)
+            yield to_send
+            yield from self._receive(approx_data_size)
+            response = yield from self._next_event()
+            if isinstance(response, messages.ExceptionResponse):
+                raise response.to_error()
+        except BaseException as e:
+            # Includes cancellation. The response might still arrive later so
+            # start the next request from a clean connection.
+            self.connection.reset()
+            if self.metrics and isinstance(e, Exception):
+                self.metrics.record_error(
+                    request.slave_address, request.FUNCTION_CODE, e
+                )
+            raise
+        if self.metrics:
+            self.metrics.record_transaction(
+                request.slave_address,
+                request.FUNCTION_CODE,
+                time.perf_counter() - started_at,
+                len(to_send),
+                self._bytes_received,
+                self._recv_calls,
+            )
+        if self.hot_path_logging:
+            LOG.info("Received read response", response=response)
+        return response
+
+    def _receive(self, size: int) -> Operation[None]:
+        data = yield size
+        assert data is not None
+        self._recv_calls += 1
+        self._bytes_received += len(data)
+        self.connection.receive_data(data)
+
+    def _next_event(self) -> Operation[Any]:
+        while True:
+            # If we already have a complete event buffered internally, just
+            # return that. Otherwise, read some data, add it to the internal
+            # buffer, and then try again.
+            event = self.connection.next_event()
+            if event is state.NEED_DATA:
+                needed_data = self.connection.bytes_needed()
+                if self.hot_path_logging:
+                    LOG.info(
+                        "More data needed",
+                        remaining_data=needed_data,
+                    )
+                yield from self._receive(needed_data)
+                continue
+            return event
+
 
 @attr.s(auto_attribs=True)
-class EnronModbusClient:
+class EnronModbusClient(ClientOperationsMixin):
+    """
+    Pass a `metrics.ClientMetrics`, or anything implementing
+    `metrics.TransactionObserver`, as `metrics` to record every transaction.
+
+    Set `hot_path_logging` to False to skip the per request log calls. The
+    connection and transports have the same setting for their debug logs.
+
+    With a `retry_policy` each request gets a timeout adapted to the slave, failed
+    requests are retried and slaves that stop answering are skipped for a while.
+    """
 
     transport: EnronModbusTransport
     connection: EnronModbusConnection = attr.ib(factory=EnronModbusConnection)
+    # Record size in bytes per (slave address, history table).
+    history_record_sizes: Dict[Tuple[int, int], int] = attr.ib(factory=dict)
+    metrics: Optional[TransactionObserver] = attr.ib(default=None)
+    hot_path_logging: bool = attr.ib(default=True)
+    # (slave address, function code) of multiple writes the slave doesn't support.
+    multiple_write_unsupported: Set[Tuple[int, int]] = attr.ib(factory=set)
+    retry_policy: Optional[RetryPolicy] = attr.ib(default=None)
+    _recv_calls: int = attr.ib(init=False, default=0, repr=False)
+    _bytes_received: int = attr.ib(init=False, default=0, repr=False)
 
     def connect(self):
         LOG.info("Client connecting", client=self)
@@ -26,16 +272,20 @@ class EnronModbusClient:
         self.transport.disconnect()
 
     def read_booleans(
-        self, slave_address: int, start_register: int, amount: int
-    ) -> Dict[int, bool]:
+        self,
+        slave_address: int,
+        start_register: int,
+        amount: int,
+        as_bitset: bool = False,
+    ) -> Union[Dict[int, bool], utils.BooleanBits]:
         """
         Get all booleans and return them as a dict with the register as key.
+        With `as_bitset` the values are returned as a `utils.BooleanBits` instead,
+        which is cheaper for large reads and compares quickly to an earlier read.
         """
-        req = messages.BooleanReadRequest(slave_address, start_register, amount)
-        read_size = MINIMAL_REQUEST_SIZE + utils.number_of_bytes_containing_booleans(amount)
-        response = self.make_request(req, read_size)
-        data = utils.map_boolean_response(start_register, amount, response.raw_data)
-        return data
+        return self._run(
+            self._read_booleans(slave_address, start_register, amount, as_bitset)
+        )
 
     def read_boolean(self, slave_address: int, register: int) -> bool:
         """
@@ -49,24 +299,23 @@ class EnronModbusClient:
         0xff00 = True, 0x0000 = False
         """
         req = messages.BooleanWriteRequest(slave_address, register, value)
-        read_size = 8
-        self.make_request(req, read_size)
+        self.make_request(req)
 
     def read_numerics(
-        self, slave_address: int, start_register: int, amount: int
-    ) -> Dict[int, Union[int, float]]:
+        self,
+        slave_address: int,
+        start_register: int,
+        amount: int,
+        as_array: bool = False,
+    ) -> Union[Dict[int, Union[int, float]], utils.NumericArray]:
         """
         Get all numerics and return them as a dict with the register as key.
+        With `as_array` the values are returned as a `utils.NumericArray` instead,
+        which is cheaper for large reads.
         """
-        # TODO: should we limit the read to registers that are numeric?
-        req = messages.NumericReadRequest(slave_address, start_register, amount)
-        read_size = (
-            MINIMAL_REQUEST_SIZE
-            + amount * utils.get_numeric_value_size(start_register)
+        return self._run(
+            self._read_numerics(slave_address, start_register, amount, as_array)
         )
-        response = self.make_request(req, read_size)
-        data = utils.map_numeric_response(start_register, amount, response.raw_data)
-        return data
 
     def read_numeric(self, slave_address: int, register: int) -> Union[int, float]:
         """
@@ -79,45 +328,171 @@ class EnronModbusClient:
         Write a numeric value
         """
         req = messages.NumericWriteRequest(slave_address, register, value)
-        read_size = 6 + utils.get_numeric_value_size(register)
-        self.make_request(req, read_size)
+        self.make_request(req)
+
+    def write_numerics(
+        self, slave_address: int, values: Mapping[int, Union[int, float]]
+    ) -> None:
+        """
+        Write numerics given as a dict with the register as key. Consecutive
+        registers are written with one preset multiple registers (0x10) request.
+        """
+        self._run(
+            self._write_multiple(
+                slave_address,
+                values,
+                messages.NumericMultipleWriteRequest,
+                messages.NumericWriteRequest,
+            )
+        )
+
+    def write_booleans(self, slave_address: int, values: Mapping[int, bool]) -> None:
+        """
+        Write booleans given as a dict with the register as key. Consecutive
+        registers are written with one force multiple (0x0F) request.
+        """
+        self._run(
+            self._write_multiple(
+                slave_address,
+                values,
+                messages.BooleanMultipleWriteRequest,
+                messages.BooleanWriteRequest,
+            )
+        )
 
     def read_history(self, slave_address: int, table: int, index: int) -> bytes:
         """
         Read a history entry
         Uses function code 0x03
+
+        The record size is learned from the first response so later reads of the
+        table can ask the transport for the exact response length. It can also be
+        set up front in `history_record_sizes` from the device's modbus map.
         """
-        req = messages.HistoryRequest(slave_address, table, index)
-        response = self.make_request(req, approx_data_size=MINIMAL_REQUEST_SIZE)
-        return response.raw_data
+        return self._run(self._read_history(slave_address, table, index))
 
-    def make_request(self, request, approx_data_size: int = MINIMAL_REQUEST_SIZE):
-        LOG.info("Sending read request", request=request)
-        to_send = self.connection.send(request)
-        self.transport.send(to_send)
-        self.connection.receive_data(self.transport.recv(approx_data_size))
-        response = self.next_event()
-        LOG.info("Received read response", response=response)
-        return response
+    def iter_history(
+        self,
+        slave_address: int,
+        table: int,
+        start_index: int,
+        count: int,
+        table_size: int,
+    ) -> Iterator[history.HistoryRecord]:
+        """
+        Read `count` history records from `start_index`, rolling over at
+        `table_size`, and yield each record as it arrives.
+
+        On failure a `history.HistoryReadoutError` is raised telling where to resume.
+        """
+        remaining = count
+        for index in history.get_history_indices(start_index, count, table_size):
+            try:
+                raw_data = self.read_history(slave_address, table, index)
+            except Exception as e:
+                raise self._make_readout_error(table, index, remaining, e)
+            remaining -= 1
+            yield history.HistoryRecord(table, index, raw_data)
+
+    def read_events(
+        self,
+        slave_address: int,
+        record_struct: struct.Struct = events.EVENT_RECORD_STRUCT,
+    ) -> List[events.EventRecord]:
+        """
+        Read the next batch of events and alarms. The same batch is read again
+        until it is acknowledged with `acknowledge_events`.
+        """
+        return self._run(self._read_events(slave_address, record_struct))
+
+    def acknowledge_events(self, slave_address: int) -> None:
+        """
+        Acknowledge the batch last read so the next read gets the following events.
+        """
+        self._run(self._acknowledge_events(slave_address))
+
+    def iter_events(
+        self,
+        slave_address: int,
+        max_batches: Optional[int] = None,
+        record_struct: struct.Struct = events.EVENT_RECORD_STRUCT,
+    ) -> Iterator[events.EventRecord]:
+        """
+        Read and acknowledge batches until the log is empty, or `max_batches` were
+        read, and yield each record. A batch is acknowledged once all its records
+        were consumed so records not handled because of an error are read again.
+        """
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = self.read_events(slave_address, record_struct)
+            if not batch:
+                return
+            batches += 1
+            for record in batch:
+                yield record
+            self.acknowledge_events(slave_address)
+
+    def drain_events(
+        self,
+        slave_addresses: Iterable[int],
+        on_error: Optional[Callable[[int, Exception], None]] = None,
+        max_batches: Optional[int] = None,
+        record_struct: struct.Struct = events.EVENT_RECORD_STRUCT,
+    ) -> Iterator[events.EventRecord]:
+        """
+        `iter_events` for each slave in turn. If a slave fails `on_error` is called
+        with the slave address and the error and the next slave is read. Without
+        `on_error` the error is raised.
+        """
+        for slave_address in slave_addresses:
+            try:
+                yield from self.iter_events(slave_address, max_batches, record_struct)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(slave_address, e)
+
+    def make_request(
+        self,
+        request,
+        approx_data_size: Optional[int] = None,
+        frame: Optional[bytes] = None,
+    ):
+        """
+        Send a request and return the response. `frame` is the request already
+        encoded, to skip encoding it again, like `templates.PollTemplate` does.
+        """
+        return self._run(self._request(request, approx_data_size, frame))
+
+    def receive(self, size: int) -> None:
+        """
+        Read up to `size` bytes from the transport into the connection.
+        """
+        self._run(self._receive(size))
 
     def next_event(self):
         """"""
+        return self._run(self._next_event())
 
+    def _run(self, operation: Operation[T]) -> T:
+        """
+        Run an operation, sending and receiving on the transport.
+        """
+        received: Optional[bytes] = None
+        error: Optional[BaseException] = None
         while True:
-            # If we already have a complete event buffered internally, just
-            # return that. Otherwise, read some data, add it to the internal
-            # buffer, and then try again.
-            event = self.connection.next_event()
-            if event is state.NEED_DATA:
-                data_in_buffer = len(self.connection.buffer)
-                message_data_length = self.connection.buffer[2]
-                needed_data = (
-                    message_data_length + MINIMAL_REQUEST_SIZE - data_in_buffer
-                )
-                LOG.info(
-                    "More data needed",
-                    remaining_data=needed_data,
-                )
-                self.connection.receive_data(self.transport.recv(needed_data))
-                continue
-            return event
+            try:
+                if error is None:
+                    action = operation.send(received)
+                else:
+                    action = operation.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            received = error = None
+            try:
+                if isinstance(action, int):
+                    received = self.transport.recv(action)
+                else:
+                    self.transport.send(action)
+            except BaseException as e:
+                error = e
@@ -1,6 +1,7 @@
 import attr
 import structlog
 from enron_modbus import state, messages
+from enron_modbus.crc import Crc16
 from typing import *
 
 
@@ -12,41 +13,175 @@ class Encodeable(Protocol):
         ...
 
 
+# Largest response: address, function code, byte count, 255 data bytes and crc.
+RECEIVE_BUFFER_SIZE = 3 + 255 + 2
+
+
 @attr.s(auto_attribs=True)
 class EnronModbusConnection:
-    buffer: bytearray = attr.ib(factory=bytearray)
+    """
+    Sans-IO Enron Modbus connection.
+
+    Received data is copied into a preallocated buffer. The expected frame length
+    is known from the first bytes of the response, so the frame is only parsed
+    once it is complete, from a memoryview of the buffer.
+
+    A response from another slave or with another function code than the request
+    raises `messages.UnexpectedResponseError`. The connection keeps waiting for
+    the response to the request.
+    """
+
+    buffer: bytearray = attr.ib(factory=lambda: bytearray(RECEIVE_BUFFER_SIZE))
     connection_state: state.EnronModbusState = attr.ib(factory=state.EnronModbusState)
+    # Bytes of `buffer` that hold received data.
+    buffered: int = attr.ib(default=0)
+    # Running crc over the frame, fed as data arrives so the crc check at the end
+    # of the frame doesn't need to scan it again.
+    crc: Crc16 = attr.ib(factory=Crc16, repr=False)
+    hot_path_logging: bool = attr.ib(default=True)
+    _crc_position: int = attr.ib(init=False, default=0, repr=False)
+    _frame_length: Optional[int] = attr.ib(init=False, default=None, repr=False)
+    # Slave address and function code of the request waiting for its response.
+    _expected: Optional[Tuple[int, int]] = attr.ib(init=False, default=None, repr=False)
 
     def send(self, msg: Encodeable):
         self.connection_state.process_message(msg)
+        self._expected = _get_address_and_function_code(msg)
         return msg.to_bytes()
 
+    def send_encoded(self, msg: Any, frame: bytes) -> bytes:
+        """
+        Like `send` for a message that was encoded before, `frame` being its bytes.
+        """
+        self.connection_state.process_message(msg)
+        self._expected = _get_address_and_function_code(msg)
+        return frame
+
     def receive_data(self, data: bytes):
         """
         Receive data in the buffer. After adding data to the buffer one should call
          `next_event`
         """
         if data:
-            self.buffer += data
-            LOG.debug("Received data in connection data buffer", data=data)
+            end = self.buffered + len(data)
+            if end > len(self.buffer):
+                self.buffer.extend(bytes(end - len(self.buffer)))
+            self.buffer[self.buffered : end] = data
+            self.buffered = end
+            self._update_crc()
+            if self.hot_path_logging:
+                LOG.debug("Received data in connection data buffer", data=data)
+
+    def get_receive_buffer(self) -> memoryview:
+        """
+        Writable view of the part of the buffer the bytes still needed go to, so a
+        transport can read straight into it, with `readinto` or `recv_into`, and
+        then call `commit_received`. Release the view before receiving more data.
+        """
+        end = self.buffered + self.bytes_needed()
+        if end > len(self.buffer):
+            self.buffer.extend(bytes(end - len(self.buffer)))
+        return memoryview(self.buffer)[self.buffered : end]
+
+    def commit_received(self, size: int) -> None:
+        """
+        Take in `size` bytes written to the view from `get_receive_buffer`.
+        """
+        if size:
+            self.buffered += size
+            self._update_crc()
+            if self.hot_path_logging:
+                LOG.debug(
+                    "Received data in connection data buffer",
+                    data=bytes(self.buffer[self.buffered - size : self.buffered]),
+                )
+
+    def bytes_needed(self) -> int:
+        """
+        Bytes missing to complete the response being received. Before the header is
+        in, it is the bytes needed to get to the shortest possible response.
+        """
+        frame_length = self._get_frame_length()
+        if frame_length is None:
+            return max(messages.MINIMAL_RESPONSE_SIZE - self.buffered, 1)
+        return max(frame_length - self.buffered, 0)
+
+    def reset(self):
+        """
+        Drop any buffered data and go back to IDLE. Used when a request is abandoned,
+        for example after a timeout, so the connection can be used for a new request.
+        """
+        self._clear_buffer()
+        self.connection_state = state.EnronModbusState()
+        self._expected = None
 
     def next_event(self) -> Any:
+        if self.connection_state.current_state == state.AWAITING_RESPONSE:
+            parse = messages.StandardResponseFactory.make_response_from_bytes
+        elif self.connection_state.current_state == state.AWAITING_HISTORY_RESPONSE:
+            parse = messages.HistoryResponse.from_bytes
+        elif self.connection_state.current_state == state.AWAITING_EVENT_RESPONSE:
+            parse = messages.EventResponse.from_bytes
+        else:
+            raise RuntimeError("cant handle this data.")
+
         try:
-            if self.connection_state.current_state == state.AWAITING_RESPONSE:
-                msg = messages.StandardResponseFactory.make_response_from_bytes(
-                    self.buffer
+            frame_length = self._get_frame_length()
+            if frame_length is None or self.buffered < frame_length:
+                return state.NEED_DATA
+            if not self.crc.frame_is_valid:
+                raise messages.InvalidCrcError()
+            if self.buffer[1] & messages.EXCEPTION_FLAG:
+                parse = messages.ExceptionResponse.from_bytes
+            with memoryview(self.buffer) as view:
+                msg = parse(view[:frame_length], verify_crc=False)
+            received = _get_address_and_function_code(msg)
+            if self._expected is not None and received != self._expected:
+                raise messages.UnexpectedResponseError(
+                    f"Expected a response from slave {self._expected[0]} to function "
+                    f"code {self._expected[1]:#04x}, got {msg!r}"
                 )
-            elif self.connection_state.current_state == state.AWAITING_HISTORY_RESPONSE:
-                msg = messages.HistoryResponse.from_bytes(self.buffer)
-            else:
-                raise RuntimeError("cant handle this data.")
-            self.connection_state.process_message(msg)
-            # clear buffer
-            self.buffer = bytearray()
-            return msg
-        except messages.EnronModbusParsingException as e:
+        except messages.EnronModbusParsingException:
             LOG.debug(
-                "Unable to parse buffer as response message. Requesting more data",
-                buffer=self.buffer,
+                "Buffer is not a valid response message. Discarding it",
+                buffer=bytes(self.buffer[: self.buffered]),
             )
-            return state.NEED_DATA
+            self._clear_buffer()
+            raise
+        self.connection_state.process_message(msg)
+        self._expected = None
+        # Requests and responses alternate, anything after the frame is noise.
+        self._clear_buffer()
+        return msg
+
+    def _get_frame_length(self) -> Optional[int]:
+        if self._frame_length is None:
+            with memoryview(self.buffer) as view:
+                self._frame_length = messages.get_response_frame_length(
+                    view[: self.buffered]
+                )
+        return self._frame_length
+
+    def _update_crc(self) -> None:
+        try:
+            frame_length = self._get_frame_length()
+        except messages.EnronModbusParsingException:
+            # Reported by next_event
+            return
+        end = self.buffered if frame_length is None else min(frame_length, self.buffered)
+        if end > self._crc_position:
+            with memoryview(self.buffer) as view:
+                self.crc.update(view[self._crc_position : end])
+            self._crc_position = end
+
+    def _clear_buffer(self) -> None:
+        self.buffered = 0
+        self._crc_position = 0
+        self._frame_length = None
+        self.crc.reset()
+
+
+def _get_address_and_function_code(msg: Any) -> Tuple[int, int]:
+    if isinstance(msg, messages.ExceptionResponse):
+        return msg.slave_address, msg.function_code
+    return msg.slave_address, msg.FUNCTION_CODE
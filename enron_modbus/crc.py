@@ -1,3 +1,7 @@
+import array
+import sys
+
+
 def make_crc16_table():
 
     result = []
@@ -15,21 +19,90 @@ def make_crc16_table():
 crc16_table = make_crc16_table()
 
 
+def make_crc16_word_table(table):
+    """
+    Table to process two bytes at a time. The two bytes are xored into the crc as a
+    little endian word, after that the crc only depends on the result so one lookup
+    does the work of two byte steps.
+    """
+    first = [(word >> 8) ^ table[word & 0xff] for word in range(0x10000)]
+    return array.array("H", [(crc >> 8) ^ table[crc & 0xff] for crc in first])
+
+crc16_word_table = make_crc16_word_table(crc16_table)
+
+
+def update_crc(crc: int, data: bytes) -> int:
+    """
+    Feed `data` into a running crc value and return the new value.
+    """
+    view = memoryview(data)
+    even_length = len(view) & ~1
+    if even_length:
+        words = view[:even_length].cast("H")
+        if sys.byteorder == "big":
+            words = array.array("H", words)
+            words.byteswap()
+        table = crc16_word_table
+        for word in words:
+            crc = table[crc ^ word]
+    if even_length != len(view):
+        crc = (crc >> 8) ^ crc16_table[(crc ^ view[-1]) & 0xff]
+    return crc
+
+
 def calculate_crc(data: bytes) -> bytes:
     """
     The difference between modbus's crc16 and a normal crc16
     is that modbus starts the crc value out at 0xffff.
+    The crc is sent low byte first.
     """
-    initial = 0xffff
-    crc = initial
-    for _byte in data:
-        idx = crc16_table[(crc ^ _byte) & 0xff]
-        crc = ((crc >> 8) & 0xff) ^ idx
-    swapped = ((crc << 8) & 0xff00) | ((crc >> 8) & 0x00ff)
-    return swapped.to_bytes(2, 'big')
+    return update_crc(0xffff, data).to_bytes(2, 'little')
 
 
 def crc_is_valid(data: bytes, check: bytes):
     """
     """
     return calculate_crc(data) == check
+
+
+def frame_crc_is_valid(frame: bytes) -> bool:
+    """
+    Check a whole frame, crc included, without slicing off the crc. Running the crc
+    over data followed by its own crc always ends at zero.
+    """
+    return update_crc(0xffff, frame) == 0
+
+
+class Crc16:
+    """
+    Incremental modbus crc. Feed data with `update` as it arrives instead of
+    calculating the crc over the whole buffer each time.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, data: bytes = b""):
+        self.value = 0xffff
+        if data:
+            self.update(data)
+
+    def update(self, data: bytes) -> "Crc16":
+        self.value = update_crc(self.value, data)
+        return self
+
+    def digest(self) -> bytes:
+        """The crc as it is sent on the wire."""
+        return self.value.to_bytes(2, "little")
+
+    @property
+    def frame_is_valid(self) -> bool:
+        """True if the data fed so far is a frame ending with a valid crc."""
+        return self.value == 0
+
+    def reset(self) -> None:
+        self.value = 0xffff
+
+    def copy(self) -> "Crc16":
+        other = Crc16()
+        other.value = self.value
+        return other
@@ -0,0 +1,500 @@
+import abc
+import collections
+import os
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import Future
+import attr
+import serial  # type: ignore
+import structlog
+from typing import *
+from enron_modbus import messages, state
+from enron_modbus.connection import EnronModbusConnection, RECEIVE_BUFFER_SIZE
+from enron_modbus.transports import (
+    NotConnectedError,
+    TransportException,
+    TransportTimeoutError,
+    get_frame_silence,
+    open_socket,
+)
+
+LOG = structlog.get_logger()
+
+# Silence ending a late response on ports without a baud rate, like TCP.
+DEFAULT_FRAME_SILENCE = 0.01
+
+
+@attr.s(auto_attribs=True, eq=False)
+class _PendingRequest:
+    request: Any
+    frame: Optional[bytes]
+    future: Future
+
+
+@attr.s(auto_attribs=True, eq=False)
+class EnginePort(abc.ABC):
+    """
+    A bus served by a `SelectorEngine`. Requests submitted to it are sent one at a
+    time, each failing with `TransportTimeoutError` when its response is not in
+    within `timeout` seconds.
+
+    Responses are read straight into the buffer of the port's
+    `EnronModbusConnection`.
+
+    After a timeout the next request is only sent once nothing was received for
+    `frame_silence` seconds, so a late response is not read as the next response.
+    Responses from another slave or to another function code than the request are
+    dropped.
+
+    A port whose device closes the connection, or that fails to read or write, is
+    closed. Its requests, and the ones submitted after, fail with a
+    `TransportException`.
+    """
+
+    name: str
+    timeout: float = attr.ib(default=1.0)
+    connection: EnronModbusConnection = attr.ib(
+        factory=lambda: EnronModbusConnection(hot_path_logging=False)
+    )
+    frame_silence: Optional[float] = attr.ib(default=None, kw_only=True)
+    _engine: Optional["SelectorEngine"] = attr.ib(init=False, default=None, repr=False)
+    _queue: Deque[_PendingRequest] = attr.ib(
+        init=False, factory=collections.deque, repr=False
+    )
+    _current: Optional[_PendingRequest] = attr.ib(init=False, default=None, repr=False)
+    _deadline: Optional[float] = attr.ib(init=False, default=None, repr=False)
+    _outgoing: bytes = attr.ib(init=False, default=b"", repr=False)
+    # Data arriving with no request waiting, like a response after its timeout, is
+    # read into this and dropped.
+    _scratch: bytearray = attr.ib(
+        init=False, factory=lambda: bytearray(RECEIVE_BUFFER_SIZE), repr=False
+    )
+    _timed_out: bool = attr.ib(init=False, default=False, repr=False)
+    # After a timeout, when the line will have been quiet long enough to send.
+    _quiet_at: Optional[float] = attr.ib(init=False, default=None, repr=False)
+    # Why the port was closed, when it failed.
+    _error: Optional[TransportException] = attr.ib(init=False, default=None, repr=False)
+
+    def submit(self, request, frame: Optional[bytes] = None) -> Future:
+        """
+        Queue a request and return a future for its response. Can be called from
+        any thread. `frame` is the request already encoded. Exception responses
+        fail the future with `messages.SlaveExceptionError`.
+        """
+        if self._engine is None:
+            raise NotConnectedError(f"{self.name} is not added to an engine")
+        future: Future = Future()
+        if self._error is not None:
+            future.set_exception(self._get_closed_error())
+            return future
+        self._engine._submit(self, _PendingRequest(request, frame, future))
+        return future
+
+    def get_frame_silence(self) -> float:
+        if self.frame_silence is None:
+            return DEFAULT_FRAME_SILENCE
+        return self.frame_silence
+
+    def _get_closed_error(self) -> NotConnectedError:
+        return NotConnectedError(f"{self.name} was closed after failing: {self._error}")
+
+    @abc.abstractmethod
+    def open(self) -> None:
+        ...
+
+    @abc.abstractmethod
+    def fileno(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    def read_into(self, buffer: memoryview) -> int:
+        """Read available data into `buffer` without blocking."""
+
+    @abc.abstractmethod
+    def write(self, data: bytes) -> int:
+        """Write as much of `data` as possible without blocking."""
+
+    @abc.abstractmethod
+    def discard_input(self) -> None:
+        ...
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        ...
+
+
+@attr.s(auto_attribs=True, eq=False)
+class SerialEnginePort(EnginePort):
+    port: str = attr.ib(kw_only=True)
+    baudrate: int = attr.ib(kw_only=True)
+    extra_settings: Dict = attr.ib(factory=dict, kw_only=True)
+    serial_port: Optional[serial.Serial] = attr.ib(init=False, default=None)
+
+    def open(self) -> None:
+        LOG.debug("Opening serial port", serial_port=self.port, baudrate=self.baudrate)
+        self.serial_port = serial.Serial(
+            port=self.port, baudrate=self.baudrate, timeout=0, **self.extra_settings
+        )
+
+    def get_frame_silence(self) -> float:
+        if self.frame_silence is None:
+            return get_frame_silence(self.baudrate)
+        return self.frame_silence
+
+    def fileno(self) -> int:
+        assert self.serial_port is not None
+        return self.serial_port.fileno()
+
+    def read_into(self, buffer: memoryview) -> int:
+        return os.readv(self.fileno(), [buffer])
+
+    def write(self, data: bytes) -> int:
+        return os.write(self.fileno(), data)
+
+    def discard_input(self) -> None:
+        assert self.serial_port is not None
+        self.serial_port.reset_input_buffer()
+
+    def close(self) -> None:
+        if self.serial_port:
+            LOG.debug("Closing serial port", serial_port=self.port)
+            self.serial_port.close()
+        self.serial_port = None
+
+
+@attr.s(auto_attribs=True, eq=False)
+class TcpEnginePort(EnginePort):
+    """
+    RTU frames over TCP, like `transports.TcpTransport`.
+    """
+
+    host: str = attr.ib(kw_only=True)
+    port: int = attr.ib(kw_only=True)
+    sock: Optional[socket.socket] = attr.ib(init=False, default=None, repr=False)
+
+    def open(self) -> None:
+        LOG.debug("Opening TCP connection", host=self.host, port=self.port)
+        self.sock = open_socket(self.host, self.port, self.timeout)
+        self.sock.setblocking(False)
+
+    def fileno(self) -> int:
+        assert self.sock is not None
+        return self.sock.fileno()
+
+    def read_into(self, buffer: memoryview) -> int:
+        assert self.sock is not None
+        return self.sock.recv_into(buffer)
+
+    def write(self, data: bytes) -> int:
+        assert self.sock is not None
+        return self.sock.send(data)
+
+    def discard_input(self) -> None:
+        while True:
+            try:
+                if not self.read_into(memoryview(self._scratch)):
+                    return
+            except (BlockingIOError, OSError):
+                return
+
+    def close(self) -> None:
+        if self.sock:
+            LOG.debug("Closing TCP connection", host=self.host, port=self.port)
+            self.sock.close()
+        self.sock = None
+
+
+@attr.s(auto_attribs=True, eq=False)
+class SelectorEngine:
+    """
+    Serves many buses from one thread. The ports are non-blocking and watched with
+    a selector (epoll on Linux), so a box with hundreds of serial ports needs no
+    thread per port, and reads go into the connection buffers instead of new bytes
+    objects.
+
+    Add the ports, `start` the engine thread (or call `run` from a thread of your
+    own) and `submit` requests to the ports from any thread.
+    """
+
+    _selector: selectors.BaseSelector = attr.ib(
+        init=False, factory=selectors.DefaultSelector, repr=False
+    )
+    _ports: List[EnginePort] = attr.ib(init=False, factory=list)
+    _submitted: Deque[Tuple[EnginePort, _PendingRequest]] = attr.ib(
+        init=False, factory=collections.deque, repr=False
+    )
+    # Written to by other threads to wake the engine up from select.
+    _wakeup: Tuple[socket.socket, socket.socket] = attr.ib(
+        init=False, factory=socket.socketpair, repr=False
+    )
+    _running: bool = attr.ib(init=False, default=False, repr=False)
+    _stopping: bool = attr.ib(init=False, default=False, repr=False)
+    _thread: Optional[threading.Thread] = attr.ib(init=False, default=None, repr=False)
+
+    def __attrs_post_init__(self):
+        for sock in self._wakeup:
+            sock.setblocking(False)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ, None)
+
+    def add_serial_port(
+        self,
+        port: str,
+        baudrate: int,
+        timeout: float = 1.0,
+        extra_settings: Optional[Dict] = None,
+    ) -> SerialEnginePort:
+        return self.add_port(
+            SerialEnginePort(
+                port,
+                timeout,
+                port=port,
+                baudrate=baudrate,
+                extra_settings=extra_settings or {},
+            )
+        )
+
+    def add_tcp_port(self, host: str, port: int, timeout: float = 1.0) -> TcpEnginePort:
+        return self.add_port(
+            TcpEnginePort(f"{host}:{port}", timeout, host=host, port=port)
+        )
+
+    def add_port(self, port: EnginePort) -> Any:
+        """
+        Open the port and serve it. Ports are added before the engine runs.
+        """
+        if self._running:
+            raise RuntimeError("Add ports before running the engine")
+        port.open()
+        port._engine = self
+        self._ports.append(port)
+        self._selector.register(port, selectors.EVENT_READ, port)
+        return port
+
+    def start(self) -> None:
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self.run, name="enron-modbus-selector-engine", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping = True
+        self._wake()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self) -> None:
+        """
+        Close all ports, failing the requests still waiting. Call after `stop`.
+        """
+        for port in self._ports:
+            if port._error is None:
+                self._selector.unregister(port)
+            for pending in self._take_pending(port):
+                pending.future.set_exception(NotConnectedError(f"{port.name} was closed"))
+            port.close()
+            port._engine = None
+        self._ports.clear()
+        self._selector.unregister(self._wakeup[0])
+        for sock in self._wakeup:
+            sock.close()
+        self._selector.close()
+
+    def run(self) -> None:
+        """
+        Serve the ports until `stop` is called.
+        """
+        self._running = True
+        try:
+            while not self._stopping:
+                self._take_submitted()
+                for key, events in self._selector.select(self._get_select_timeout()):
+                    port = key.data
+                    if port is None:
+                        self._drain_wakeup()
+                        continue
+                    if events & selectors.EVENT_WRITE:
+                        self._write(port)
+                    if events & selectors.EVENT_READ and port._error is None:
+                        self._read(port)
+                self._expire(time.monotonic())
+        finally:
+            self._running = False
+
+    def _submit(self, port: EnginePort, pending: _PendingRequest) -> None:
+        # deque.append is thread safe, the engine thread takes it from there.
+        self._submitted.append((port, pending))
+        self._wake()
+
+    def _wake(self) -> None:
+        try:
+            self._wakeup[1].send(b"\0")
+        except BlockingIOError:
+            # Already woken.
+            pass
+
+    def _drain_wakeup(self) -> None:
+        try:
+            while self._wakeup[0].recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _take_submitted(self) -> None:
+        while self._submitted:
+            port, pending = self._submitted.popleft()
+            if port._error is not None:
+                if not pending.future.done():
+                    pending.future.set_exception(port._get_closed_error())
+                continue
+            port._queue.append(pending)
+            if port._current is None:
+                self._start_next(port)
+
+    def _take_pending(self, port: EnginePort) -> List[_PendingRequest]:
+        pending = list(port._queue)
+        port._queue.clear()
+        if port._current is not None:
+            pending.insert(0, port._current)
+            port._current = None
+        pending.extend(item for owner, item in self._submitted if owner is port)
+        return [item for item in pending if not item.future.done()]
+
+    def _get_select_timeout(self) -> Optional[float]:
+        deadlines = [
+            deadline
+            for port in self._ports
+            for deadline in (port._deadline, port._quiet_at)
+            if deadline is not None
+        ]
+        if not deadlines:
+            return None
+        return max(min(deadlines) - time.monotonic(), 0)
+
+    def _start_next(self, port: EnginePort) -> None:
+        if port._timed_out:
+            # The slave may still be answering, wait for the line to go quiet.
+            port._timed_out = False
+            port.discard_input()
+            port._quiet_at = time.monotonic() + port.get_frame_silence()
+        if port._quiet_at is not None:
+            return
+        while port._queue:
+            pending = port._queue.popleft()
+            if not pending.future.set_running_or_notify_cancel():
+                continue
+            try:
+                if pending.frame is None:
+                    frame = port.connection.send(pending.request)
+                else:
+                    frame = port.connection.send_encoded(pending.request, pending.frame)
+            except Exception as e:
+                port.connection.reset()
+                pending.future.set_exception(e)
+                continue
+            port._current = pending
+            port._deadline = time.monotonic() + port.timeout
+            port._outgoing = frame
+            self._write(port)
+            return
+
+    def _write(self, port: EnginePort) -> None:
+        if port._outgoing:
+            try:
+                written = port.write(port._outgoing)
+            except BlockingIOError:
+                written = 0
+            except OSError as e:
+                self._drop_port(port, TransportException(f"{port.name}: {e}"))
+                return
+            port._outgoing = port._outgoing[written:]
+        events = selectors.EVENT_READ
+        if port._outgoing:
+            events |= selectors.EVENT_WRITE
+        if self._selector.get_key(port).events != events:
+            self._selector.modify(port, events, port)
+
+    def _read(self, port: EnginePort) -> None:
+        try:
+            if port._current is None:
+                size = port.read_into(memoryview(port._scratch))
+            else:
+                with port.connection.get_receive_buffer() as buffer:
+                    size = port.read_into(buffer)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._drop_port(port, TransportException(f"{port.name}: {e}"))
+            return
+        if not size:
+            # Readable with nothing to read: the other end is gone. The port would
+            # be reported readable forever.
+            self._drop_port(port, TransportException(f"{port.name} was closed"))
+            return
+        if port._current is None:
+            if port._quiet_at is not None:
+                port._quiet_at = time.monotonic() + port.get_frame_silence()
+            LOG.debug("Dropping data received between requests", port=port.name)
+            return
+        port.connection.commit_received(size)
+        try:
+            response = port.connection.next_event()
+        except messages.UnexpectedResponseError as e:
+            # The response to the request may still come, keep waiting for it.
+            LOG.info("Dropping response to another request", port=port.name, error=e)
+            return
+        except messages.EnronModbusParsingException as e:
+            self._finish(port, error=e)
+            return
+        if response is state.NEED_DATA:
+            return
+        if isinstance(response, messages.ExceptionResponse):
+            self._finish(port, error=response.to_error())
+        else:
+            self._finish(port, response=response)
+
+    def _drop_port(self, port: EnginePort, error: TransportException) -> None:
+        LOG.warning("Closing failed engine port", port=port.name, error=error)
+        port._error = error
+        self._selector.unregister(port)
+        port._deadline = None
+        port._quiet_at = None
+        port._outgoing = b""
+        port.connection.reset()
+        for pending in self._take_pending(port):
+            pending.future.set_exception(error)
+        port.close()
+
+    def _expire(self, now: float) -> None:
+        for port in self._ports:
+            if port._quiet_at is not None and port._quiet_at <= now:
+                port._quiet_at = None
+                self._start_next(port)
+            if port._deadline is not None and port._deadline <= now:
+                port._timed_out = True
+                self._finish(
+                    port,
+                    error=TransportTimeoutError(
+                        f"No response on {port.name} within {port.timeout}s"
+                    ),
+                )
+
+    def _finish(
+        self, port: EnginePort, response: Any = None, error: Optional[Exception] = None
+    ) -> None:
+        pending = port._current
+        port._current = None
+        port._deadline = None
+        port._outgoing = b""
+        if pending is not None:
+            if error is None:
+                pending.future.set_result(response)
+            else:
+                # Don't leave the connection waiting for a response that is not
+                # coming.
+                port.connection.reset()
+                pending.future.set_exception(error)
+        self._start_next(port)
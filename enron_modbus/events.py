@@ -0,0 +1,74 @@
+import math
+import struct
+import attr
+from typing import *
+from enron_modbus import history, messages
+
+# Events and alarms are read with function code 0x03 and acknowledged with
+# function code 0x05, both on this register.
+EVENT_REGISTER = messages.EVENT_REGISTER
+
+# Status, register, time (HHMMSS), date (MMDDYY), old value and new value. This is
+# the common layout, pass another struct to `decode_events` for devices that
+# differ.
+EVENT_RECORD_STRUCT = struct.Struct(">HHffff")
+
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
+class EventRecord:
+    """
+    An operator event or alarm. For alarms `old_value` is unused by most devices and
+    `new_value` is the value that triggered the alarm. A record without a valid
+    date, like an empty slot of the log, has a NaN timestamp.
+    """
+
+    slave_address: int
+    status: int
+    register: int
+    timestamp: float
+    old_value: float
+    new_value: float
+
+
+def decode_events(
+    slave_address: int,
+    raw_data: bytes,
+    record_struct: struct.Struct = EVENT_RECORD_STRUCT,
+) -> List[EventRecord]:
+    """
+    The records of one event read response. An empty log gives an empty list.
+    """
+    if len(raw_data) % record_struct.size:
+        raise messages.InvalidDataError(
+            f"{len(raw_data)} bytes of events is not a whole number of "
+            f"{record_struct.size} byte records"
+        )
+    return [
+        EventRecord(
+            slave_address,
+            status,
+            register,
+            _get_timestamp(date, time),
+            old_value,
+            new_value,
+        )
+        for status, register, time, date, old_value, new_value in record_struct.iter_unpack(
+            raw_data
+        )
+    ]
+
+
+def _get_timestamp(date: float, time: float) -> float:
+    try:
+        return history.date_and_time_to_timestamp(date, time)
+    except (ValueError, OverflowError):
+        return math.nan
+
+
+def encode_event(
+    record: EventRecord, record_struct: struct.Struct = EVENT_RECORD_STRUCT
+) -> bytes:
+    date, time = history.timestamp_to_date_and_time(record.timestamp)
+    return record_struct.pack(
+        record.status, record.register, time, date, record.old_value, record.new_value
+    )
@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import collections
+import time
+import attr
+import structlog
+from typing import *
+from enron_modbus import messages
+from enron_modbus.async_client import AsyncEnronModbusClient
+from enron_modbus.async_transports import (
+    AsyncSerialTransport,
+    AsyncTcpTransport,
+    read_request_frame,
+)
+from enron_modbus.crc import calculate_crc
+from enron_modbus.retry import RetryPolicy, SlaveUnavailableError
+from enron_modbus.transports import MBAP_HEADER, TransportException
+
+LOG = structlog.get_logger()
+
+# Requests that only read and can be merged and cached. Event reads are not, the
+# events read are acknowledged next.
+CACHEABLE_REQUESTS = (
+    messages.BooleanReadRequest,
+    messages.NumericReadRequest,
+    messages.HistoryRequest,
+)
+
+
+@attr.s(auto_attribs=True)
+class GatewayStats:
+    requests: int = 0
+    bus_transactions: int = 0
+    merged: int = 0
+    cache_hits: int = 0
+    busy: int = 0
+    failures: int = 0
+
+
+@attr.s(auto_attribs=True)
+class _QueuedRequest:
+    request: Any
+    frame: bytes
+    future: asyncio.Future
+
+
+@attr.s(auto_attribs=True)
+class GatewayServer:
+    """
+    Shares one bus between many Modbus TCP and RTU over TCP clients. `client` is
+    an `AsyncEnronModbusClient` owning the bus, for example over an
+    `AsyncSerialTransport`.
+
+    Requests from all clients are queued and sent on the bus one at a time, in
+    the order they came in. A read identical to one queued or on the bus waits
+    for that response instead of being queued again, and responses to reads are
+    served from a cache for `cache_ttl` seconds. Writes, and other requests that
+    are not plain reads, drop the cached reads of their slave when queued and
+    again when done, whether the slave answered or not. Reads queued after them
+    are not merged with reads queued before and nothing is cached for the slave
+    while they are queued. Requests arriving while `max_queued` are waiting are
+    refused with a slave device busy exception, so the load on the bus stays
+    bounded however many clients connect.
+
+    Requests the bus doesn't answer get a gateway target failed to respond
+    exception over Modbus TCP and no answer over RTU, like on a serial line.
+    """
+
+    client: AsyncEnronModbusClient
+    cache_ttl: float = attr.ib(default=0.5)
+    max_queued: int = attr.ib(default=64)
+    stats: GatewayStats = attr.ib(factory=GatewayStats)
+    _queue: Optional["asyncio.Queue[_QueuedRequest]"] = attr.ib(
+        init=False, default=None, repr=False
+    )
+    _worker: Optional[asyncio.Task] = attr.ib(init=False, default=None, repr=False)
+    # Reads queued or on the bus by request frame.
+    _in_flight: Dict[bytes, asyncio.Future] = attr.ib(
+        init=False, factory=dict, repr=False
+    )
+    # Requests that are not plain reads queued or on the bus, by slave address.
+    _writes_queued: "collections.Counter[int]" = attr.ib(
+        init=False, factory=collections.Counter, repr=False
+    )
+    # Request frame to (expiry, response frame), oldest first.
+    _cache: "collections.OrderedDict[bytes, Tuple[float, bytes]]" = attr.ib(
+        init=False, factory=collections.OrderedDict, repr=False
+    )
+    _servers: List[asyncio.AbstractServer] = attr.ib(init=False, factory=list, repr=False)
+    _writers: Set[asyncio.StreamWriter] = attr.ib(init=False, factory=set, repr=False)
+    # Pipelined Modbus TCP requests being answered. The loop only keeps weak
+    # references to tasks.
+    _tasks: Set[asyncio.Task] = attr.ib(init=False, factory=set, repr=False)
+    _closing: bool = attr.ib(init=False, default=False, repr=False)
+
+    async def serve_tcp(
+        self, host: str = "127.0.0.1", port: int = 0, modbus_tcp: bool = False
+    ) -> int:
+        """
+        Start listening and return the port. With `modbus_tcp` clients talk Modbus
+        TCP, otherwise RTU frames. Call more than once to serve both.
+        """
+        self._start()
+        handler = self._handle_modbus_tcp if modbus_tcp else self._handle_rtu
+        server = await asyncio.start_server(handler, host, port)
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def _start(self) -> None:
+        if self._worker is None:
+            self._queue = asyncio.Queue(self.max_queued)
+            self._worker = asyncio.ensure_future(self._run_bus())
+
+    async def handle_frame(self, frame: bytes) -> Optional[bytes]:
+        """
+        Answer an RTU request frame with the RTU response frame, or None when the
+        bus didn't answer. Raises `messages.EnronModbusParsingException` for frames
+        that are not a valid request.
+        """
+        if self._closing:
+            return None
+        self._start()
+        assert self._queue is not None
+        request = messages.StandardRequestFactory.make_request_from_bytes(frame)
+        self.stats.requests += 1
+        cacheable = isinstance(request, CACHEABLE_REQUESTS)
+        if cacheable:
+            cached = self._cache.get(frame)
+            if cached is not None:
+                expires_at, response = cached
+                if time.monotonic() < expires_at:
+                    self.stats.cache_hits += 1
+                    return response
+                del self._cache[frame]
+            future = self._in_flight.get(frame)
+            if future is not None:
+                self.stats.merged += 1
+                return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_QueuedRequest(request, frame, future))
+        except asyncio.QueueFull:
+            self.stats.busy += 1
+            return messages.ExceptionResponse(
+                request.slave_address, request.FUNCTION_CODE, messages.SLAVE_DEVICE_BUSY
+            ).to_bytes()
+        if cacheable:
+            self._in_flight[frame] = future
+        else:
+            # Reads from now on must see what this request does.
+            self._writes_queued[request.slave_address] += 1
+            self._drop_cached(request.slave_address)
+        # A client going away must not cancel the request others wait for.
+        return await asyncio.shield(future)
+
+    async def _run_bus(self) -> None:
+        assert self._queue is not None
+        while True:
+            queued = await self._queue.get()
+            response = None
+            try:
+                response = await self._transact(queued.request, queued.frame)
+            except Exception:
+                LOG.exception("Gateway request failed", request=queued.request)
+            finally:
+                # Also when closing, the clients waiting get no answer from the bus.
+                if self._in_flight.get(queued.frame) is queued.future:
+                    del self._in_flight[queued.frame]
+                if not queued.future.done():
+                    queued.future.set_result(response)
+            slave_address = queued.request.slave_address
+            if not isinstance(queued.request, CACHEABLE_REQUESTS):
+                # A write that failed might still have reached the slave.
+                self._writes_queued[slave_address] -= 1
+                if not self._writes_queued[slave_address]:
+                    del self._writes_queued[slave_address]
+                self._drop_cached(slave_address)
+            elif response is not None and not self._writes_queued[slave_address]:
+                self._store(queued.frame, response)
+
+    async def _transact(self, request, frame: bytes) -> Optional[bytes]:
+        self.stats.bus_transactions += 1
+        if isinstance(request, messages.HistoryRequest):
+            key = (request.slave_address, request.table)
+            response_length = request.response_length(
+                self.client.history_record_sizes.get(key)
+            )
+        else:
+            response_length = request.response_length()
+        try:
+            response = await self.client.make_request(request, response_length, frame)
+        except messages.SlaveExceptionError as e:
+            return messages.ExceptionResponse(
+                request.slave_address, e.function_code, e.exception_code
+            ).to_bytes()
+        except (
+            TransportException,
+            messages.EnronModbusParsingException,
+            SlaveUnavailableError,
+        ) as e:
+            self.stats.failures += 1
+            LOG.info("Bus didn't answer gateway request", request=request, error=e)
+            return None
+        if isinstance(request, messages.HistoryRequest):
+            self.client.history_record_sizes[key] = len(response.raw_data)
+        return response.to_bytes()
+
+    def _store(self, frame: bytes, response: bytes) -> None:
+        if self.cache_ttl <= 0:
+            return
+        now = time.monotonic()
+        self._cache.pop(frame, None)
+        self._cache[frame] = (now + self.cache_ttl, response)
+        # All entries live as long, the expired ones are at the front.
+        while self._cache:
+            _, (expires_at, _) = next(iter(self._cache.items()))
+            if expires_at > now:
+                break
+            self._cache.popitem(last=False)
+
+    def _drop_cached(self, slave_address: int) -> None:
+        for frame in [frame for frame in self._cache if frame[0] == slave_address]:
+            del self._cache[frame]
+        for frame in [frame for frame in self._in_flight if frame[0] == slave_address]:
+            del self._in_flight[frame]
+
+    async def _handle_rtu(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                frame = await read_request_frame(reader)
+                response = await self.handle_frame(frame)
+                if response:
+                    writer.write(response)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except messages.EnronModbusParsingException as e:
+            LOG.debug("Closing connection sending invalid frames", error=e)
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _handle_modbus_tcp(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        async def respond(transaction_id: int, unit_id: int, pdu: bytes) -> None:
+            frame = bytes([unit_id]) + pdu
+            try:
+                response = await self.handle_frame(frame + calculate_crc(frame))
+            except messages.EnronModbusParsingException:
+                response = messages.ExceptionResponse(
+                    unit_id, pdu[0], messages.ILLEGAL_FUNCTION
+                ).to_bytes()
+            if response is None:
+                response = messages.ExceptionResponse(
+                    unit_id, pdu[0], messages.GATEWAY_TARGET_FAILED_TO_RESPOND
+                ).to_bytes()
+            writer.write(
+                MBAP_HEADER.pack(transaction_id, 0, len(response) - 2, response[0])
+                + response[1:-2]
+            )
+
+        self._writers.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(MBAP_HEADER.size)
+                transaction_id, _, length, unit_id = MBAP_HEADER.unpack(header)
+                if length < 2:
+                    break
+                pdu = await reader.readexactly(length - 1)
+                # Requests on a Modbus TCP connection may be pipelined.
+                task = asyncio.ensure_future(respond(transaction_id, unit_id, pdu))
+                self._tasks.add(task)
+                task.add_done_callback(self._forget_task)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _forget_task(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            LOG.warning("Gateway failed to respond", error=task.exception())
+
+    async def close(self) -> None:
+        """
+        Stop serving. Requests still queued or on the bus are answered like ones
+        the bus didn't answer and client connections are closed.
+        """
+        self._closing = True
+        for server in self._servers:
+            server.close()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                queued = self._queue.get_nowait()
+                if not queued.future.done():
+                    queued.future.set_result(None)
+            self._queue = None
+        for future in self._in_flight.values():
+            if not future.done():
+                future.set_result(None)
+        self._in_flight.clear()
+        self._writes_queued.clear()
+        if self._tasks:
+            # Let them write their answer before the connections close.
+            await asyncio.wait(list(self._tasks))
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers.clear()
+        self._closing = False
+
+
+async def _main(arguments: argparse.Namespace) -> None:
+    if arguments.serial:
+        transport: Any = AsyncSerialTransport(
+            arguments.serial, arguments.baudrate, hot_path_logging=False
+        )
+        retry_policy = RetryPolicy(baudrate=arguments.baudrate)
+    else:
+        host, _, port = arguments.tcp.partition(":")
+        transport = AsyncTcpTransport(host, int(port), hot_path_logging=False)
+        retry_policy = RetryPolicy()
+    client = AsyncEnronModbusClient(
+        transport, hot_path_logging=False, retry_policy=retry_policy
+    )
+    await client.connect()
+    gateway = GatewayServer(
+        client, cache_ttl=arguments.cache_ttl, max_queued=arguments.max_queued
+    )
+    if arguments.modbus_tcp_port is not None:
+        port = await gateway.serve_tcp(arguments.host, arguments.modbus_tcp_port, True)
+        print(f"Modbus TCP: {arguments.host}:{port}")
+    if arguments.rtu_port is not None:
+        port = await gateway.serve_tcp(arguments.host, arguments.rtu_port)
+        print(f"RTU over TCP: {arguments.host}:{port}")
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Enron Modbus gateway")
+    bus = parser.add_mutually_exclusive_group(required=True)
+    bus.add_argument("--serial", help="Serial port of the bus")
+    bus.add_argument("--tcp", help="host:port of an RTU over TCP bus")
+    parser.add_argument("--baudrate", type=int, default=9600)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--modbus-tcp-port", type=int, default=None)
+    parser.add_argument("--rtu-port", type=int, default=None)
+    parser.add_argument("--cache-ttl", type=float, default=0.5)
+    parser.add_argument("--max-queued", type=int, default=64)
+    arguments = parser.parse_args()
+    if arguments.modbus_tcp_port is None and arguments.rtu_port is None:
+        parser.error("Give --modbus-tcp-port and/or --rtu-port")
+    try:
+        asyncio.run(_main(arguments))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import array
+import datetime
+import math
+import struct
+import attr
+from typing import *
+from enron_modbus import utils
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class HistoryRecord:
+    """
+    A raw history record and the record index it was read from.
+    """
+
+    table: int
+    index: int
+    raw_data: bytes
+
+
+class HistoryReadoutError(Exception):
+    """
+    Reading a range of history records failed. Resume with `index` and `remaining`
+    to continue where the readout stopped. `error` is what made the read fail, like
+    a `transports.TransportTimeoutError` when the slave didn't answer.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        table: int,
+        index: int,
+        remaining: int,
+        error: Optional[Exception] = None,
+    ):
+        super().__init__(message)
+        self.table = table
+        self.index = index
+        self.remaining = remaining
+        self.error = error
+
+
+def get_history_indices(start_index: int, count: int, table_size: int) -> Iterator[int]:
+    """
+    `count` record indices from `start_index`, rolling over to zero at the end of
+    the table.
+    """
+    if not 0 <= start_index < table_size:
+        raise ValueError(f"Index {start_index} is outside a table of {table_size}")
+    if not 0 <= count <= table_size:
+        raise ValueError(f"Can't read {count} records from a table of {table_size}")
+    index = start_index
+    for _ in range(count):
+        yield index
+        index += 1
+        if index == table_size:
+            index = 0
+
+
+def count_history_records(first_index: int, last_index: int, table_size: int) -> int:
+    """
+    Number of records from `first_index` up to and including `last_index`, when the
+    range might roll over the end of the table.
+    """
+    return (last_index - first_index) % table_size + 1
+
+
+def date_and_time_to_timestamp(date: float, time: float) -> float:
+    """
+    Converts Enron date (MMDDYY) and time (HHMMSS) values to seconds since the
+    epoch. Devices have no notion of time zone so the time is taken as UTC.
+    """
+    mmddyy = int(round(date))
+    hhmmss = int(round(time))
+    year = mmddyy % 100
+    year += 2000 if year < 70 else 1900
+    days = (
+        datetime.date(year, mmddyy // 10000, mmddyy // 100 % 100).toordinal()
+        - EPOCH_ORDINAL
+    )
+    return float(
+        days * 86400
+        + hhmmss // 10000 * 3600
+        + hhmmss // 100 % 100 * 60
+        + hhmmss % 100
+    )
+
+
+def timestamp_to_date_and_time(timestamp: float) -> Tuple[float, float]:
+    """
+    The Enron date (MMDDYY) and time (HHMMSS) values of a UTC timestamp.
+    """
+    moment = datetime.datetime.fromtimestamp(int(timestamp), datetime.timezone.utc)
+    return (
+        float(moment.month * 10000 + moment.day * 100 + moment.year % 100),
+        float(moment.hour * 10000 + moment.minute * 100 + moment.second),
+    )
+
+
+@attr.s(auto_attribs=True)
+class HistoryColumns:
+    """
+    Decoded history records, one typed array per column. Arrays are in native byte
+    order so they can be handed to NumPy without copying.
+    """
+
+    timestamps: array.array
+    items: Dict[int, array.array]
+    indices: Optional[array.array] = attr.ib(default=None)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def to_numpy(self) -> Dict[Union[str, int], Any]:
+        """
+        Columns as NumPy arrays sharing memory with the typed arrays. Timestamps
+        are under "timestamp", indices under "index" and items under their register.
+        """
+        import numpy  # type: ignore
+
+        columns: Dict[Union[str, int], Any] = {
+            "timestamp": numpy.frombuffer(self.timestamps, dtype="d")
+        }
+        if self.indices is not None:
+            columns["index"] = numpy.frombuffer(self.indices, dtype=self.indices.typecode)
+        for register, values in self.items.items():
+            columns[register] = numpy.frombuffer(values, dtype=values.typecode)
+        return columns
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class HistorySchema:
+    """
+    The layout of the records in a history table, from the device's modbus map.
+
+    A record starts with date (MMDDYY) and time (HHMMSS) as 32 bit floats followed
+    by the values of the items in the table. The type of each item is given by its
+    register, like for normal reads.
+    """
+
+    item_registers: Tuple[int, ...] = attr.ib(converter=tuple)
+    record_struct: struct.Struct = attr.ib(init=False, repr=False)
+
+    @record_struct.default
+    def _make_record_struct(self) -> struct.Struct:
+        return struct.Struct(
+            ">ff" + "".join(utils.get_numeric_format(r) for r in self.item_registers)
+        )
+
+    @property
+    def record_size(self) -> int:
+        return self.record_struct.size
+
+    def decode_record(self, raw_data: bytes) -> Tuple[float, Dict[int, Union[int, float]]]:
+        """
+        Decode a single record to its timestamp and item values. A record not
+        written yet has no valid date and gets a NaN timestamp.
+        """
+        date, time, *values = self.record_struct.unpack(raw_data)
+        try:
+            timestamp = date_and_time_to_timestamp(date, time)
+        except (ValueError, OverflowError):
+            timestamp = math.nan
+        return timestamp, dict(zip(self.item_registers, values))
+
+    def decode(self, payloads: Iterable[Union[bytes, Any]]) -> HistoryColumns:
+        """
+        Decode a batch of records to columns. Takes raw record data or objects with
+        a `raw_data` attribute, like `HistoryResponse`. Records not written yet
+        have no valid date and get a NaN timestamp.
+        """
+        raw = [getattr(payload, "raw_data", payload) for payload in payloads]
+        for payload in raw:
+            if len(payload) != self.record_size:
+                raise ValueError(
+                    f"Record is {len(payload)} bytes, schema expects {self.record_size}"
+                )
+        rows = self.record_struct.iter_unpack(b"".join(raw))
+        columns = list(zip(*rows)) or [()] * (2 + len(self.item_registers))
+
+        # Consecutive records mostly share the date, convert each date once.
+        day_starts: Dict[float, float] = dict()
+        timestamps = array.array("d")
+        for date, time in zip(columns[0], columns[1]):
+            day_start = day_starts.get(date)
+            if day_start is None:
+                try:
+                    day_start = date_and_time_to_timestamp(date, 0)
+                except ValueError:
+                    day_start = math.nan
+                day_starts[date] = day_start
+            if math.isnan(day_start) or not math.isfinite(time):
+                timestamps.append(math.nan)
+                continue
+            hhmmss = int(round(time))
+            timestamps.append(
+                day_start
+                + hhmmss // 10000 * 3600
+                + hhmmss // 100 % 100 * 60
+                + hhmmss % 100
+            )
+
+        items = {
+            register: array.array(
+                utils.NUMERIC_TYPECODES[utils.get_register_table(register)], values
+            )
+            for register, values in zip(self.item_registers, columns[2:])
+        }
+        return HistoryColumns(timestamps, items)
+
+    def decode_records(self, records: Iterable[HistoryRecord]) -> HistoryColumns:
+        """
+        Like `decode` but also keeps the record indices.
+        """
+        records = list(records)
+        columns = self.decode(records)
+        columns.indices = array.array("l", (record.index for record in records))
+        return columns
@@ -0,0 +1,277 @@
+import math
+import os
+import sqlite3
+import time
+import attr
+import structlog
+from typing import *
+from enron_modbus import history
+from enron_modbus.retry import SlaveUnavailableError
+from enron_modbus.transports import TransportException
+
+LOG = structlog.get_logger()
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class HistoryTableConfig:
+    """
+    A history table of a device and the numeric register holding its current
+    index, the index of the newest record, as in the device's modbus map.
+
+    The first sync of a table reads its `initial_records` newest records. With a
+    `schema` the timestamp of each record is stored with it.
+    """
+
+    table: int
+    index_register: int
+    table_size: int
+    initial_records: int = attr.ib(default=0)
+    schema: Optional[history.HistorySchema] = attr.ib(default=None)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class HistoryDevice:
+    slave_address: int
+    tables: Tuple[HistoryTableConfig, ...] = attr.ib(converter=tuple)
+
+
+@attr.s(auto_attribs=True)
+class HistorySyncResult:
+    slave_address: int
+    table: int
+    records: int = 0
+    # Index of the newest record stored, None when no record was stored.
+    last_index: Optional[int] = None
+    error: Optional[Exception] = None
+
+
+@attr.s(auto_attribs=True)
+class SqliteHistoryStore:
+    """
+    History records and the sync checkpoint of each (slave, table) in a SQLite
+    database. Records are stored in the same transaction as the checkpoint
+    moving past them, so after a crash a sync neither skips nor repeats records.
+    """
+
+    path: Union[str, os.PathLike]
+    connection: sqlite3.Connection = attr.ib(init=False, repr=False)
+    clock: Callable[[], float] = attr.ib(default=time.time, repr=False)
+
+    def __attrs_post_init__(self):
+        self.connection = sqlite3.connect(self.path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS history_checkpoints ("
+                " slave_address INTEGER NOT NULL,"
+                " history_table INTEGER NOT NULL,"
+                " last_index INTEGER NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (slave_address, history_table))"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS history_records ("
+                " id INTEGER PRIMARY KEY,"
+                " slave_address INTEGER NOT NULL,"
+                " history_table INTEGER NOT NULL,"
+                " record_index INTEGER NOT NULL,"
+                " timestamp REAL,"
+                " fetched_at REAL NOT NULL,"
+                " raw_data BLOB NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS history_records_by_table"
+                " ON history_records (slave_address, history_table, id)"
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get_checkpoint(self, slave_address: int, table: int) -> Optional[int]:
+        """
+        Index of the last record stored of the table, None if it was never synced.
+        """
+        row = self.connection.execute(
+            "SELECT last_index FROM history_checkpoints"
+            " WHERE slave_address = ? AND history_table = ?",
+            (slave_address, table),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def store_records(
+        self,
+        slave_address: int,
+        table: int,
+        records: Sequence[history.HistoryRecord],
+        last_index: int,
+        schema: Optional[history.HistorySchema] = None,
+    ) -> None:
+        """
+        Store records and move the checkpoint of their table to `last_index`, in
+        one transaction.
+        """
+        fetched_at = self.clock()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO history_records (slave_address, history_table,"
+                " record_index, timestamp, fetched_at, raw_data)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        slave_address,
+                        table,
+                        record.index,
+                        _get_timestamp(schema, record.raw_data),
+                        fetched_at,
+                        record.raw_data,
+                    )
+                    for record in records
+                ],
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO history_checkpoints"
+                " (slave_address, history_table, last_index, updated_at)"
+                " VALUES (?, ?, ?, ?)",
+                (slave_address, table, last_index, fetched_at),
+            )
+
+    def iter_records(self, slave_address: int, table: int) -> Iterator[history.HistoryRecord]:
+        """
+        Stored records of a table in the order they were read.
+        """
+        rows = self.connection.execute(
+            "SELECT record_index, raw_data FROM history_records"
+            " WHERE slave_address = ? AND history_table = ? ORDER BY id",
+            (slave_address, table),
+        )
+        for index, raw_data in rows:
+            yield history.HistoryRecord(table, index, raw_data)
+
+
+def _get_timestamp(
+    schema: Optional[history.HistorySchema], raw_data: bytes
+) -> Optional[float]:
+    if schema is None:
+        return None
+    timestamp = schema.decode_record(raw_data)[0]
+    # Records not written yet hold no valid date.
+    return None if math.isnan(timestamp) else timestamp
+
+
+def _is_unreachable(error: Optional[Exception]) -> bool:
+    if isinstance(error, history.HistoryReadoutError):
+        error = error.error
+    return isinstance(error, (TransportException, SlaveUnavailableError))
+
+
+@attr.s(auto_attribs=True)
+class HistorySync:
+    """
+    Reads the history records devices wrote since the last sync and stores them
+    in a `SqliteHistoryStore`.
+
+    For each table the device's current index is read and the records after the
+    checkpoint up to it are fetched, rolling over at the end of the table. They
+    are committed with the checkpoint every `batch_size` records, so a failed
+    readout resumes where it stopped on the next sync. A device that wrote more
+    than a whole table since the last sync has overwritten records that can't be
+    read anymore, sync often enough for that not to happen.
+    """
+
+    client: Any
+    store: SqliteHistoryStore
+    batch_size: int = attr.ib(default=24)
+
+    def sync(self, devices: Iterable[HistoryDevice]) -> List[HistorySyncResult]:
+        """
+        Sync all tables of the devices in one pass. Errors are reported in the
+        results, the remaining tables of a device that doesn't answer are
+        skipped.
+        """
+        results = []
+        for device in devices:
+            for config in device.tables:
+                result = self.sync_table(device.slave_address, config)
+                results.append(result)
+                if _is_unreachable(result.error):
+                    break
+        return results
+
+    def sync_table(
+        self, slave_address: int, config: HistoryTableConfig
+    ) -> HistorySyncResult:
+        result = HistorySyncResult(slave_address, config.table)
+        try:
+            current_index = int(
+                self.client.read_numeric(slave_address, config.index_register)
+            )
+            if not 0 <= current_index < config.table_size:
+                raise ValueError(
+                    f"Index {current_index} is outside a table of {config.table_size}"
+                )
+            last_index = self.store.get_checkpoint(slave_address, config.table)
+            if last_index is None:
+                count = min(config.initial_records, config.table_size)
+                if not count:
+                    self.store.store_records(slave_address, config.table, [], current_index)
+                    return result
+                start_index = (current_index - count + 1) % config.table_size
+            else:
+                count = (current_index - last_index) % config.table_size
+                start_index = (last_index + 1) % config.table_size
+            if count:
+                self._fetch(result, config, start_index, count)
+        except Exception as e:
+            LOG.warning(
+                "History sync failed",
+                slave_address=slave_address,
+                table=config.table,
+                records=result.records,
+                error=e,
+            )
+            result.error = e
+        return result
+
+    def _fetch(
+        self,
+        result: HistorySyncResult,
+        config: HistoryTableConfig,
+        start_index: int,
+        count: int,
+    ) -> None:
+        batch: List[history.HistoryRecord] = []
+        try:
+            for record in self.client.iter_history(
+                result.slave_address, config.table, start_index, count, config.table_size
+            ):
+                batch.append(record)
+                if len(batch) == self.batch_size:
+                    self._commit(result, config, batch)
+                    batch = []
+        except Exception:
+            # Keep what was read before a failure, without hiding the failure.
+            if batch:
+                try:
+                    self._commit(result, config, batch)
+                except Exception as e:
+                    LOG.error(
+                        "Storing history records read before a failure failed",
+                        slave_address=result.slave_address,
+                        table=config.table,
+                        records=len(batch),
+                        error=e,
+                    )
+            raise
+        if batch:
+            self._commit(result, config, batch)
+
+    def _commit(
+        self,
+        result: HistorySyncResult,
+        config: HistoryTableConfig,
+        batch: List[history.HistoryRecord],
+    ) -> None:
+        self.store.store_records(
+            result.slave_address, config.table, batch, batch[-1].index, config.schema
+        )
+        result.records += len(batch)
+        result.last_index = batch[-1].index
@@ -1,11 +1,15 @@
+import struct
 import attr
 
 from enron_modbus import utils
-from enron_modbus.crc import calculate_crc, crc_is_valid
+from enron_modbus.crc import frame_crc_is_valid, update_crc
 from typing import *
 
+# Messages are immutable and slotted: a poller creates and drops many of them.
+_message = attr.s(auto_attribs=True, slots=True, frozen=True)
 
-@attr.s(auto_attribs=True)
+
+@_message
 class BooleanWriteRequest:
     FUNCTION_CODE = 0x05
     slave_address: int
@@ -13,19 +17,23 @@ class BooleanWriteRequest:
     value: bool
 
     def to_bytes(self) -> bytes:
-        out = bytearray()
-        out.append(self.slave_address)
-        out.append(self.FUNCTION_CODE)
-        out.extend(self.register.to_bytes(2, "big"))
-        if self.value:
-            out.extend(b"\xff\x00")
-        else:
-            out.extend(b"\x00\x00")
+        return _encode_fixed_frame(
+            self.slave_address,
+            self.FUNCTION_CODE,
+            self.register,
+            BOOLEAN_ON if self.value else BOOLEAN_OFF,
+        )
+
+    def response_length(self) -> int:
+        return 8
 
-        return bytes(out) + calculate_crc(out)
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        slave_address, register, value = _parse_fixed_frame(cls, source_bytes, verify_crc)
+        return cls(slave_address, register, _parse_boolean_value(value))
 
 
-@attr.s(auto_attribs=True)
+@_message
 class BooleanWriteResponse:
     FUNCTION_CODE = 0x05
     slave_address: int
@@ -33,45 +41,39 @@ class BooleanWriteResponse:
     value: bool
 
     @classmethod
-    def from_bytes(cls, source_bytes: bytes):
-        data = bytearray(source_bytes)
-        slave_address = data.pop(0)
-        function_code = data.pop(0)
-        if function_code != cls.FUNCTION_CODE:
-            raise WrongFuntionCodeError(
-                f"Not a BooleanWriteResponse: function code is {function_code!r} "
-                f"instead if {cls.FUNCTION_CODE}"
-            )
-        register = int.from_bytes(data[:2], "big")
-        boolean_data = data[2:4]
-        if boolean_data == b"\xff\x00":
-            value = True
-        elif boolean_data == b"\x00\x00":
-            value = False
-        else:
-            raise ValueError(f"Boolean data is not valid: {boolean_data!r}")
-        crc = data[4:]
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        slave_address, register, value = _parse_fixed_frame(cls, source_bytes, verify_crc)
+        return cls(slave_address, register, _parse_boolean_value(value))
 
-        if not crc_is_valid(source_bytes[:-2], crc):
-            raise InvalidCrcError()
-        return cls(slave_address, register, value)
+    def to_bytes(self) -> bytes:
+        return _encode_fixed_frame(
+            self.slave_address,
+            self.FUNCTION_CODE,
+            self.register,
+            BOOLEAN_ON if self.value else BOOLEAN_OFF,
+        )
 
 
-@attr.s(auto_attribs=True)
+@_message
 class BooleanReadRequest:
     FUNCTION_CODE = 0x01
     slave_address: int
     start_register: int
     amount: int
 
-    def to_bytes(self):
-        out = bytearray()
-        out.append(self.slave_address)
-        out.append(self.FUNCTION_CODE)
-        out.extend(self.start_register.to_bytes(2, "big"))
-        out.extend(self.amount.to_bytes(2, "big"))
+    def to_bytes(self) -> bytes:
+        return _encode_fixed_frame(
+            self.slave_address, self.FUNCTION_CODE, self.start_register, self.amount
+        )
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        return cls(*_parse_fixed_frame(cls, source_bytes, verify_crc))
 
-        return bytes(out) + calculate_crc(out)
+    def response_length(self) -> int:
+        return MINIMAL_RESPONSE_SIZE + utils.number_of_bytes_containing_booleans(
+            self.amount
+        )
 
 
 class EnronModbusParsingException(Exception):
@@ -94,38 +96,248 @@ class NotEnoughDataError(EnronModbusParsingException):
     """Not enough data to parse the message"""
 
 
-@attr.s(auto_attribs=True)
+class InvalidDataError(EnronModbusParsingException):
+    """The data in the message is not valid"""
+
+
+class UnexpectedResponseError(EnronModbusParsingException):
+    """
+    The response has another slave address or function code than the request, like
+    a late response to an earlier request
+    """
+
+
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+SLAVE_DEVICE_FAILURE = 0x04
+SLAVE_DEVICE_BUSY = 0x06
+# Answered by gateways, for the slaves behind them.
+GATEWAY_PATH_UNAVAILABLE = 0x0A
+GATEWAY_TARGET_FAILED_TO_RESPOND = 0x0B
+
+
+class SlaveExceptionError(Exception):
+    """The slave answered with an exception response"""
+
+    def __init__(self, message: str, function_code: int, exception_code: int):
+        super().__init__(message)
+        self.function_code = function_code
+        self.exception_code = exception_code
+
+
+# Address, function code, byte count or exception code, and crc.
+MINIMAL_RESPONSE_SIZE = 5
+
+# Set in the function code of exception responses.
+EXCEPTION_FLAG = 0x80
+
+# Values of a boolean write.
+BOOLEAN_ON = 0xFF00
+BOOLEAN_OFF = 0x0000
+
+# Address, function code and two 16-bit fields: all of an 8 byte frame but the crc.
+FIXED_FRAME = struct.Struct(">BBHH")
+# Address, function code and register of a numeric write, the value follows.
+REGISTER_HEADER = struct.Struct(">BBH")
+# Address, function code and byte count, the data follows.
+BYTE_COUNT_HEADER = struct.Struct(">BBB")
+# Address, function code, start register, amount and byte count of a multiple write.
+MULTIPLE_WRITE_HEADER = struct.Struct(">BBHHB")
+# The crc is sent low byte first.
+CRC = struct.Struct("<H")
+
+
+def _get_write_value_size(register: int) -> int:
+    try:
+        return utils.get_numeric_value_size(register)
+    except ValueError as e:
+        raise InvalidDataError(str(e))
+
+
+def get_response_frame_length(header: bytes) -> Optional[int]:
+    """
+    The length of the response frame starting with `header`, or None if more of the
+    header is needed to tell.
+
+    Reads of booleans, numerics and history carry a byte count, boolean writes,
+    multiple writes and exception responses have a fixed size and numeric writes
+    are sized by the register written.
+    """
+    if len(header) < 2:
+        return None
+    function_code = header[1]
+    if function_code & EXCEPTION_FLAG:
+        return MINIMAL_RESPONSE_SIZE
+    elif function_code in (0x01, 0x03):
+        if len(header) < 3:
+            return None
+        return MINIMAL_RESPONSE_SIZE + header[2]
+    elif function_code in (0x05, 0x0F, 0x10):
+        return 8
+    elif function_code == 0x06:
+        if len(header) < 4:
+            return None
+        register = (header[2] << 8) | header[3]
+        return 6 + _get_write_value_size(register)
+    raise WrongFuntionCodeError(f"Unknown function code {function_code!r}")
+
+
+def get_request_frame_length(header: bytes) -> Optional[int]:
+    """
+    The length of the request frame starting with `header`, or None if more of the
+    header is needed to tell.
+    """
+    if len(header) < 2:
+        return None
+    function_code = header[1]
+    if function_code in (0x01, 0x03, 0x05):
+        return 8
+    elif function_code == 0x06:
+        if len(header) < 4:
+            return None
+        register = (header[2] << 8) | header[3]
+        return 6 + _get_write_value_size(register)
+    elif function_code in (0x0F, 0x10):
+        if len(header) < 7:
+            return None
+        return 9 + header[6]
+    raise WrongFuntionCodeError(f"Unknown function code {function_code!r}")
+
+
+def _check_function_code(cls, data: bytes) -> None:
+    if len(data) < 2:
+        raise NotEnoughDataError()
+    if data[1] != cls.FUNCTION_CODE:
+        raise WrongFuntionCodeError(
+            f"Not a {cls.__name__}: function code is {data[1]!r} "
+            f"instead if {cls.FUNCTION_CODE}"
+        )
+
+
+def _parse_fixed_length_frame(
+    cls, source_bytes: bytes, length: int, verify_crc: bool
+) -> bytes:
+    """
+    Check function code, length and crc of a frame of known length. Takes bytes or
+    a memoryview and returns it as is.
+    """
+    data = source_bytes
+    _check_function_code(cls, data)
+    if len(data) < length:
+        raise NotEnoughDataError()
+    if len(data) != length:
+        raise InvalidLengthError("The message length is not correct")
+    if verify_crc and not frame_crc_is_valid(data):
+        raise InvalidCrcError()
+    return data
+
+
+def _seal_frame(frame: bytes) -> bytes:
+    """
+    The frame with its crc appended.
+    """
+    return frame + CRC.pack(update_crc(0xFFFF, frame))
+
+
+def _encode_fixed_frame(
+    slave_address: int, function_code: int, first: int, second: int
+) -> bytes:
+    return _seal_frame(
+        FIXED_FRAME.pack(slave_address, function_code, first, second)
+    )
+
+
+def _parse_fixed_frame(cls, source_bytes: bytes, verify_crc: bool) -> Tuple[int, int, int]:
+    """
+    Parse an 8 byte frame. Returns the address and the two 16-bit fields.
+    """
+    data = _parse_fixed_length_frame(
+        cls, source_bytes, FIXED_FRAME.size + CRC.size, verify_crc
+    )
+    slave_address, _, first, second = FIXED_FRAME.unpack_from(data)
+    return slave_address, first, second
+
+
+def _encode_numeric_write(
+    slave_address: int, function_code: int, register: int, value: Union[int, float]
+) -> bytes:
+    return _seal_frame(
+        REGISTER_HEADER.pack(slave_address, function_code, register)
+        + utils.get_numeric_block_struct(register, 1).pack(value)
+    )
+
+
+def _parse_numeric_write(
+    cls, source_bytes: bytes, verify_crc: bool
+) -> Tuple[int, int, Union[int, float]]:
+    _check_function_code(cls, source_bytes)
+    if len(source_bytes) < REGISTER_HEADER.size:
+        raise NotEnoughDataError()
+    slave_address, _, register = REGISTER_HEADER.unpack_from(source_bytes)
+    length = REGISTER_HEADER.size + _get_write_value_size(register) + CRC.size
+    data = _parse_fixed_length_frame(cls, source_bytes, length, verify_crc)
+    value_struct = utils.get_numeric_block_struct(register, 1)
+    return slave_address, register, value_struct.unpack_from(data, REGISTER_HEADER.size)[0]
+
+
+def _parse_boolean_value(value: int) -> bool:
+    if value == BOOLEAN_ON:
+        return True
+    elif value == BOOLEAN_OFF:
+        return False
+    raise InvalidDataError(f"Boolean data is not valid: {value:#06x}")
+
+
+def _encode_byte_count_frame(slave_address: int, function_code: int, data: bytes) -> bytes:
+    return _seal_frame(
+        BYTE_COUNT_HEADER.pack(slave_address, function_code, len(data)) + data
+    )
+
+
+def _parse_byte_count_frame(
+    cls, source_bytes: bytes, verify_crc: bool
+) -> Tuple[int, bytes]:
+    """
+    Parse address, function code, byte count, data and crc. Returns the address and
+    a copy of the data.
+    """
+    data = source_bytes
+    _check_function_code(cls, data)
+    if len(data) < BYTE_COUNT_HEADER.size:
+        raise NotEnoughDataError()
+    slave_address, _, data_length = BYTE_COUNT_HEADER.unpack_from(data)
+    if len(data) != data_length + MINIMAL_RESPONSE_SIZE:
+        raise InvalidLengthError("The message length is not correct")
+    if verify_crc and not frame_crc_is_valid(data):
+        raise InvalidCrcError()
+    return slave_address, bytes(data[3 : 3 + data_length])
+
+
+@_message
 class BooleanReadResponse:
     FUNCTION_CODE = 0x01
     slave_address: int
-    raw_data: bytearray = attr.ib(factory=bytearray)
+    raw_data: bytes = attr.ib(factory=bytes)
 
     @property
     def length(self):
         return len(self.raw_data)
 
     @classmethod
-    def from_bytes(cls, source_bytes):
-        data = bytearray(source_bytes)
-        slave_address = data.pop(0)
-        function_code = data.pop(0)
-        if function_code != cls.FUNCTION_CODE:
-            raise WrongFuntionCodeError(
-                f"Not a BooleanReadResponse: function code is {function_code!r} "
-                f"instead if {cls.FUNCTION_CODE}"
-            )
-        data_length = data.pop(0)
-        if len(data) != data_length + 2:  # data + crc
-            raise InvalidLengthError("The message length is not correct")
-        raw_data = data[:data_length]
-        crc = data[data_length:]
-
-        if not crc_is_valid(source_bytes[:-2], crc):
-            raise InvalidCrcError()
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        slave_address, raw_data = _parse_byte_count_frame(
+            cls, source_bytes, verify_crc
+        )
         return cls(slave_address, raw_data)
 
+    def to_bytes(self) -> bytes:
+        return _encode_byte_count_frame(
+            self.slave_address, self.FUNCTION_CODE, self.raw_data
+        )
+
 
-@attr.s(auto_attribs=True)
+@_message
 class NumericReadRequest:
     FUNCTION_CODE = 0x03
     slave_address: int
@@ -133,47 +345,44 @@ class NumericReadRequest:
     amount: int
 
     def to_bytes(self) -> bytes:
-        out = bytearray()
-        out.append(self.slave_address)
-        out.append(self.FUNCTION_CODE)
-        out.extend(self.start_register.to_bytes(2, "big"))
-        out.extend(self.amount.to_bytes(2, "big"))
+        return _encode_fixed_frame(
+            self.slave_address, self.FUNCTION_CODE, self.start_register, self.amount
+        )
 
-        return bytes(out) + calculate_crc(out)
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        return cls(*_parse_fixed_frame(cls, source_bytes, verify_crc))
 
+    def response_length(self) -> int:
+        return MINIMAL_RESPONSE_SIZE + self.amount * utils.get_numeric_value_size(
+            self.start_register
+        )
 
-@attr.s(auto_attribs=True)
+
+@_message
 class NumericReadResponse:
     FUNCTION_CODE = 0x03
     slave_address: int
-    raw_data: bytearray = attr.ib(factory=bytearray)
+    raw_data: bytes = attr.ib(factory=bytes)
 
     @property
     def length(self):
         return len(self.raw_data)
 
     @classmethod
-    def from_bytes(cls, source_bytes):
-        data = bytearray(source_bytes)
-        slave_address = data.pop(0)
-        function_code = data.pop(0)
-        if function_code != cls.FUNCTION_CODE:
-            raise WrongFuntionCodeError(
-                f"Not a BooleanReadResponse: function code is {function_code!r} "
-                f"instead if {cls.FUNCTION_CODE}"
-            )
-        data_length = data.pop(0)
-        if len(data) != data_length + 2:  # data + crc
-            raise InvalidLengthError("The message length is not correct")
-        raw_data = data[:data_length]
-        crc = data[data_length:]
-
-        if not crc_is_valid(source_bytes[:-2], crc):
-            raise InvalidCrcError()
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        slave_address, raw_data = _parse_byte_count_frame(
+            cls, source_bytes, verify_crc
+        )
         return cls(slave_address, raw_data)
 
+    def to_bytes(self) -> bytes:
+        return _encode_byte_count_frame(
+            self.slave_address, self.FUNCTION_CODE, self.raw_data
+        )
 
-@attr.s(auto_attribs=True)
+
+@_message
 class NumericWriteRequest:
     FUNCTION_CODE = 0x06
     slave_address: int
@@ -181,15 +390,19 @@ class NumericWriteRequest:
     value: Union[int, float]
 
     def to_bytes(self) -> bytes:
-        out = bytearray()
-        out.append(self.slave_address)
-        out.append(self.FUNCTION_CODE)
-        out.extend(self.register.to_bytes(2, "big"))
-        out.extend(utils.pack_numeric_data(self.register, self.value))
-        return bytes(out) + calculate_crc(out)
+        return _encode_numeric_write(
+            self.slave_address, self.FUNCTION_CODE, self.register, self.value
+        )
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        return cls(*_parse_numeric_write(cls, source_bytes, verify_crc))
 
+    def response_length(self) -> int:
+        return 6 + utils.get_numeric_value_size(self.register)
 
-@attr.s(auto_attribs=True)
+
+@_message
 class NumericWriteResponse:
     FUNCTION_CODE = 0x06
     slave_address: int
@@ -197,44 +410,234 @@ class NumericWriteResponse:
     value: Union[int, float]
 
     @classmethod
-    def from_bytes(cls, source_bytes: bytes):
-        data = bytearray(source_bytes)
-        slave_address = data.pop(0)
-        function_code = data.pop(0)
-        if function_code != cls.FUNCTION_CODE:
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        return cls(*_parse_numeric_write(cls, source_bytes, verify_crc))
+
+    def to_bytes(self) -> bytes:
+        return _encode_numeric_write(
+            self.slave_address, self.FUNCTION_CODE, self.register, self.value
+        )
+
+
+# Maximum data bytes in a multiple write request, 123 16-bit registers.
+MAX_MULTIPLE_WRITE_DATA_SIZE = 246
+MAX_MULTIPLE_WRITE_BOOLEANS = 1968
+
+
+def get_max_multiple_write_amount(register: int) -> int:
+    """
+    The most registers of the register's table that fit in one multiple write.
+    """
+    if utils.get_register_table(register) == utils.BOOLEAN_TABLE:
+        return MAX_MULTIPLE_WRITE_BOOLEANS
+    return MAX_MULTIPLE_WRITE_DATA_SIZE // utils.get_numeric_value_size(register)
+
+
+def _encode_multiple_write_request(
+    slave_address: int, function_code: int, start_register: int, amount: int, data: bytes
+) -> bytes:
+    return _seal_frame(
+        MULTIPLE_WRITE_HEADER.pack(
+            slave_address, function_code, start_register, amount, len(data)
+        )
+        + data
+    )
+
+
+def _parse_multiple_write_request(
+    cls, source_bytes: bytes, verify_crc: bool
+) -> Tuple[int, int, int, bytes]:
+    """
+    Returns address, start register, amount and the data.
+    """
+    _check_function_code(cls, source_bytes)
+    if len(source_bytes) < MULTIPLE_WRITE_HEADER.size:
+        raise NotEnoughDataError()
+    slave_address, _, start_register, amount, data_length = (
+        MULTIPLE_WRITE_HEADER.unpack_from(source_bytes)
+    )
+    data = _parse_fixed_length_frame(
+        cls, source_bytes, MULTIPLE_WRITE_HEADER.size + data_length + CRC.size, verify_crc
+    )
+    return slave_address, start_register, amount, data[MULTIPLE_WRITE_HEADER.size : -CRC.size]
+
+
+@_message
+class NumericMultipleWriteRequest:
+    """
+    Preset multiple registers. All registers must be in the same table.
+    """
+
+    FUNCTION_CODE = 0x10
+    slave_address: int
+    start_register: int
+    values: Tuple[Union[int, float], ...] = attr.ib(converter=tuple)
+
+    def to_bytes(self) -> bytes:
+        return _encode_multiple_write_request(
+            self.slave_address,
+            self.FUNCTION_CODE,
+            self.start_register,
+            len(self.values),
+            utils.pack_numeric_block(self.start_register, self.values),
+        )
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        slave_address, start_register, amount, data = _parse_multiple_write_request(
+            cls, source_bytes, verify_crc
+        )
+        if len(data) != amount * _get_write_value_size(start_register):
+            raise InvalidLengthError("Byte count doesn't match the register count")
+        values = utils.unpack_numeric_block(start_register, amount, data)
+        return cls(slave_address, start_register, values)
+
+    def response_length(self) -> int:
+        return 8
+
+
+@_message
+class BooleanMultipleWriteRequest:
+    """
+    Force multiple booleans.
+    """
+
+    FUNCTION_CODE = 0x0F
+    slave_address: int
+    start_register: int
+    values: Tuple[bool, ...] = attr.ib(converter=tuple)
+
+    def to_bytes(self) -> bytes:
+        return _encode_multiple_write_request(
+            self.slave_address,
+            self.FUNCTION_CODE,
+            self.start_register,
+            len(self.values),
+            utils.pack_booleans(self.values),
+        )
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        slave_address, start_register, amount, data = _parse_multiple_write_request(
+            cls, source_bytes, verify_crc
+        )
+        if len(data) != utils.number_of_bytes_containing_booleans(amount):
+            raise InvalidLengthError("Byte count doesn't match the boolean count")
+        values = utils.map_boolean_response(start_register, amount, data)
+        return cls(slave_address, start_register, values.values())
+
+    def response_length(self) -> int:
+        return 8
+
+
+def _parse_multiple_write_response(
+    cls, source_bytes: bytes, verify_crc: bool
+) -> Tuple[int, int, int]:
+    return _parse_fixed_frame(cls, source_bytes, verify_crc)
+
+
+def _encode_multiple_write_response(
+    slave_address: int, function_code: int, start_register: int, amount: int
+) -> bytes:
+    return _encode_fixed_frame(slave_address, function_code, start_register, amount)
+
+
+@_message
+class NumericMultipleWriteResponse:
+    FUNCTION_CODE = 0x10
+    slave_address: int
+    start_register: int
+    amount: int
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        return cls(*_parse_multiple_write_response(cls, source_bytes, verify_crc))
+
+    def to_bytes(self) -> bytes:
+        return _encode_multiple_write_response(
+            self.slave_address, self.FUNCTION_CODE, self.start_register, self.amount
+        )
+
+
+@_message
+class BooleanMultipleWriteResponse:
+    FUNCTION_CODE = 0x0F
+    slave_address: int
+    start_register: int
+    amount: int
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        return cls(*_parse_multiple_write_response(cls, source_bytes, verify_crc))
+
+    def to_bytes(self) -> bytes:
+        return _encode_multiple_write_response(
+            self.slave_address, self.FUNCTION_CODE, self.start_register, self.amount
+        )
+
+
+@_message
+class ExceptionResponse:
+    """
+    The slave could not handle the request. `function_code` is the function code of
+    the request.
+    """
+
+    slave_address: int
+    function_code: int
+    exception_code: int
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        data = source_bytes
+        if len(data) < 2:
+            raise NotEnoughDataError()
+        if not data[1] & EXCEPTION_FLAG:
             raise WrongFuntionCodeError(
-                f"Not a NumericWriteResponse: function code is {function_code!r} "
-                f"instead if {cls.FUNCTION_CODE}"
+                f"Not an ExceptionResponse: function code is {data[1]!r}"
             )
-        register = int.from_bytes(data[:2], "big")
-        register_size = utils.get_numeric_value_size(register)
-        raw_data = data[2 : 2 + register_size]
-        value = utils.unpack_numeric_data(register, raw_data)
-        crc = data[2 + register_size :]
-
-        if not crc_is_valid(source_bytes[:-2], crc):
+        if len(data) < MINIMAL_RESPONSE_SIZE:
+            raise NotEnoughDataError()
+        if len(data) != MINIMAL_RESPONSE_SIZE:
+            raise InvalidLengthError("The message length is not correct")
+        if verify_crc and not frame_crc_is_valid(data):
             raise InvalidCrcError()
-        return cls(slave_address, register, value)
+        slave_address, function_code, exception_code = BYTE_COUNT_HEADER.unpack_from(data)
+        return cls(slave_address, function_code & ~EXCEPTION_FLAG, exception_code)
+
+    def to_bytes(self) -> bytes:
+        return _seal_frame(
+            BYTE_COUNT_HEADER.pack(
+                self.slave_address,
+                self.function_code | EXCEPTION_FLAG,
+                self.exception_code,
+            )
+        )
+
+    def to_error(self) -> SlaveExceptionError:
+        return SlaveExceptionError(
+            f"Slave {self.slave_address} answered function code "
+            f"{self.function_code:#04x} with exception code {self.exception_code}",
+            self.function_code,
+            self.exception_code,
+        )
 
 
 @attr.s(auto_attribs=True)
 class StandardResponseFactory:
     @classmethod
-    def make_response_from_bytes(cls, data: bytes):
-        try:
-            if data[1] == 0x01:
-                return BooleanReadResponse.from_bytes(data)
-            elif data[1] == 0x03:
-                return NumericReadResponse.from_bytes(data)
-            elif data[1] == 0x05:
-                return BooleanWriteResponse.from_bytes(data)
-            elif data[1] == 0x06:
-                return NumericWriteResponse.from_bytes(data)
-        except IndexError:
+    def make_response_from_bytes(cls, data: bytes, verify_crc: bool = True):
+        if len(data) < 2:
             raise NotEnoughDataError()
+        if data[1] & EXCEPTION_FLAG:
+            return ExceptionResponse.from_bytes(data, verify_crc=verify_crc)
+        response_class = RESPONSE_CLASSES.get(data[1])
+        if response_class is None:
+            raise WrongFuntionCodeError(f"Unknown function code {data[1]!r}")
+        return response_class.from_bytes(data, verify_crc=verify_crc)
 
 
-@attr.s(auto_attribs=True)
+@_message
 class HistoryRequest:
     FUNCTION_CODE = 0x03
     slave_address: int
@@ -242,36 +645,143 @@ class HistoryRequest:
     index: int
 
     def to_bytes(self) -> bytes:
-        out = bytearray()
-        out.append(self.slave_address)
-        out.append(self.FUNCTION_CODE)
-        out.extend(self.table.to_bytes(2, 'big'))
-        out.extend(self.index.to_bytes(2, 'big'))
+        return _encode_fixed_frame(
+            self.slave_address, self.FUNCTION_CODE, self.table, self.index
+        )
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        return cls(*_parse_fixed_frame(cls, source_bytes, verify_crc))
 
-        return bytes(out) + calculate_crc(out)
+    def response_length(self, record_size: Optional[int] = None) -> int:
+        """
+        The record size depends on the items the device has configured for the
+        table. Without it only the minimal response length is known.
+        """
+        if record_size is None:
+            return MINIMAL_RESPONSE_SIZE
+        return MINIMAL_RESPONSE_SIZE + record_size
 
 
-@attr.s(auto_attribs=True)
+@_message
 class HistoryResponse:
     FUNCTION_CODE = 0x03
     slave_address: int
     raw_data: bytes
 
     @classmethod
-    def from_bytes(cls, source_bytes: bytes):
-        data = bytearray(source_bytes)
-        slave_address = data.pop(0)
-        function_code = data.pop(0)
-        if function_code != cls.FUNCTION_CODE:
-            raise WrongFuntionCodeError(
-                f"Not a HistoryResponse: function code is {function_code!r} "
-                f"instead if {cls.FUNCTION_CODE}"
-            )
-        data_length = data.pop(0)
-        raw_data = data[:data_length]
-        crc = data[data_length:]
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        slave_address, raw_data = _parse_byte_count_frame(
+            cls, source_bytes, verify_crc
+        )
+        return cls(slave_address, raw_data)
+
+    def to_bytes(self) -> bytes:
+        return _encode_byte_count_frame(
+            self.slave_address, self.FUNCTION_CODE, self.raw_data
+        )
+
+
+# Register of the event log, see `events.EVENT_REGISTER`.
+EVENT_REGISTER = 32
+
+
+@_message
+class EventRequest:
+    """
+    Read the next batch of unacknowledged events and alarms.
+    """
+
+    FUNCTION_CODE = 0x03
+    slave_address: int
+
+    def to_bytes(self) -> bytes:
+        return _encode_fixed_frame(
+            self.slave_address, self.FUNCTION_CODE, EVENT_REGISTER, 1
+        )
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        slave_address, register, _ = _parse_fixed_frame(cls, source_bytes, verify_crc)
+        if register != EVENT_REGISTER:
+            raise InvalidDataError("Not a read of the event register")
+        return cls(slave_address)
+
+    def response_length(self) -> int:
+        """
+        The number of events in the batch is not known, only the minimal length.
+        """
+        return MINIMAL_RESPONSE_SIZE
 
-        if not crc_is_valid(source_bytes[:-2], crc):
-            raise InvalidCrcError()
 
+@_message
+class EventResponse:
+    """
+    A batch of event records, no data when there are no more events.
+    """
+
+    FUNCTION_CODE = 0x03
+    slave_address: int
+    raw_data: bytes
+
+    @classmethod
+    def from_bytes(cls, source_bytes: bytes, verify_crc: bool = True):
+        slave_address, raw_data = _parse_byte_count_frame(
+            cls, source_bytes, verify_crc
+        )
         return cls(slave_address, raw_data)
+
+    def to_bytes(self) -> bytes:
+        return _encode_byte_count_frame(
+            self.slave_address, self.FUNCTION_CODE, self.raw_data
+        )
+
+
+@attr.s(auto_attribs=True)
+class StandardRequestFactory:
+    """
+    Parses requests, for the slave side. Function code 0x03 is an event request on
+    the event register and a history request when the register is not in a
+    numeric table.
+    """
+
+    @classmethod
+    def make_request_from_bytes(cls, data: bytes, verify_crc: bool = True):
+        if len(data) < 2:
+            raise NotEnoughDataError()
+        function_code = data[1]
+        if function_code == 0x03:
+            if len(data) < 4:
+                raise NotEnoughDataError()
+            register = (data[2] << 8) | data[3]
+            if register == EVENT_REGISTER:
+                request_class = EventRequest
+            else:
+                try:
+                    utils.get_numeric_value_size(register)
+                    request_class = NumericReadRequest
+                except ValueError:
+                    request_class = HistoryRequest
+        else:
+            request_class = REQUEST_CLASSES.get(function_code)
+        if request_class is None:
+            raise WrongFuntionCodeError(f"Unknown function code {function_code!r}")
+        return request_class.from_bytes(data, verify_crc=verify_crc)
+
+
+REQUEST_CLASSES = {
+    BooleanReadRequest.FUNCTION_CODE: BooleanReadRequest,
+    BooleanWriteRequest.FUNCTION_CODE: BooleanWriteRequest,
+    NumericWriteRequest.FUNCTION_CODE: NumericWriteRequest,
+    NumericMultipleWriteRequest.FUNCTION_CODE: NumericMultipleWriteRequest,
+    BooleanMultipleWriteRequest.FUNCTION_CODE: BooleanMultipleWriteRequest,
+}
+
+RESPONSE_CLASSES = {
+    BooleanReadResponse.FUNCTION_CODE: BooleanReadResponse,
+    NumericReadResponse.FUNCTION_CODE: NumericReadResponse,
+    BooleanWriteResponse.FUNCTION_CODE: BooleanWriteResponse,
+    NumericWriteResponse.FUNCTION_CODE: NumericWriteResponse,
+    NumericMultipleWriteResponse.FUNCTION_CODE: NumericMultipleWriteResponse,
+    BooleanMultipleWriteResponse.FUNCTION_CODE: BooleanMultipleWriteResponse,
+}
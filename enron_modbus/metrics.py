@@ -0,0 +1,173 @@
+import bisect
+import threading
+import attr
+from typing import *
+from enron_modbus import messages
+from enron_modbus.transports import TransportTimeoutError
+
+# Seconds. Covers a short frame at 115200 baud up to the default 5 s timeout.
+DEFAULT_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# (slave address, function code)
+MetricKey = Tuple[int, int]
+
+
+class TransactionObserver(Protocol):
+    """
+    What the client reports about each transaction. Implement this to hook the
+    client up to another metrics system.
+    """
+
+    def record_transaction(
+        self,
+        slave_address: int,
+        function_code: int,
+        duration: float,
+        bytes_sent: int,
+        bytes_received: int,
+        recv_calls: int,
+    ) -> None:
+        ...
+
+    def record_error(
+        self, slave_address: int, function_code: int, error: Exception
+    ) -> None:
+        ...
+
+    def record_retry(self, slave_address: int, function_code: int) -> None:
+        ...
+
+
+@attr.s(auto_attribs=True)
+class Histogram:
+    buckets: Tuple[float, ...] = attr.ib(default=DEFAULT_LATENCY_BUCKETS)
+    # counts[i] is the number of observations in (buckets[i - 1], buckets[i]], the
+    # last one those above the last bucket.
+    counts: List[int] = attr.ib(init=False)
+    sum: float = attr.ib(init=False, default=0.0)
+    count: int = attr.ib(init=False, default=0)
+
+    @counts.default
+    def _make_counts(self) -> List[int]:
+        return [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[int]:
+        result = []
+        total = 0
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+
+@attr.s(auto_attribs=True)
+class ClientMetrics:
+    """
+    Per slave and function code transaction metrics. Safe to share between clients
+    in different threads.
+    """
+
+    latency_buckets: Tuple[float, ...] = attr.ib(default=DEFAULT_LATENCY_BUCKETS)
+    latency: Dict[MetricKey, Histogram] = attr.ib(init=False, factory=dict)
+    bytes_sent: Dict[MetricKey, int] = attr.ib(init=False, factory=dict)
+    bytes_received: Dict[MetricKey, int] = attr.ib(init=False, factory=dict)
+    recv_calls: Dict[MetricKey, int] = attr.ib(init=False, factory=dict)
+    crc_failures: Dict[MetricKey, int] = attr.ib(init=False, factory=dict)
+    timeouts: Dict[MetricKey, int] = attr.ib(init=False, factory=dict)
+    errors: Dict[MetricKey, int] = attr.ib(init=False, factory=dict)
+    retries: Dict[MetricKey, int] = attr.ib(init=False, factory=dict)
+    _lock: threading.Lock = attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    def record_transaction(
+        self,
+        slave_address: int,
+        function_code: int,
+        duration: float,
+        bytes_sent: int,
+        bytes_received: int,
+        recv_calls: int,
+    ) -> None:
+        key = (slave_address, function_code)
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = Histogram(self.latency_buckets)
+                self.latency[key] = histogram
+            histogram.observe(duration)
+            _increment(self.bytes_sent, key, bytes_sent)
+            _increment(self.bytes_received, key, bytes_received)
+            _increment(self.recv_calls, key, recv_calls)
+
+    def record_error(
+        self, slave_address: int, function_code: int, error: Exception
+    ) -> None:
+        key = (slave_address, function_code)
+        with self._lock:
+            if isinstance(error, messages.InvalidCrcError):
+                _increment(self.crc_failures, key)
+            elif isinstance(error, TransportTimeoutError):
+                _increment(self.timeouts, key)
+            else:
+                _increment(self.errors, key)
+
+    def record_retry(self, slave_address: int, function_code: int) -> None:
+        with self._lock:
+            _increment(self.retries, (slave_address, function_code))
+
+    def to_prometheus(self, prefix: str = "enron_modbus") -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines: List[str] = []
+        with self._lock:
+            lines.append(
+                f"# HELP {prefix}_request_duration_seconds Request to response time."
+            )
+            lines.append(f"# TYPE {prefix}_request_duration_seconds histogram")
+            for key, histogram in sorted(self.latency.items()):
+                labels = _labels(key)
+                for bound, count in zip(
+                    histogram.buckets + (float("inf"),), histogram.cumulative_counts()
+                ):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(
+                        f'{prefix}_request_duration_seconds_bucket{{{labels},le="{le}"}} '
+                        f"{count}"
+                    )
+                lines.append(
+                    f"{prefix}_request_duration_seconds_sum{{{labels}}} {histogram.sum!r}"
+                )
+                lines.append(
+                    f"{prefix}_request_duration_seconds_count{{{labels}}} {histogram.count}"
+                )
+
+            for name, help_text, values in (
+                ("bytes_sent_total", "Bytes sent.", self.bytes_sent),
+                ("bytes_received_total", "Bytes received.", self.bytes_received),
+                ("recv_calls_total", "Transport recv calls.", self.recv_calls),
+                ("crc_failures_total", "Responses with an invalid CRC.", self.crc_failures),
+                ("timeouts_total", "Requests without a response in time.", self.timeouts),
+                ("errors_total", "Requests failed for other reasons.", self.errors),
+                ("retries_total", "Requests retried.", self.retries),
+            ):
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for key, value in sorted(values.items()):
+                    lines.append(f"{prefix}_{name}{{{_labels(key)}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _increment(counters: Dict[MetricKey, int], key: MetricKey, amount: int = 1) -> None:
+    counters[key] = counters.get(key, 0) + amount
+
+
+def _labels(key: MetricKey) -> str:
+    slave_address, function_code = key
+    return f'slave="{slave_address}",function="{function_code}"'
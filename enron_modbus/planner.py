@@ -0,0 +1,110 @@
+import attr
+from typing import *
+from enron_modbus import utils
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ReadBlock:
+    """
+    One read request covering `amount` registers from `start_register`.
+    """
+
+    table: int
+    start_register: int
+    amount: int
+
+    @property
+    def is_boolean(self) -> bool:
+        return self.table == utils.BOOLEAN_TABLE
+
+    @property
+    def registers(self) -> range:
+        return range(self.start_register, self.start_register + self.amount)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ReadPlan:
+    """
+    The block reads needed to get a set of registers. Make it once with
+    `ReadPlanner.plan` and execute it every poll.
+    """
+
+    registers: FrozenSet[int]
+    blocks: Tuple[ReadBlock, ...]
+
+    def execute(
+        self, client, slave_address: int
+    ) -> Dict[int, Union[bool, int, float]]:
+        """
+        Read all blocks and return the values of the planned registers. Registers
+        that were only read to fill a gap are left out.
+        """
+        result: Dict[int, Union[bool, int, float]] = dict()
+        for block in self.blocks:
+            if block.is_boolean:
+                data = client.read_booleans(
+                    slave_address, block.start_register, block.amount
+                )
+            else:
+                data = client.read_numerics(
+                    slave_address, block.start_register, block.amount
+                )
+            for register in block.registers:
+                if register in self.registers:
+                    result[register] = data[register]
+        return result
+
+
+@attr.s(auto_attribs=True)
+class ReadPlanner:
+    """
+    Coalesces scattered register reads into as few block reads as possible.
+
+    Registers are grouped per data table since a request can't span tables.
+    Neighbours are merged into one block when there are at most `max_gap` unwanted
+    registers between them and the response data stays within `max_frame_size`
+    bytes.
+    """
+
+    max_gap: int = attr.ib(default=4)
+    max_frame_size: int = attr.ib(default=250)
+
+    def max_amount(self, table: int) -> int:
+        if table == utils.BOOLEAN_TABLE:
+            return self.max_frame_size * 8
+        return self.max_frame_size // utils.get_numeric_value_size(table + 1)
+
+    def plan(self, registers: Iterable[int]) -> ReadPlan:
+        wanted = frozenset(registers)
+        tables: Dict[int, List[int]] = dict()
+        for register in wanted:
+            tables.setdefault(utils.get_register_table(register), []).append(register)
+
+        blocks: List[ReadBlock] = list()
+        for table in sorted(tables):
+            max_amount = self.max_amount(table)
+            if max_amount < 1:
+                raise ValueError(
+                    f"max_frame_size {self.max_frame_size} can't fit one value of "
+                    f"table {table}"
+                )
+            sorted_registers = sorted(tables[table])
+            start = end = sorted_registers[0]
+            for register in sorted_registers[1:]:
+                gap = register - end - 1
+                if gap <= self.max_gap and register - start < max_amount:
+                    end = register
+                else:
+                    blocks.append(ReadBlock(table, start, end - start + 1))
+                    start = end = register
+            blocks.append(ReadBlock(table, start, end - start + 1))
+
+        return ReadPlan(wanted, tuple(blocks))
+
+    def read(
+        self, client, slave_address: int, registers: Iterable[int]
+    ) -> Dict[int, Union[bool, int, float]]:
+        """
+        Plan and execute the reads for `registers` in one go.
+        """
+        return self.plan(registers).execute(client, slave_address)
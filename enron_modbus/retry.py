@@ -0,0 +1,179 @@
+import time
+import attr
+import structlog
+from typing import *
+from enron_modbus import messages
+from enron_modbus.transports import (
+    TransportTimeoutError,
+    get_character_time,
+    get_frame_silence,
+)
+
+LOG = structlog.get_logger()
+
+# Errors where asking again can help: nothing or garbage came back.
+RETRYABLE_ERRORS: Tuple[Type[Exception], ...] = (
+    TransportTimeoutError,
+    messages.EnronModbusParsingException,
+)
+
+
+class SlaveUnavailableError(Exception):
+    """The slave failed too often and is skipped for a while"""
+
+    def __init__(self, message: str, slave_address: int, retry_at: float):
+        super().__init__(message)
+        self.slave_address = slave_address
+        # time.monotonic() when the slave will be tried again.
+        self.retry_at = retry_at
+
+
+@attr.s(auto_attribs=True)
+class RoundTripEstimate:
+    """
+    Smoothed turnaround time of a slave and its variation, updated like TCP's
+    retransmission timer (RFC 6298). Turnaround is the round trip minus the time
+    the frames take on the wire.
+    """
+
+    smoothed: Optional[float] = None
+    variation: float = 0.0
+
+    def observe(self, sample: float, gain: float = 0.125, variation_gain: float = 0.25):
+        if self.smoothed is None:
+            self.smoothed = sample
+            self.variation = sample / 2
+            return
+        self.variation += variation_gain * (abs(self.smoothed - sample) - self.variation)
+        self.smoothed += gain * (sample - self.smoothed)
+
+
+@attr.s(auto_attribs=True)
+class _SlaveState:
+    estimate: RoundTripEstimate = attr.ib(factory=RoundTripEstimate)
+    consecutive_failures: int = 0
+    backoff: float = 0.0
+    unavailable_until: float = 0.0
+
+
+@attr.s(auto_attribs=True)
+class RetryPolicy:
+    """
+    Per slave timeouts and retries for a client. Use one policy per bus.
+
+    The timeout of a request is the time its request and response frames take on
+    the wire at `baudrate` (zero when None, e.g. Modbus TCP) plus the slave's
+    smoothed turnaround and four times its variation, kept between `min_timeout`
+    and `max_timeout`. Until a slave has answered the turnaround of all slaves on
+    the bus is used, and until any has answered `initial_timeout`. Each retry
+    doubles the timeout.
+
+    Timeouts and garbled responses are retried up to `max_attempts` requests in
+    total. After `failures_before_backoff` failed requests in a row the slave is
+    skipped, raising `SlaveUnavailableError`, for `min_backoff` seconds, doubling
+    up to `max_backoff` while it stays silent, so the other slaves on the bus keep
+    being polled. After the backoff one request with a single attempt probes it.
+    """
+
+    baudrate: Optional[int] = attr.ib(default=None)
+    max_attempts: int = attr.ib(default=3)
+    initial_timeout: float = attr.ib(default=1.0)
+    min_timeout: float = attr.ib(default=0.05)
+    max_timeout: float = attr.ib(default=5.0)
+    failures_before_backoff: int = attr.ib(default=3)
+    min_backoff: float = attr.ib(default=5.0)
+    max_backoff: float = attr.ib(default=300.0)
+    retryable_errors: Tuple[Type[Exception], ...] = attr.ib(default=RETRYABLE_ERRORS)
+    _slaves: Dict[int, _SlaveState] = attr.ib(init=False, factory=dict, repr=False)
+    _bus_estimate: RoundTripEstimate = attr.ib(
+        init=False, factory=RoundTripEstimate, repr=False
+    )
+
+    def _get_state(self, slave_address: int) -> _SlaveState:
+        slave_state = self._slaves.get(slave_address)
+        if slave_state is None:
+            slave_state = _SlaveState()
+            self._slaves[slave_address] = slave_state
+        return slave_state
+
+    def get_estimate(self, slave_address: int) -> RoundTripEstimate:
+        return self._get_state(slave_address).estimate
+
+    def get_wire_time(self, request_size: int, response_size: int) -> float:
+        if not self.baudrate:
+            return 0.0
+        return (request_size + response_size) * get_character_time(
+            self.baudrate
+        ) + 2 * get_frame_silence(self.baudrate)
+
+    def get_timeout(
+        self, slave_address: int, request_size: int, response_size: int, attempt: int = 0
+    ) -> float:
+        estimate = self._get_state(slave_address).estimate
+        if estimate.smoothed is None:
+            estimate = self._bus_estimate
+        if estimate.smoothed is None:
+            turnaround = self.initial_timeout
+        else:
+            turnaround = estimate.smoothed + 4 * estimate.variation
+        timeout = self.get_wire_time(request_size, response_size) + turnaround
+        timeout *= 2 ** attempt
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def get_attempts(self, slave_address: int) -> int:
+        """
+        Attempts for the next request. Raises `SlaveUnavailableError` while the
+        slave is backed off.
+        """
+        slave_state = self._get_state(slave_address)
+        if slave_state.backoff:
+            now = time.monotonic()
+            if now < slave_state.unavailable_until:
+                raise SlaveUnavailableError(
+                    f"Slave {slave_address} is not polled for "
+                    f"{slave_state.unavailable_until - now:.1f}s after failing",
+                    slave_address,
+                    slave_state.unavailable_until,
+                )
+            return 1
+        return self.max_attempts
+
+    def should_retry(self, error: Exception) -> bool:
+        return isinstance(error, self.retryable_errors)
+
+    def record_success(
+        self,
+        slave_address: int,
+        duration: float,
+        request_size: int,
+        response_size: int,
+        attempt: int,
+    ) -> None:
+        slave_state = self._get_state(slave_address)
+        if slave_state.backoff:
+            LOG.info("Slave is answering again", slave_address=slave_address)
+        slave_state.consecutive_failures = 0
+        slave_state.backoff = 0.0
+        # A response to a retry might be a late response to an earlier attempt, so
+        # only first attempts are timed (Karn's algorithm).
+        if attempt == 0:
+            turnaround = duration - self.get_wire_time(request_size, response_size)
+            turnaround = max(turnaround, 0.0)
+            slave_state.estimate.observe(turnaround)
+            self._bus_estimate.observe(turnaround)
+
+    def record_failure(self, slave_address: int) -> None:
+        slave_state = self._get_state(slave_address)
+        slave_state.consecutive_failures += 1
+        if slave_state.backoff:
+            slave_state.backoff = min(slave_state.backoff * 2, self.max_backoff)
+        elif slave_state.consecutive_failures >= self.failures_before_backoff:
+            slave_state.backoff = self.min_backoff
+        else:
+            return
+        slave_state.unavailable_until = time.monotonic() + slave_state.backoff
+        LOG.warning(
+            "Backing off unresponsive slave",
+            slave_address=slave_address,
+            backoff=slave_state.backoff,
+        )
@@ -0,0 +1,267 @@
+import threading
+import time
+import attr
+import structlog
+from typing import *
+from enron_modbus.planner import ReadPlan, ReadPlanner
+
+LOG = structlog.get_logger()
+
+
+@attr.s(auto_attribs=True, eq=False)
+class PollJob:
+    """
+    Read `registers` from a slave every `interval` seconds.
+
+    When the bus is busy, due jobs with a lower `priority` value go first and jobs
+    with the same priority go in the order they became due. A job that can't start
+    within `deadline` seconds (default: its interval) of when it was due skips the
+    cycle, which is reported as a missed cycle.
+    """
+
+    slave_address: int
+    registers: FrozenSet[int] = attr.ib(converter=frozenset)
+    interval: float
+    priority: int = attr.ib(default=0)
+    deadline: Optional[float] = attr.ib(default=None)
+    name: Optional[str] = attr.ib(default=None)
+
+    def get_deadline(self) -> float:
+        return self.interval if self.deadline is None else self.deadline
+
+
+@attr.s(auto_attribs=True)
+class PollResult:
+    job: PollJob
+    bus: str
+    due_at: float
+    started_at: float
+    finished_at: float
+    values: Dict[int, Union[bool, int, float]] = attr.ib(factory=dict)
+    error: Optional[Exception] = attr.ib(default=None)
+    # Cycles skipped since the previous poll of the job because it was too late.
+    missed_cycles: int = attr.ib(default=0)
+
+    @property
+    def latency(self) -> float:
+        """Seconds from when the poll was due until it started."""
+        return self.started_at - self.due_at
+
+
+@attr.s(auto_attribs=True)
+class BusStats:
+    polls: int = 0
+    errors: int = 0
+    connect_failures: int = 0
+    missed_cycles: int = 0
+    busy_time: float = 0.0
+
+
+@attr.s(auto_attribs=True, eq=False)
+class _ScheduledJob:
+    job: PollJob
+    plan: ReadPlan
+    due_at: float
+    missed_cycles: int = 0
+
+
+@attr.s(auto_attribs=True, eq=False)
+class BusWorker:
+    """
+    Runs the jobs of one bus, one request at a time, in its own thread.
+
+    The client is connected before the first poll. While it can't connect, polls
+    fail with the connect error and connecting is retried after
+    `reconnect_delay` seconds, doubling up to `max_reconnect_delay`.
+    """
+
+    name: str
+    client: Any
+    on_result: Callable[[PollResult], None]
+    stats: BusStats = attr.ib(factory=BusStats)
+    reconnect_delay: float = attr.ib(default=1.0)
+    max_reconnect_delay: float = attr.ib(default=60.0)
+    _connected: bool = attr.ib(init=False, default=False, repr=False)
+    _connect_error: Optional[Exception] = attr.ib(init=False, default=None, repr=False)
+    _reconnect_at: float = attr.ib(init=False, default=0.0, repr=False)
+    _next_reconnect_delay: Optional[float] = attr.ib(
+        init=False, default=None, repr=False
+    )
+    _jobs: List[_ScheduledJob] = attr.ib(init=False, factory=list, repr=False)
+    _condition: threading.Condition = attr.ib(
+        init=False, factory=threading.Condition, repr=False
+    )
+    _stopping: bool = attr.ib(init=False, default=False, repr=False)
+    _thread: Optional[threading.Thread] = attr.ib(init=False, default=None, repr=False)
+
+    def add_job(self, job: PollJob, plan: ReadPlan) -> None:
+        with self._condition:
+            self._jobs.append(_ScheduledJob(job, plan, time.monotonic()))
+            self._condition.notify()
+
+    def remove_job(self, job: PollJob) -> None:
+        with self._condition:
+            self._jobs = [scheduled for scheduled in self._jobs if scheduled.job is not job]
+
+    def start(self) -> None:
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self.run, name=f"enron-modbus-bus-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def request_stop(self) -> None:
+        """Stop after the poll in progress, without waiting for it."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self.request_stop()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run(self) -> None:
+        try:
+            while True:
+                scheduled = self._next_job()
+                if scheduled is None:
+                    return
+                self._poll(scheduled)
+        finally:
+            if self._connected:
+                self._connected = False
+                self.client.disconnect()
+
+    def _connect(self) -> None:
+        """
+        Connect the client if it isn't. Raises the last connect error until it's
+        time to try again.
+        """
+        if self._connected:
+            return
+        now = time.monotonic()
+        if self._connect_error is not None and now < self._reconnect_at:
+            raise self._connect_error
+        try:
+            self.client.connect()
+        except Exception as e:
+            delay = self._next_reconnect_delay or self.reconnect_delay
+            self._next_reconnect_delay = min(delay * 2, self.max_reconnect_delay)
+            self._connect_error = e
+            self._reconnect_at = now + delay
+            self.stats.connect_failures += 1
+            LOG.warning(
+                "Bus failed to connect", bus=self.name, error=e, retry_in=delay
+            )
+            raise
+        self._connected = True
+        self._connect_error = None
+        self._next_reconnect_delay = None
+
+    def _next_job(self) -> Optional[_ScheduledJob]:
+        """
+        Wait until a job is due and return the one to run. None when stopping.
+        """
+        with self._condition:
+            while not self._stopping:
+                now = time.monotonic()
+                self._skip_late_cycles(now)
+                due = [scheduled for scheduled in self._jobs if scheduled.due_at <= now]
+                if due:
+                    return min(
+                        due, key=lambda scheduled: (scheduled.job.priority, scheduled.due_at)
+                    )
+                next_due = min((scheduled.due_at for scheduled in self._jobs), default=None)
+                self._condition.wait(None if next_due is None else next_due - now)
+            return None
+
+    def _skip_late_cycles(self, now: float) -> None:
+        for scheduled in self._jobs:
+            late = now - scheduled.due_at
+            if late > scheduled.job.get_deadline():
+                cycles = int(late // scheduled.job.interval) or 1
+                scheduled.due_at += cycles * scheduled.job.interval
+                scheduled.missed_cycles += cycles
+                self.stats.missed_cycles += cycles
+                LOG.warning(
+                    "Poll job missed its deadline",
+                    bus=self.name,
+                    job=scheduled.job.name,
+                    slave_address=scheduled.job.slave_address,
+                    missed_cycles=cycles,
+                )
+
+    def _poll(self, scheduled: _ScheduledJob) -> None:
+        started_at = time.monotonic()
+        result = PollResult(
+            job=scheduled.job,
+            bus=self.name,
+            due_at=scheduled.due_at,
+            started_at=started_at,
+            finished_at=started_at,
+            missed_cycles=scheduled.missed_cycles,
+        )
+        try:
+            self._connect()
+            result.values = scheduled.plan.execute(
+                self.client, scheduled.job.slave_address
+            )
+        except Exception as e:
+            result.error = e
+            self.stats.errors += 1
+        result.finished_at = time.monotonic()
+        self.stats.polls += 1
+        self.stats.busy_time += result.finished_at - started_at
+
+        with self._condition:
+            scheduled.due_at += scheduled.job.interval
+            scheduled.missed_cycles = 0
+        try:
+            self.on_result(result)
+        except Exception:
+            LOG.exception("Poll result callback failed", bus=self.name)
+
+
+@attr.s(auto_attribs=True)
+class PollScheduler:
+    """
+    Polls many buses in parallel, each bus from its own thread so requests on a bus
+    are never interleaved. Bus work is waiting on I/O so threads scale with the
+    number of ports.
+
+    Results, including errors and missed cycles, are passed to `on_result` from
+    the bus threads. A bus that can't connect reports its polls failed with the
+    connect error and tries again with a backoff, see `BusWorker`.
+    """
+
+    on_result: Callable[[PollResult], None]
+    planner: ReadPlanner = attr.ib(factory=ReadPlanner)
+    buses: Dict[str, BusWorker] = attr.ib(init=False, factory=dict)
+
+    def add_bus(self, name: str, client) -> BusWorker:
+        if name in self.buses:
+            raise ValueError(f"Bus {name!r} already added")
+        worker = BusWorker(name, client, self.on_result)
+        self.buses[name] = worker
+        return worker
+
+    def add_job(self, bus: str, job: PollJob) -> None:
+        self.buses[bus].add_job(job, self.planner.plan(job.registers))
+
+    def remove_job(self, bus: str, job: PollJob) -> None:
+        self.buses[bus].remove_job(job)
+
+    def start(self) -> None:
+        for worker in self.buses.values():
+            worker.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        for worker in self.buses.values():
+            worker.request_stop()
+        for worker in self.buses.values():
+            worker.stop(timeout)
+
+    def get_stats(self) -> Dict[str, BusStats]:
+        return {name: worker.stats for name, worker in self.buses.items()}
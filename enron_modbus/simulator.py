@@ -0,0 +1,531 @@
+import argparse
+import array
+import asyncio
+import os
+import random
+import sys
+import time
+import attr
+import structlog
+from typing import *
+from enron_modbus import history, messages, utils
+from enron_modbus.async_transports import read_request_frame
+from enron_modbus.crc import calculate_crc
+from enron_modbus.transports import MBAP_HEADER, TransportTimeoutError
+
+LOG = structlog.get_logger()
+
+# Registers x001 to x999 in each table.
+TABLE_SIZE = 999
+
+
+def _make_table(typecode: str) -> array.array:
+    return array.array(typecode, bytes(TABLE_SIZE * array.array(typecode).itemsize))
+
+
+@attr.s(auto_attribs=True)
+class RegisterTables:
+    """
+    The four Enron Modbus data tables of a slave in compact storage: the booleans as
+    the bits of one int and the numerics in typed arrays.
+    """
+
+    booleans: int = attr.ib(default=0)
+    int16: array.array = attr.ib(factory=lambda: _make_table("h"))
+    int32: array.array = attr.ib(
+        factory=lambda: _make_table(utils.NUMERIC_TYPECODES[utils.INTEGER_32_TABLE])
+    )
+    float32: array.array = attr.ib(factory=lambda: _make_table("f"))
+
+    def _get_numeric_table(self, register: int) -> array.array:
+        table = utils.get_register_table(register)
+        if table == utils.INTEGER_16_TABLE:
+            return self.int16
+        elif table == utils.INTEGER_32_TABLE:
+            return self.int32
+        elif table == utils.FLOAT_32_TABLE:
+            return self.float32
+        raise ValueError(f"{register} is not a numeric register")
+
+    def get(self, register: int) -> Union[bool, int, float]:
+        if utils.get_register_table(register) == utils.BOOLEAN_TABLE:
+            return bool(self.booleans >> (register - 1001) & 1)
+        return self._get_numeric_table(register)[register % 1000 - 1]
+
+    def set(self, register: int, value: Union[bool, int, float]) -> None:
+        if utils.get_register_table(register) == utils.BOOLEAN_TABLE:
+            bit = 1 << (register - 1001)
+            if value:
+                self.booleans |= bit
+            else:
+                self.booleans &= ~bit
+        else:
+            self._get_numeric_table(register)[register % 1000 - 1] = value
+
+    def read_booleans(self, start_register: int, amount: int) -> bytes:
+        """
+        Booleans packed as in a read response, first register in the lowest bit.
+        """
+        _check_range(start_register, amount, utils.BOOLEAN_TABLE)
+        bits = (self.booleans >> (start_register - 1001)) & ((1 << amount) - 1)
+        return bits.to_bytes(utils.number_of_bytes_containing_booleans(amount), "little")
+
+    def read_numerics(self, start_register: int, amount: int) -> bytes:
+        """
+        Numerics encoded big endian as in a read response.
+        """
+        table = self._get_numeric_table(start_register)
+        _check_range(start_register, amount, utils.get_register_table(start_register))
+        offset = start_register % 1000 - 1
+        values = table[offset : offset + amount]
+        if sys.byteorder == "little":
+            values.byteswap()
+        return values.tobytes()
+
+
+def _check_range(start_register: int, amount: int, table: int) -> None:
+    if amount < 1 or start_register + amount - 1 > table + TABLE_SIZE:
+        raise ValueError(
+            f"Can't read {amount} registers from {start_register} in table {table}"
+        )
+
+
+@attr.s(auto_attribs=True)
+class HistoryRing:
+    """
+    History table as a ring of fixed size records in one preallocated buffer. The
+    newest record is at `current_index`, like the device's hourly/daily index.
+    """
+
+    table_size: int
+    record_size: int
+    current_index: int = attr.ib(default=-1)
+    buffer: bytearray = attr.ib(init=False, repr=False)
+
+    @buffer.default
+    def _make_buffer(self) -> bytearray:
+        return bytearray(self.table_size * self.record_size)
+
+    def __len__(self) -> int:
+        return self.table_size
+
+    def __getitem__(self, index: int) -> bytes:
+        if not 0 <= index < self.table_size:
+            raise IndexError(index)
+        start = index * self.record_size
+        return bytes(self.buffer[start : start + self.record_size])
+
+    def append(self, record: bytes) -> int:
+        if len(record) != self.record_size:
+            raise ValueError(f"Record must be {self.record_size} bytes")
+        self.current_index = (self.current_index + 1) % self.table_size
+        start = self.current_index * self.record_size
+        self.buffer[start : start + self.record_size] = record
+        return self.current_index
+
+    @classmethod
+    def synthetic(
+        cls,
+        schema: history.HistorySchema,
+        table_size: int,
+        records: int,
+        end_timestamp: Optional[float] = None,
+        period: float = 3600,
+        seed: int = 0,
+    ) -> "HistoryRing":
+        """
+        A ring filled with `records` records of random item values, one every
+        `period` seconds up to `end_timestamp`.
+        """
+        ring = cls(table_size, schema.record_size)
+        rng = random.Random(seed)
+        end_timestamp = time.time() if end_timestamp is None else end_timestamp
+        end_timestamp -= end_timestamp % period
+        for number in range(records):
+            date, clock = history.timestamp_to_date_and_time(
+                end_timestamp - (records - 1 - number) * period
+            )
+            values = [
+                rng.uniform(0, 1000)
+                if utils.get_register_table(register) == utils.FLOAT_32_TABLE
+                else rng.randrange(0, 30000)
+                for register in schema.item_registers
+            ]
+            ring.append(schema.record_struct.pack(date, clock, *values))
+        return ring
+
+
+@attr.s(auto_attribs=True)
+class SimulatedSlave:
+    """
+    Answers requests like a slave device would, from its register tables and
+    history records.
+    """
+
+    slave_address: int
+    tables: RegisterTables = attr.ib(factory=RegisterTables)
+    # Records per history table register, a `HistoryRing` or a list of records.
+    history: Dict[int, Sequence[bytes]] = attr.ib(factory=dict)
+    # Numeric register holding the current index of a history table.
+    history_index_registers: Dict[int, int] = attr.ib(factory=dict)
+    # Answer 0x0F and 0x10 with an illegal function exception, like older devices.
+    supports_multiple_writes: bool = attr.ib(default=True)
+    # Encoded records of the event log, oldest first, see `events.encode_event`.
+    events: List[bytes] = attr.ib(factory=list)
+    events_per_read: int = attr.ib(default=10)
+    _events_sent: int = attr.ib(init=False, default=0, repr=False)
+
+    def append_history(self, table: int, record: bytes) -> int:
+        """
+        Add a record to a `HistoryRing` table and update its index register.
+        """
+        index = cast(HistoryRing, self.history[table]).append(record)
+        for register, indexed_table in self.history_index_registers.items():
+            if indexed_table == table:
+                self.tables.set(register, index)
+        return index
+
+    def handle(self, request):
+        if isinstance(request, messages.EventRequest):
+            batch = self.events[: self.events_per_read]
+            self._events_sent = len(batch)
+            return messages.EventResponse(self.slave_address, b"".join(batch))
+        elif (
+            isinstance(request, messages.BooleanWriteRequest)
+            and request.register == messages.EVENT_REGISTER
+        ):
+            del self.events[: self._events_sent]
+            self._events_sent = 0
+            return messages.BooleanWriteResponse(
+                self.slave_address, request.register, request.value
+            )
+        elif isinstance(request, messages.BooleanReadRequest):
+            return messages.BooleanReadResponse(
+                self.slave_address,
+                self.tables.read_booleans(request.start_register, request.amount),
+            )
+        elif isinstance(request, messages.NumericReadRequest):
+            return messages.NumericReadResponse(
+                self.slave_address,
+                self.tables.read_numerics(request.start_register, request.amount),
+            )
+        elif isinstance(request, messages.BooleanWriteRequest):
+            self.tables.set(request.register, request.value)
+            return messages.BooleanWriteResponse(
+                self.slave_address, request.register, request.value
+            )
+        elif isinstance(request, messages.NumericWriteRequest):
+            self.tables.set(request.register, request.value)
+            return messages.NumericWriteResponse(
+                self.slave_address, request.register, self.tables.get(request.register)
+            )
+        elif isinstance(request, messages.HistoryRequest):
+            return messages.HistoryResponse(
+                self.slave_address, self.history[request.table][request.index]
+            )
+        elif isinstance(
+            request,
+            (messages.NumericMultipleWriteRequest, messages.BooleanMultipleWriteRequest),
+        ):
+            if not self.supports_multiple_writes:
+                return messages.ExceptionResponse(
+                    self.slave_address, request.FUNCTION_CODE, messages.ILLEGAL_FUNCTION
+                )
+            for number, value in enumerate(request.values):
+                self.tables.set(request.start_register + number, value)
+            if isinstance(request, messages.NumericMultipleWriteRequest):
+                response_class = messages.NumericMultipleWriteResponse
+            else:
+                response_class = messages.BooleanMultipleWriteResponse
+            return response_class(
+                self.slave_address, request.start_register, len(request.values)
+            )
+        raise ValueError(f"Can't handle {request!r}")
+
+    def handle_frame(self, frame: bytes) -> bytes:
+        """
+        Requests for registers or history records the slave doesn't have are
+        answered with an illegal data address exception.
+        """
+        request = messages.StandardRequestFactory.make_request_from_bytes(frame)
+        try:
+            response = self.handle(request)
+        except (ValueError, LookupError):
+            response = messages.ExceptionResponse(
+                self.slave_address, frame[1], messages.ILLEGAL_DATA_ADDRESS
+            )
+        return response.to_bytes()
+
+
+@attr.s(auto_attribs=True)
+class LoopbackTransport:
+    """
+    In-memory transport answered by simulated slaves. Requests to addresses without
+    a slave time out, like on a real bus. `chunk_size` limits how much each `recv`
+    returns, to exercise partial reads.
+    """
+
+    slaves: Dict[int, SimulatedSlave] = attr.ib(factory=dict)
+    chunk_size: Optional[int] = attr.ib(default=None)
+    _pending: bytes = attr.ib(init=False, default=b"", repr=False)
+
+    def add_slave(self, slave: SimulatedSlave) -> SimulatedSlave:
+        self.slaves[slave.slave_address] = slave
+        return slave
+
+    def connect(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        self._pending = b""
+
+    def set_timeout(self, timeout: float) -> None:
+        pass
+
+    def send(self, data: bytes) -> None:
+        slave = self.slaves.get(data[0])
+        self._pending = slave.handle_frame(data) if slave else b""
+
+    def recv(self, size: int) -> bytes:
+        if not self._pending:
+            raise TransportTimeoutError("No response from simulated slave")
+        if self.chunk_size:
+            size = min(size, self.chunk_size)
+        result, self._pending = self._pending[:size], self._pending[size:]
+        return result
+
+
+@attr.s(auto_attribs=True)
+class SimulatedBus:
+    """
+    The slaves on one bus and how the bus misbehaves: `latency` seconds before each
+    response, a `drop_rate` share of requests not answered and a `corrupt_rate`
+    share answered with a bad crc. Modbus TCP has no crc, a bus with a
+    `corrupt_rate` can't be served over it.
+    """
+
+    slaves: Dict[int, SimulatedSlave] = attr.ib(factory=dict)
+    latency: float = attr.ib(default=0.0)
+    drop_rate: float = attr.ib(default=0.0)
+    corrupt_rate: float = attr.ib(default=0.0)
+    rng: random.Random = attr.ib(factory=random.Random, repr=False)
+    requests: int = attr.ib(default=0)
+
+    @classmethod
+    def with_slaves(cls, slave_addresses: Iterable[int], **kwargs) -> "SimulatedBus":
+        return cls(
+            {address: SimulatedSlave(address) for address in slave_addresses}, **kwargs
+        )
+
+    def handle_frame(self, frame: bytes) -> Optional[bytes]:
+        """
+        The response to a request frame or None if there is no response.
+        """
+        self.requests += 1
+        slave = self.slaves.get(frame[0])
+        if slave is None:
+            return None
+        if self.drop_rate and self.rng.random() < self.drop_rate:
+            return None
+        try:
+            response = slave.handle_frame(frame)
+        except messages.EnronModbusParsingException as e:
+            LOG.debug("Simulated slave can't parse request", frame=frame, error=e)
+            return None
+        if self.corrupt_rate and self.rng.random() < self.corrupt_rate:
+            response = response[:-1] + bytes([response[-1] ^ 0xFF])
+        return response
+
+    async def respond(self, frame: bytes) -> Optional[bytes]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.handle_frame(frame)
+
+
+@attr.s(auto_attribs=True)
+class SimulatorServer:
+    """
+    Serves a `SimulatedBus` over TCP, as RTU frames or Modbus TCP, and over pseudo
+    terminals. Run several servers, or one per port, to simulate many buses.
+    """
+
+    bus: SimulatedBus
+    _servers: List[asyncio.AbstractServer] = attr.ib(init=False, factory=list, repr=False)
+    _ptys: List[Tuple[int, int]] = attr.ib(init=False, factory=list, repr=False)
+    # Responses being prepared. The loop only keeps weak references to tasks.
+    _tasks: Set[asyncio.Task] = attr.ib(init=False, factory=set, repr=False)
+
+    async def serve_tcp(
+        self, host: str = "127.0.0.1", port: int = 0, modbus_tcp: bool = False
+    ) -> int:
+        """
+        Start listening and return the port. With `modbus_tcp` requests and
+        responses have an MBAP header instead of a crc.
+        """
+        if modbus_tcp and self.bus.corrupt_rate:
+            raise ValueError("Modbus TCP responses have no crc to corrupt")
+        handler = self._handle_modbus_tcp if modbus_tcp else self._handle_rtu
+        server = await asyncio.start_server(handler, host, port)
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def serve_pty(self) -> str:
+        """
+        Create a pseudo terminal answering like a serial bus and return the path to
+        open with a serial transport. Only on POSIX systems.
+        """
+        import tty
+
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        os.set_blocking(master, False)
+        self._ptys.append((master, slave))
+        buffer = bytearray()
+        loop = asyncio.get_running_loop()
+
+        def on_readable():
+            try:
+                buffer.extend(os.read(master, 4096))
+            except BlockingIOError:
+                return
+            while buffer:
+                try:
+                    length = messages.get_request_frame_length(buffer)
+                except messages.EnronModbusParsingException:
+                    # Out of sync. Drop what we have, the client will time out.
+                    buffer.clear()
+                    return
+                if length is None or len(buffer) < length:
+                    return
+                frame = bytes(buffer[:length])
+                del buffer[:length]
+                self._spawn(self._respond_pty(master, frame))
+
+        loop.add_reader(master, on_readable)
+        return os.ttyname(slave)
+
+    def _spawn(self, coroutine: Awaitable[None]) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._forget_task)
+
+    def _forget_task(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            LOG.warning("Simulator failed to respond", error=task.exception())
+
+    async def _respond_pty(self, master: int, frame: bytes) -> None:
+        response = await self.bus.respond(frame)
+        if response:
+            os.write(master, response)
+
+    async def _handle_rtu(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                frame = await read_request_frame(reader)
+                response = await self.bus.respond(frame)
+                if response:
+                    writer.write(response)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except messages.EnronModbusParsingException as e:
+            LOG.debug("Closing connection sending invalid frames", error=e)
+        finally:
+            writer.close()
+
+    async def _handle_modbus_tcp(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        async def respond(transaction_id: int, frame: bytes) -> None:
+            response = await self.bus.respond(frame)
+            if response:
+                writer.write(
+                    MBAP_HEADER.pack(transaction_id, 0, len(response) - 2, response[0])
+                    + response[1:-2]
+                )
+
+        try:
+            while True:
+                header = await reader.readexactly(MBAP_HEADER.size)
+                transaction_id, _, length, unit_id = MBAP_HEADER.unpack(header)
+                pdu = await reader.readexactly(length - 1)
+                frame = bytes([unit_id]) + pdu
+                # Requests on a Modbus TCP connection may be pipelined.
+                self._spawn(respond(transaction_id, frame + calculate_crc(frame)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers.clear()
+        loop = asyncio.get_running_loop()
+        for master, slave in self._ptys:
+            loop.remove_reader(master)
+            os.close(master)
+            os.close(slave)
+        self._ptys.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _parse_addresses(value: str) -> List[int]:
+    addresses: List[int] = []
+    for part in value.split(","):
+        first, _, last = part.partition("-")
+        addresses.extend(range(int(first), int(last or first) + 1))
+    return addresses
+
+
+async def _main(arguments: argparse.Namespace) -> None:
+    servers = []
+    for number in range(arguments.buses):
+        bus = SimulatedBus.with_slaves(
+            _parse_addresses(arguments.slaves),
+            latency=arguments.latency,
+            drop_rate=arguments.drop_rate,
+            corrupt_rate=arguments.corrupt_rate,
+        )
+        server = SimulatorServer(bus)
+        servers.append(server)
+        if arguments.pty:
+            print(f"bus {number}: {server.serve_pty()}")
+        else:
+            port = await server.serve_tcp(
+                arguments.host,
+                arguments.port + number if arguments.port else 0,
+                arguments.modbus_tcp,
+            )
+            print(f"bus {number}: {arguments.host}:{port}")
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulated Enron Modbus slaves")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="First port, one per bus")
+    parser.add_argument("--modbus-tcp", action="store_true", help="MBAP instead of RTU")
+    parser.add_argument("--pty", action="store_true", help="Pseudo terminals, not TCP")
+    parser.add_argument("--buses", type=int, default=1)
+    parser.add_argument("--slaves", default="1-247", help="Addresses, like 1-10,20")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--corrupt-rate", type=float, default=0.0)
+    arguments = parser.parse_args()
+    if arguments.modbus_tcp and arguments.corrupt_rate:
+        parser.error("--corrupt-rate needs a crc, it can't be used with --modbus-tcp")
+    try:
+        asyncio.run(_main(arguments))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
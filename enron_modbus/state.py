@@ -33,6 +33,7 @@ class EnronModbusLocalProtocolError(Exception):
 IDLE = make_sentinel("IDLE")
 AWAITING_RESPONSE = make_sentinel("AWAITING_RESPONSE")
 AWAITING_HISTORY_RESPONSE = make_sentinel("AWAITING_HISTORY_RESPONSE")
+AWAITING_EVENT_RESPONSE = make_sentinel("AWAITING_EVENT_RESPONSE")
 
 NEED_DATA = make_sentinel("NEED_DATA")
 
@@ -42,16 +43,27 @@ ENRON_MODBUS_STATE_TRANSITIONS = {
         messages.BooleanReadRequest: AWAITING_RESPONSE,
         messages.BooleanWriteRequest: AWAITING_RESPONSE,
         messages.NumericWriteRequest: AWAITING_RESPONSE,
-        messages.HistoryRequest: AWAITING_HISTORY_RESPONSE
+        messages.NumericMultipleWriteRequest: AWAITING_RESPONSE,
+        messages.BooleanMultipleWriteRequest: AWAITING_RESPONSE,
+        messages.HistoryRequest: AWAITING_HISTORY_RESPONSE,
+        messages.EventRequest: AWAITING_EVENT_RESPONSE
     },
     AWAITING_RESPONSE: {
         messages.NumericReadResponse: IDLE,
         messages.BooleanReadResponse: IDLE,
         messages.BooleanWriteResponse: IDLE,
-        messages.NumericWriteResponse: IDLE
+        messages.NumericWriteResponse: IDLE,
+        messages.NumericMultipleWriteResponse: IDLE,
+        messages.BooleanMultipleWriteResponse: IDLE,
+        messages.ExceptionResponse: IDLE
     },
     AWAITING_HISTORY_RESPONSE: {
-        messages.HistoryResponse: IDLE
+        messages.HistoryResponse: IDLE,
+        messages.ExceptionResponse: IDLE
+    },
+    AWAITING_EVENT_RESPONSE: {
+        messages.EventResponse: IDLE,
+        messages.ExceptionResponse: IDLE
     }
 }
 
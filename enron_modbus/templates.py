@@ -0,0 +1,116 @@
+import struct
+import attr
+from typing import *
+from enron_modbus import messages, utils
+from enron_modbus.planner import ReadBlock, ReadPlan, ReadPlanner
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class CompiledRead:
+    """
+    One block read with its request frame, crc included, encoded up front.
+    `wanted` holds (position in the block, register) of the registers to return.
+    """
+
+    request: Union[messages.BooleanReadRequest, messages.NumericReadRequest]
+    frame: bytes
+    response_length: int
+    wanted: Tuple[Tuple[int, int], ...]
+    # Unpacks all values of a numeric block. None for booleans.
+    values_struct: Optional[struct.Struct]
+
+    @classmethod
+    def from_block(
+        cls, slave_address: int, block: ReadBlock, registers: FrozenSet[int]
+    ) -> "CompiledRead":
+        request: Union[messages.BooleanReadRequest, messages.NumericReadRequest]
+        if block.is_boolean:
+            request = messages.BooleanReadRequest(
+                slave_address, block.start_register, block.amount
+            )
+            values_struct = None
+        else:
+            request = messages.NumericReadRequest(
+                slave_address, block.start_register, block.amount
+            )
+            values_struct = utils.get_numeric_block_struct(
+                block.start_register, block.amount
+            )
+        return cls(
+            request,
+            request.to_bytes(),
+            request.response_length(),
+            tuple(
+                (position, register)
+                for position, register in enumerate(block.registers)
+                if register in registers
+            ),
+            values_struct,
+        )
+
+    def decode_into(
+        self, raw_data: bytes, result: Dict[int, Union[bool, int, float]]
+    ) -> None:
+        if self.values_struct is None:
+            bits = int.from_bytes(raw_data, "little")
+            for position, register in self.wanted:
+                result[register] = bool(bits >> position & 1)
+        else:
+            values = self.values_struct.unpack_from(raw_data)
+            for position, register in self.wanted:
+                result[register] = values[position]
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class PollTemplate:
+    """
+    A recurring poll of a slave compiled once: the block reads of a `ReadPlan` with
+    their request frames encoded, the response lengths known and the decoding of
+    each response set up. Executing it builds no requests and computes no request
+    crcs.
+    """
+
+    slave_address: int
+    reads: Tuple[CompiledRead, ...]
+
+    @classmethod
+    def from_plan(cls, slave_address: int, plan: ReadPlan) -> "PollTemplate":
+        return cls(
+            slave_address,
+            tuple(
+                CompiledRead.from_block(slave_address, block, plan.registers)
+                for block in plan.blocks
+            ),
+        )
+
+    @classmethod
+    def compile(
+        cls,
+        slave_address: int,
+        registers: Iterable[int],
+        planner: Optional[ReadPlanner] = None,
+    ) -> "PollTemplate":
+        planner = planner or ReadPlanner()
+        return cls.from_plan(slave_address, planner.plan(registers))
+
+    def execute(self, client) -> Dict[int, Union[bool, int, float]]:
+        """
+        Make the reads with an `EnronModbusClient` and return the register values.
+        """
+        result: Dict[int, Union[bool, int, float]] = dict()
+        for read in self.reads:
+            response = client.make_request(read.request, read.response_length, read.frame)
+            read.decode_into(response.raw_data, result)
+        return result
+
+    async def execute_async(self, client) -> Dict[int, Union[bool, int, float]]:
+        """
+        `execute` with an `AsyncEnronModbusClient`.
+        """
+        result: Dict[int, Union[bool, int, float]] = dict()
+        for read in self.reads:
+            response = await client.make_request(
+                read.request, read.response_length, read.frame
+            )
+            read.decode_into(response.raw_data, result)
+        return result
@@ -0,0 +1,281 @@
+import array
+import bisect
+import time
+import attr
+from typing import *
+from enron_modbus import utils
+
+# Values of boolean registers are stored as 0 and 1.
+BOOLEAN_TYPECODE = "B"
+
+
+def get_value_typecode(register: int) -> str:
+    """
+    array typecode holding the values of the register's table.
+    """
+    table = utils.get_register_table(register)
+    if table == utils.BOOLEAN_TABLE:
+        return BOOLEAN_TYPECODE
+    return utils.NUMERIC_TYPECODES[table]
+
+
+def _make_array(typecode: str, length: int) -> array.array:
+    return array.array(typecode, bytes(array.array(typecode).itemsize * length))
+
+
+@attr.s(auto_attribs=True)
+class Downsampled:
+    """
+    Samples aggregated per time bucket, one typed array per column. `timestamps`
+    are the bucket starts. Buckets without samples are left out.
+    """
+
+    timestamps: array.array
+    minimums: array.array
+    maximums: array.array
+    means: array.array
+    counts: array.array
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """
+        Columns as NumPy arrays sharing memory with the typed arrays.
+        """
+        import numpy  # type: ignore
+
+        return {
+            name: numpy.frombuffer(values, dtype=values.typecode)
+            for name, values in (
+                ("timestamp", self.timestamps),
+                ("min", self.minimums),
+                ("max", self.maximums),
+                ("mean", self.means),
+                ("count", self.counts),
+            )
+        }
+
+
+@attr.s(auto_attribs=True)
+class SampleRing:
+    """
+    The last `capacity` samples of one register. Timestamps and values live in
+    typed arrays allocated up front, so appending allocates nothing and the oldest
+    sample is overwritten once the ring is full. Timestamps must not decrease.
+    """
+
+    capacity: int
+    typecode: str = attr.ib(default="d")
+    timestamps: array.array = attr.ib(init=False, repr=False)
+    values: array.array = attr.ib(init=False, repr=False)
+    _next: int = attr.ib(init=False, default=0, repr=False)
+    _count: int = attr.ib(init=False, default=0, repr=False)
+
+    def __attrs_post_init__(self):
+        if self.capacity < 1:
+            raise ValueError(f"Capacity must be positive, not {self.capacity}")
+        self.timestamps = _make_array("d", self.capacity)
+        self.values = _make_array(self.typecode, self.capacity)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Tuple[float, Union[int, float]]]:
+        for begin, end in self._ranges():
+            yield from zip(self.timestamps[begin:end], self.values[begin:end])
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.timestamps.itemsize + self.values.itemsize
+        ) * self.capacity
+
+    def append(self, timestamp: float, value: Union[bool, int, float]) -> None:
+        position = self._next
+        # Position - 1 is the last slot of the array when position is 0, which is
+        # where the previous sample is once the ring has wrapped.
+        if self._count and timestamp < self.timestamps[position - 1]:
+            raise ValueError(
+                f"Sample at {timestamp} is older than the last sample at "
+                f"{self.timestamps[position - 1]}"
+            )
+        self.timestamps[position] = timestamp
+        self.values[position] = value
+        position += 1
+        self._next = 0 if position == self.capacity else position
+        if self._count < self.capacity:
+            self._count += 1
+
+    def latest(self) -> Optional[Tuple[float, Union[int, float]]]:
+        if not self._count:
+            return None
+        return self.timestamps[self._next - 1], self.values[self._next - 1]
+
+    def _ranges(self) -> List[Tuple[int, int]]:
+        """
+        Array slices holding the samples, oldest first.
+        """
+        if self._count < self.capacity or self._next == 0:
+            return [(0, self._count)]
+        return [(self._next, self.capacity), (0, self._next)]
+
+    def _window_ranges(
+        self, start: Optional[float], end: Optional[float]
+    ) -> List[Tuple[int, int]]:
+        """
+        Array slices holding the samples with start <= timestamp < end.
+        """
+        ranges = []
+        for begin, stop in self._ranges():
+            if start is not None:
+                begin = bisect.bisect_left(self.timestamps, start, begin, stop)
+            if end is not None:
+                stop = bisect.bisect_left(self.timestamps, end, begin, stop)
+            if begin < stop:
+                ranges.append((begin, stop))
+        return ranges
+
+    def downsample(
+        self,
+        interval: float,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Downsampled:
+        """
+        Min, max and mean of the samples in each `interval` seconds long bucket,
+        optionally only of the samples with start <= timestamp < end. Buckets are
+        aligned to multiples of `interval`.
+        """
+        if interval <= 0:
+            raise ValueError(f"Interval must be positive, not {interval}")
+        result = Downsampled(
+            array.array("d"),
+            array.array("d"),
+            array.array("d"),
+            array.array("d"),
+            array.array("l"),
+        )
+        timestamps = memoryview(self.timestamps)
+        values = memoryview(self.values)
+        bucket = None
+        minimum = maximum = total = 0
+        count = 0
+        for begin, stop in self._window_ranges(start, end):
+            for timestamp, value in zip(timestamps[begin:stop], values[begin:stop]):
+                sample_bucket = timestamp // interval
+                if sample_bucket != bucket:
+                    if count:
+                        self._add_bucket(
+                            result, bucket * interval, minimum, maximum, total, count
+                        )
+                    bucket = sample_bucket
+                    minimum = maximum = total = value
+                    count = 1
+                    continue
+                if value < minimum:
+                    minimum = value
+                elif value > maximum:
+                    maximum = value
+                total += value
+                count += 1
+        if count:
+            self._add_bucket(result, bucket * interval, minimum, maximum, total, count)
+        return result
+
+    @staticmethod
+    def _add_bucket(
+        result: Downsampled,
+        timestamp: float,
+        minimum: Union[int, float],
+        maximum: Union[int, float],
+        total: Union[int, float],
+        count: int,
+    ) -> None:
+        result.timestamps.append(timestamp)
+        result.minimums.append(minimum)
+        result.maximums.append(maximum)
+        result.means.append(total / count)
+        result.counts.append(count)
+
+    def to_numpy(self) -> Tuple[Any, Any]:
+        """
+        Timestamps and values as NumPy arrays, oldest first. Until the ring has
+        wrapped, and whenever the newest sample is in its last slot, these are
+        views sharing memory with the ring. Otherwise its two halves are copied
+        into new arrays.
+        """
+        import numpy  # type: ignore
+
+        timestamps = numpy.frombuffer(self.timestamps, dtype="d")
+        values = numpy.frombuffer(self.values, dtype=self.typecode)
+        ranges = self._ranges()
+        if len(ranges) == 1:
+            begin, end = ranges[0]
+            return timestamps[begin:end], values[begin:end]
+        return (
+            numpy.concatenate([timestamps[begin:end] for begin, end in ranges]),
+            numpy.concatenate([values[begin:end] for begin, end in ranges]),
+        )
+
+
+# (slave address, register)
+SampleKey = Tuple[int, int]
+
+
+@attr.s(auto_attribs=True)
+class SampleStore:
+    """
+    Polled values kept per (slave, register) in `SampleRing`s of `capacity`
+    samples, e.g. 86400 for a day of samples taken every second. Rings are made
+    on the first sample of a register, typed for its data table.
+
+    `add` takes the results of `read_numerics`, `read_booleans` and
+    `PollTemplate.execute` as they are, also as `utils.NumericArray` or
+    `utils.BooleanBits`.
+    """
+
+    capacity: int
+    clock: Callable[[], float] = attr.ib(default=time.time, repr=False)
+    _rings: Dict[SampleKey, SampleRing] = attr.ib(init=False, factory=dict, repr=False)
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    def __contains__(self, key: SampleKey) -> bool:
+        return key in self._rings
+
+    def __getitem__(self, key: SampleKey) -> SampleRing:
+        return self._rings[key]
+
+    def keys(self) -> KeysView[SampleKey]:
+        return self._rings.keys()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(ring.nbytes for ring in self._rings.values())
+
+    def add(
+        self,
+        slave_address: int,
+        values: Union[Mapping[int, Union[bool, int, float]], utils.NumericArray],
+        timestamp: Optional[float] = None,
+    ) -> None:
+        """
+        Append one sample per register, all at `timestamp`, defaulting to now.
+        """
+        if timestamp is None:
+            timestamp = self.clock()
+        rings = self._rings
+        if isinstance(values, utils.NumericArray):
+            pairs: Iterable[Tuple[int, Union[bool, int, float]]] = zip(
+                values.registers, values.values
+            )
+        else:
+            pairs = values.items()
+        for register, value in pairs:
+            ring = rings.get((slave_address, register))
+            if ring is None:
+                ring = SampleRing(self.capacity, get_value_typecode(register))
+                rings[(slave_address, register)] = ring
+            ring.append(timestamp, value)
@@ -1,10 +1,22 @@
+import select
+import socket
+import struct
+import threading
+import time
 from typing import *
 import serial  # type: ignore
 import attr
 import structlog
 
+from enron_modbus.crc import calculate_crc
+
 LOG = structlog.get_logger()
 
+# After a timeout, input is dropped before this many sends. A late response can
+# arrive before the next request is sent or, when the request is retried, be read
+# as the response to the retry, leaving the retry's own response behind.
+DISCARDING_SENDS_AFTER_TIMEOUT = 2
+
 
 class EnronModbusTransport(Protocol):
     def connect(self) -> None:
@@ -19,6 +31,10 @@ class EnronModbusTransport(Protocol):
     def recv(self, size: int):
         ...
 
+    def set_timeout(self, timeout: float) -> None:
+        """Seconds `recv` waits for data. Used by `retry.RetryPolicy`."""
+        ...
+
 
 class TransportException(Exception):
     """General Transport Exception"""
@@ -28,13 +44,53 @@ class NotConnectedError(TransportException):
     """Transport is not connected"""
 
 
+class TransportTimeoutError(TransportException):
+    """No data was received within the timeout"""
+
+
+def get_character_time(baudrate: int) -> float:
+    """
+    Seconds to send one RTU character: start bit, 8 data bits, parity or second
+    stop bit and stop bit.
+    """
+    return 11 / baudrate
+
+
+def get_frame_silence(baudrate: int) -> float:
+    """
+    The 3.5 character silence that ends an RTU frame. Above 19200 baud the modbus
+    spec uses a fixed 1.75 ms.
+    """
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * get_character_time(baudrate)
+
+
 @attr.s(auto_attribs=True)
 class SerialTransport:
+    """
+    `recv` returns when `size` bytes are read, when the line has been silent for
+    `frame_silence` seconds after the first byte (end of frame), or after `timeout`
+    seconds without any data.
+
+    `frame_silence` defaults to the modbus t3.5. USB serial adapters that deliver
+    data in bursts may need a higher value, otherwise a frame is just received in
+    more than one read. The silence is measured by `recv` itself, polling the
+    input buffer every character time, since pyserial's `inter_byte_timeout`
+    doesn't end a read early on POSIX.
+
+    Set `hot_path_logging` to False to skip the debug logs of every read and write.
+    """
+
     port: str
     baudrate: int
-    timeout: int = attr.ib(default=5)
+    timeout: float = attr.ib(default=5)
     extra_settings: Dict = attr.ib(factory=dict)
+    frame_silence: Optional[float] = attr.ib(default=None)
+    hot_path_logging: bool = attr.ib(default=True)
     serial_port: Optional[serial.Serial] = attr.ib(init=False, default=None)
+    # A response arriving after a timeout must not be read as the next response.
+    _discarding_sends: int = attr.ib(init=False, default=0, repr=False)
 
     def connect(self) -> None:
         LOG.debug("Opening serial port", serial_port=self.port, baudrate=self.baudrate)
@@ -45,6 +101,16 @@ class SerialTransport:
             **self.extra_settings,
         )
 
+    def set_timeout(self, timeout: float) -> None:
+        self.timeout = timeout
+        if self.serial_port:
+            self.serial_port.timeout = timeout
+
+    def get_frame_silence(self) -> float:
+        if self.frame_silence is None:
+            return get_frame_silence(self.baudrate)
+        return self.frame_silence
+
     def disconnect(self) -> None:
         if self.serial_port:
             LOG.debug("Closing serial port", serial_port=self.port)
@@ -55,14 +121,483 @@ class SerialTransport:
     def send(self, data: bytes) -> None:
         if not self.serial_port:
             raise NotConnectedError(f"{self} is not connected")
-        LOG.debug("Sending serial data", data=data)
+        if self._discarding_sends:
+            self.serial_port.reset_input_buffer()
+            self._discarding_sends -= 1
+        if self.hot_path_logging:
+            LOG.debug("Sending serial data", data=data)
         self.serial_port.write(data)
 
     def recv(self, size: int) -> bytes:
         if not self.serial_port:
             raise NotConnectedError(f"{self} is not connected")
-        LOG.debug(f"Reading serial data", size=size)
-        result = self.serial_port.read(size)
-        LOG.debug(f"Received data", data=result)
+        if self.hot_path_logging:
+            LOG.debug(f"Reading serial data", size=size)
+        result = self.serial_port.read(1)
+        if not result:
+            self._discarding_sends = DISCARDING_SENDS_AFTER_TIMEOUT
+            raise TransportTimeoutError(f"No data received within {self.timeout}s")
+        if size > 1:
+            result += self._read_until_silence(size - 1)
+        if self.hot_path_logging:
+            LOG.debug(f"Received data", data=result)
+        return result
+
+    def _read_until_silence(self, size: int) -> bytes:
+        """
+        Up to `size` bytes, stopping when no byte arrived for the frame silence.
+        """
+        assert self.serial_port is not None
+        silence = self.get_frame_silence()
+        poll_interval = min(silence, get_character_time(self.baudrate))
+        result = bytearray()
+        last_byte_at = time.monotonic()
+        while len(result) < size:
+            waiting = self.serial_port.in_waiting
+            if waiting:
+                result += self.serial_port.read(min(waiting, size - len(result)))
+                last_byte_at = time.monotonic()
+                continue
+            remaining = last_byte_at + silence - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, poll_interval))
+        return bytes(result)
+
+
+@attr.s(auto_attribs=True)
+class TcpTransport:
+    """
+    RTU frames, CRC included, sent as is over TCP. This is what most
+    serial-to-Ethernet gateways expect in their "raw" or "tcp server" mode.
+
+    RTU frames have no transaction id so a socket can only have one outstanding
+    request. With a `pool` the socket is leased for the duration of the connection
+    and handed back to the pool on `disconnect` so the next client to the same
+    gateway does not have to reconnect.
+
+    Set `hot_path_logging` to False to skip the debug logs of every read and write.
+    """
+
+    host: str
+    port: int
+    timeout: float = attr.ib(default=5)
+    pool: Optional["TcpConnectionPool"] = attr.ib(default=None)
+    hot_path_logging: bool = attr.ib(default=True)
+    sock: Optional[socket.socket] = attr.ib(init=False, default=None, repr=False)
+    _broken: bool = attr.ib(init=False, default=False, repr=False)
+    _discarding_sends: int = attr.ib(init=False, default=0, repr=False)
+
+    def connect(self) -> None:
+        LOG.debug("Opening TCP connection", host=self.host, port=self.port)
+        if self.pool:
+            self.sock = self.pool.acquire(self.host, self.port)
+        else:
+            self.sock = open_socket(self.host, self.port, self.timeout)
+        self.sock.settimeout(self.timeout)
+        self._broken = False
+        self._discarding_sends = 0
+
+    def disconnect(self) -> None:
+        if self.sock:
+            LOG.debug("Closing TCP connection", host=self.host, port=self.port)
+            if self.pool and not self._broken:
+                self.pool.release(self.host, self.port, self.sock)
+            else:
+                self.sock.close()
+        self.sock = None
+
+    def set_timeout(self, timeout: float) -> None:
+        self.timeout = timeout
+        if self.sock:
+            self.sock.settimeout(timeout)
+
+    def send(self, data: bytes) -> None:
+        if not self.sock:
+            raise NotConnectedError(f"{self} is not connected")
+        if self._discarding_sends:
+            self._discarding_sends -= 1
+            if self._discard_input():
+                self._broken = False
+        if self.hot_path_logging:
+            LOG.debug("Sending TCP data", data=data)
+        try:
+            self.sock.sendall(data)
+        except OSError as e:
+            self._broken = True
+            raise TransportException(f"Could not send to {self.host}:{self.port}") from e
+
+    def recv(self, size: int) -> bytes:
+        if not self.sock:
+            raise NotConnectedError(f"{self} is not connected")
+        if self.hot_path_logging:
+            LOG.debug("Reading TCP data", size=size)
+        try:
+            result = self.sock.recv(size)
+        except socket.timeout:
+            # A late response would be read by the next request. Don't reuse the
+            # socket before it is discarded.
+            self._broken = True
+            self._discarding_sends = DISCARDING_SENDS_AFTER_TIMEOUT
+            raise TransportTimeoutError(f"No data received within {self.timeout}s")
+        except OSError as e:
+            self._broken = True
+            raise TransportException(f"Could not read from {self.host}:{self.port}") from e
+        if not result:
+            self._broken = True
+            raise TransportException(f"{self.host}:{self.port} closed the connection")
+        if self.hot_path_logging:
+            LOG.debug("Received data", data=result)
+        return result
+
+    def _discard_input(self) -> bool:
+        """
+        Drop what arrived late for an earlier request. Returns False if the
+        gateway closed the connection.
+        """
+        sock = cast(socket.socket, self.sock)
+        while _socket_is_readable(sock):
+            try:
+                if not sock.recv(4096):
+                    return False
+            except OSError:
+                return False
+        return True
+
+
+def open_socket(host: str, port: int, timeout: float) -> socket.socket:
+    try:
+        sock = socket.create_connection((host, port), timeout=timeout)
+    except socket.timeout:
+        raise TransportTimeoutError(
+            f"Could not connect to {host}:{port} within {timeout}s"
+        )
+    except OSError as e:
+        raise TransportException(f"Could not connect to {host}:{port}") from e
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+MBAP_HEADER = struct.Struct(">HHHB")
+
+
+@attr.s(auto_attribs=True)
+class ModbusTcpChannel:
+    """
+    A Modbus TCP (MBAP) connection to a gateway that can be shared between threads.
+
+    Each request gets a transaction id so several requests, to one or many unit ids,
+    can be in flight at the same time. `submit` sends a request and returns the
+    transaction id, `collect` waits for the response with that transaction id.
+
+    There is no reader thread. A thread waiting in `collect` reads responses from
+    the socket and hands over responses that belong to other transactions to the
+    threads waiting for them.
+    """
+
+    host: str
+    port: int
+    timeout: float = attr.ib(default=5)
+    sock: Optional[socket.socket] = attr.ib(init=False, default=None, repr=False)
+    _pending: Dict[int, Optional[Tuple[int, bytes]]] = attr.ib(
+        init=False, factory=dict, repr=False
+    )
+    _abandoned: Set[int] = attr.ib(init=False, factory=set, repr=False)
+    _next_transaction_id: int = attr.ib(init=False, default=0, repr=False)
+    _error: Optional[Exception] = attr.ib(init=False, default=None, repr=False)
+    _send_lock: threading.Lock = attr.ib(init=False, factory=threading.Lock, repr=False)
+    _read_lock: threading.Lock = attr.ib(init=False, factory=threading.Lock, repr=False)
+    _condition: threading.Condition = attr.ib(
+        init=False, factory=threading.Condition, repr=False
+    )
+
+    @property
+    def is_open(self) -> bool:
+        return self.sock is not None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    def open(self) -> None:
+        with self._condition:
+            if self.sock:
+                return
+            LOG.debug("Opening Modbus TCP channel", host=self.host, port=self.port)
+            self.sock = open_socket(self.host, self.port, self.timeout)
+            self._error = None
+
+    def close(self) -> None:
+        with self._condition:
+            if self.sock:
+                LOG.debug("Closing Modbus TCP channel", host=self.host, port=self.port)
+                self.sock.close()
+            self.sock = None
+            self._fail_pending(NotConnectedError(f"{self} was closed"))
+
+    def submit(self, unit_id: int, pdu: bytes) -> int:
+        """
+        Send a PDU (function code + data, no CRC) to `unit_id` and return the
+        transaction id to collect the response with.
+        """
+        with self._condition:
+            if not self.sock:
+                raise NotConnectedError(f"{self} is not connected")
+            if len(self._pending) >= 0xFFFF:
+                raise TransportException("No free transaction ids")
+            transaction_id = self._next_transaction_id
+            while transaction_id in self._pending:
+                transaction_id = (transaction_id + 1) & 0xFFFF
+            self._next_transaction_id = (transaction_id + 1) & 0xFFFF
+            self._pending[transaction_id] = None
+            sock = self.sock
+
+        header = MBAP_HEADER.pack(transaction_id, 0, len(pdu) + 1, unit_id)
+        try:
+            with self._send_lock:
+                sock.sendall(header + pdu)
+        except OSError as e:
+            with self._condition:
+                self._pending.pop(transaction_id, None)
+            raise TransportException(f"Could not send to {self.host}:{self.port}") from e
+        return transaction_id
+
+    def collect(self, transaction_id: int, timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        """
+        Wait for the response to `transaction_id`. Returns unit id and PDU.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                if transaction_id not in self._pending:
+                    # Failing the connection drops all transactions.
+                    raise self._error or TransportException(
+                        f"Unknown transaction id {transaction_id}"
+                    )
+                response = self._pending[transaction_id]
+                if response is not None:
+                    del self._pending[transaction_id]
+                    return response
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Keep the id reserved so a late response is not mistaken for
+                    # the response to a new request. It is freed when it arrives.
+                    self._pending[transaction_id] = None
+                    self._abandoned.add(transaction_id)
+                    raise TransportTimeoutError(
+                        f"No response to transaction {transaction_id} within {timeout}s"
+                    )
+                is_reader = self._read_lock.acquire(blocking=False)
+                if not is_reader:
+                    self._condition.wait(remaining)
+                    continue
+
+            try:
+                adu = self._read_adu(remaining)
+            except TransportTimeoutError:
+                adu = None
+            except TransportException as e:
+                with self._condition:
+                    self._read_lock.release()
+                    self._fail_pending(e)
+                    self._condition.notify_all()
+                raise
+            with self._condition:
+                self._read_lock.release()
+                if adu:
+                    self._dispatch(*adu)
+                self._condition.notify_all()
+
+    def _dispatch(self, transaction_id: int, unit_id: int, pdu: bytes) -> None:
+        if transaction_id in self._abandoned:
+            self._abandoned.discard(transaction_id)
+            self._pending.pop(transaction_id, None)
+            LOG.debug("Dropping late response", transaction_id=transaction_id)
+        elif transaction_id in self._pending:
+            self._pending[transaction_id] = (unit_id, pdu)
+        else:
+            LOG.warning("Response to unknown transaction", transaction_id=transaction_id)
+
+    def _fail_pending(self, error: Exception) -> None:
+        if self.sock:
+            self.sock.close()
+        self.sock = None
+        self._error = error
+        self._pending.clear()
+        self._abandoned.clear()
+        self._condition.notify_all()
+
+    def _read_adu(self, timeout: float) -> Tuple[int, int, bytes]:
+        sock = self.sock
+        if not sock:
+            raise NotConnectedError(f"{self} is not connected")
+        header = self._recv_exactly(sock, MBAP_HEADER.size, timeout, first=True)
+        transaction_id, protocol_id, length, unit_id = MBAP_HEADER.unpack(header)
+        if protocol_id != 0 or length < 2:
+            raise TransportException(f"Invalid MBAP header {header!r}")
+        pdu = self._recv_exactly(sock, length - 1, self.timeout, first=False)
+        return transaction_id, unit_id, pdu
+
+    def _recv_exactly(
+        self, sock: socket.socket, size: int, timeout: float, first: bool
+    ) -> bytes:
+        out = bytearray()
+        sock.settimeout(timeout)
+        while len(out) < size:
+            try:
+                chunk = sock.recv(size - len(out))
+            except socket.timeout:
+                if first and not out:
+                    raise TransportTimeoutError("No data received")
+                # Stopped in the middle of an ADU, the stream can't be trusted.
+                raise TransportException(f"Incomplete MBAP frame from {self.host}")
+            except OSError as e:
+                raise TransportException(f"Could not read from {self.host}") from e
+            if not chunk:
+                raise TransportException(f"{self.host}:{self.port} closed the connection")
+            out += chunk
+        return bytes(out)
+
+
+@attr.s(auto_attribs=True)
+class ModbusTcpTransport:
+    """
+    Enron Modbus over Modbus TCP. The RTU frames coming from the connection are
+    sent as MBAP frames, the slave address becoming the unit id and the CRC being
+    dropped. Responses get a CRC appended so the connection can parse them as usual.
+
+    Transports using the same `pool` share one channel per gateway so clients in
+    different threads have their requests in flight at the same time.
+
+    Set `hot_path_logging` to False to skip the debug logs of every read and write.
+    """
+
+    host: str
+    port: int
+    timeout: float = attr.ib(default=5)
+    pool: Optional["TcpConnectionPool"] = attr.ib(default=None)
+    hot_path_logging: bool = attr.ib(default=True)
+    channel: Optional[ModbusTcpChannel] = attr.ib(init=False, default=None, repr=False)
+    _transaction_id: Optional[int] = attr.ib(init=False, default=None, repr=False)
+    _received: bytes = attr.ib(init=False, default=b"", repr=False)
+
+    def connect(self) -> None:
+        if self.pool:
+            self.channel = self.pool.channel(self.host, self.port)
+        else:
+            self.channel = ModbusTcpChannel(self.host, self.port, self.timeout)
+        self.channel.open()
+
+    def disconnect(self) -> None:
+        if self.channel and not self.pool:
+            self.channel.close()
+        self.channel = None
+        self._transaction_id = None
+        self._received = b""
+
+    def set_timeout(self, timeout: float) -> None:
+        self.timeout = timeout
+
+    def send(self, data: bytes) -> None:
+        if not self.channel:
+            raise NotConnectedError(f"{self} is not connected")
+        if self.hot_path_logging:
+            LOG.debug("Sending Modbus TCP data", data=data)
+        if not self.channel.is_open:
+            self.channel.open()
+        # Anything left from an earlier response is stale now.
+        self._received = b""
+        self._transaction_id = self.channel.submit(data[0], data[1:-2])
+
+    def recv(self, size: int) -> bytes:
+        if not self.channel:
+            raise NotConnectedError(f"{self} is not connected")
+        if not self._received:
+            if self._transaction_id is None:
+                raise TransportException("No request is waiting for a response")
+            transaction_id, self._transaction_id = self._transaction_id, None
+            unit_id, pdu = self.channel.collect(transaction_id, self.timeout)
+            frame = bytes([unit_id]) + pdu
+            self._received = frame + calculate_crc(frame)
+        result, self._received = self._received[:size], self._received[size:]
+        if self.hot_path_logging:
+            LOG.debug("Received data", data=result)
         return result
 
+
+@attr.s(auto_attribs=True)
+class TcpConnectionPool:
+    """
+    Reuses connections to gateways across clients.
+
+    `TcpTransport` leases whole sockets, since RTU framing allows only one request
+    in flight per socket. `ModbusTcpTransport` shares one `ModbusTcpChannel` per
+    gateway.
+    """
+
+    timeout: float = attr.ib(default=5)
+    max_idle_per_gateway: int = attr.ib(default=4)
+    _idle: Dict[Tuple[str, int], List[socket.socket]] = attr.ib(
+        init=False, factory=dict, repr=False
+    )
+    _channels: Dict[Tuple[str, int], ModbusTcpChannel] = attr.ib(
+        init=False, factory=dict, repr=False
+    )
+    _lock: threading.Lock = attr.ib(init=False, factory=threading.Lock, repr=False)
+
+    def acquire(self, host: str, port: int) -> socket.socket:
+        key = (host, port)
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                sock = idle.pop()
+                if _socket_is_usable(sock):
+                    LOG.debug("Reusing pooled socket", host=host, port=port)
+                    return sock
+                sock.close()
+        return open_socket(host, port, self.timeout)
+
+    def release(self, host: str, port: int, sock: socket.socket) -> None:
+        key = (host, port)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_gateway:
+                idle.append(sock)
+                return
+        sock.close()
+
+    def channel(self, host: str, port: int) -> ModbusTcpChannel:
+        key = (host, port)
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                channel = ModbusTcpChannel(host, port, self.timeout)
+                self._channels[key] = channel
+            return channel
+
+    def close(self) -> None:
+        with self._lock:
+            for sockets in self._idle.values():
+                for sock in sockets:
+                    sock.close()
+            self._idle.clear()
+            for channel in self._channels.values():
+                channel.close()
+            self._channels.clear()
+
+
+def _socket_is_readable(sock: socket.socket) -> bool:
+    readable, _, _ = select.select([sock], [], [], 0)
+    return bool(readable)
+
+
+def _socket_is_usable(sock: socket.socket) -> bool:
+    """
+    An idle socket should have nothing to read. If it is readable the gateway has
+    closed it or sent something we didn't ask for.
+    """
+    try:
+        return not _socket_is_readable(sock)
+    except (OSError, ValueError):
+        return False
@@ -1,5 +1,10 @@
+import array
+import functools
 import struct
-from typing import Iterable, Dict, Union
+import sys
+from typing import Iterable, Dict, Iterator, List, Mapping, Sequence, Tuple, TypeVar, Union
+
+import attr
 
 
 def iterbits(data: int, amount: int) -> Iterable[bool]:
@@ -28,23 +33,27 @@ def map_boolean_byte(
     return result
 
 
+def _get_bit_string(bits: int, amount: int) -> str:
+    """
+    The lowest `amount` bits as "0" and "1", lowest bit first.
+    """
+    return format(bits & ((1 << amount) - 1), f"0{amount}b")[::-1]
+
+
 def map_boolean_response(
     start_register: int, amount: int, boolean_response: bytes
 ) -> Dict[int, bool]:
-    register = start_register
-    leftover_amount = amount
-    result = dict()
-    for _byte in boolean_response:
-        if leftover_amount <= 8:
-            # just one byte or the last one.
-            result.update(map_boolean_byte(register, leftover_amount, _byte))
-        else:
-            # map a full byte and move on
-            result.update(map_boolean_byte(register, 8, _byte))
-            register += 8
-            leftover_amount -= 8
-
-    return result
+    # The first register is in the lowest bit of the first byte.
+    amount = min(amount, len(boolean_response) * 8)
+    if amount <= 0:
+        return dict()
+    bits = int.from_bytes(boolean_response, "little")
+    return dict(
+        zip(
+            range(start_register, start_register + amount),
+            map("1".__eq__, _get_bit_string(bits, amount)),
+        )
+    )
 
 
 def number_of_bytes_containing_booleans(amount_booleans: int):
@@ -58,6 +67,54 @@ def number_of_bytes_containing_booleans(amount_booleans: int):
     return rounded
 
 
+V = TypeVar("V")
+
+
+def iter_register_runs(values: Mapping[int, V]) -> Iterator[Tuple[int, List[V]]]:
+    """
+    Splits register values into runs of consecutive registers of the same table,
+    as (start register, values) in register order.
+    """
+    start_register = None
+    run: List[V] = []
+    for register in sorted(values):
+        if (
+            start_register is not None
+            and register == start_register + len(run)
+            and get_register_table(register) == get_register_table(start_register)
+        ):
+            run.append(values[register])
+            continue
+        if start_register is not None:
+            yield start_register, run
+        start_register = register
+        run = [values[register]]
+    if start_register is not None:
+        yield start_register, run
+
+
+BOOLEAN_TABLE = 1000
+INTEGER_16_TABLE = 3000
+INTEGER_32_TABLE = 5000
+FLOAT_32_TABLE = 7000
+
+
+def get_register_table(register: int) -> int:
+    """
+    Returns the data table the register belongs to, as the thousand it starts at.
+    """
+    if 1000 < register < 2000:
+        return BOOLEAN_TABLE
+    elif 3000 < register < 4000:
+        return INTEGER_16_TABLE
+    elif 5000 < register < 6000:
+        return INTEGER_32_TABLE
+    elif 7000 < register < 8000:
+        return FLOAT_32_TABLE
+    else:
+        raise ValueError(f"{register} is not in any data table")
+
+
 def get_numeric_value_size(register: int):
     if 3000 < register < 4000:
         # 16 bit integer
@@ -100,16 +157,204 @@ def pack_numeric_data(register: int, data: Union[int, float]) -> bytes:
         raise ValueError(f"{register} is not a numeric register")
 
 
+NUMERIC_FORMATS = {INTEGER_16_TABLE: "h", INTEGER_32_TABLE: "i", FLOAT_32_TABLE: "f"}
+
+# array typecodes with the same item size as the numeric tables on this platform.
+NUMERIC_TYPECODES = {
+    INTEGER_16_TABLE: "h",
+    INTEGER_32_TABLE: "i" if array.array("i").itemsize == 4 else "l",
+    FLOAT_32_TABLE: "f",
+}
+
+
+def get_numeric_format(register: int) -> str:
+    """
+    The struct format character for the values in the register's table.
+    """
+    try:
+        return NUMERIC_FORMATS[get_register_table(register)]
+    except (KeyError, ValueError):
+        raise ValueError(f"{register} is not a numeric register")
+
+
+@functools.lru_cache(maxsize=None)
+def _block_struct(value_format: str, amount: int) -> struct.Struct:
+    return struct.Struct(f">{amount}{value_format}")
+
+
+def get_numeric_block_struct(register: int, amount: int) -> struct.Struct:
+    """
+    Compiled struct for `amount` big endian values from the register's table.
+    """
+    return _block_struct(get_numeric_format(register), amount)
+
+
+def unpack_numeric_block(
+    start_register: int, amount: int, raw_data: bytes
+) -> Tuple[Union[int, float], ...]:
+    """
+    Unpacks `amount` values in one go. All registers in a response are from the
+    same table so they all have the same type.
+    """
+    return get_numeric_block_struct(start_register, amount).unpack_from(raw_data)
+
+
+def pack_numeric_block(
+    start_register: int, values: Sequence[Union[int, float]]
+) -> bytes:
+    """
+    Packs values for consecutive registers in one go, the block version of
+    `pack_numeric_data`.
+    """
+    return get_numeric_block_struct(start_register, len(values)).pack(*values)
+
+
+def pack_booleans(values: Sequence[bool]) -> bytes:
+    """
+    Packs booleans as in read responses and force multiple requests, the first
+    value in the lowest bit.
+    """
+    bits = 0
+    for position, value in enumerate(values):
+        if value:
+            bits |= 1 << position
+    return bits.to_bytes(number_of_bytes_containing_booleans(len(values)), "little")
+
+
 def map_numeric_response(
     start_register: int, amount: int, raw_data: bytes
 ) -> Dict[int, Union[int, float]]:
-    data_map: Dict[int, Union[int, float]] = dict()
     # You are not allowed to mix registers in requests and responses so we are sure
     # all the data is the same.
-    data_size = get_numeric_value_size(start_register)
-    data = [raw_data[i : i + data_size] for i in range(0, len(raw_data), data_size)]
-    register = start_register
-    for i in range(0, amount):
-        data_map[register] = unpack_numeric_data(register, data[i])
-        register += 1
-    return data_map
+    values = unpack_numeric_block(start_register, amount, raw_data)
+    return dict(zip(range(start_register, start_register + amount), values))
+
+
+@attr.s(auto_attribs=True)
+class NumericArray:
+    """
+    Numeric values from consecutive registers in a typed array, in native byte
+    order. Indexing is done by register.
+    """
+
+    start_register: int
+    values: array.array
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, register: int) -> Union[int, float]:
+        index = register - self.start_register
+        if not 0 <= index < len(self.values):
+            raise KeyError(register)
+        return self.values[index]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.registers)
+
+    @property
+    def registers(self) -> range:
+        return range(self.start_register, self.start_register + len(self.values))
+
+    def as_dict(self) -> Dict[int, Union[int, float]]:
+        return dict(zip(self.registers, self.values))
+
+    def to_numpy(self):
+        """
+        The values as a NumPy array sharing memory with `values`.
+        """
+        import numpy  # type: ignore
+
+        return numpy.frombuffer(self.values, dtype=self.values.typecode)
+
+
+@attr.s(auto_attribs=True, eq=False)
+class BooleanBits(Mapping[int, bool]):
+    """
+    Booleans from consecutive registers packed in an int, the first register in
+    the lowest bit. Indexing is done by register and it reads like a dict without
+    building one.
+    """
+
+    start_register: int
+    amount: int
+    bits: int
+
+    def __len__(self) -> int:
+        return self.amount
+
+    def __getitem__(self, register: int) -> bool:
+        index = register - self.start_register
+        if not 0 <= index < self.amount:
+            raise KeyError(register)
+        return bool(self.bits >> index & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.registers)
+
+    def __contains__(self, register: object) -> bool:
+        return register in self.registers
+
+    def __eq__(self, other: object) -> bool:
+        # Equal to any mapping with the same items, like a dict.
+        if isinstance(other, BooleanBits):
+            return (self.start_register, self.amount, self.bits) == (
+                other.start_register,
+                other.amount,
+                other.bits,
+            )
+        return super().__eq__(other)
+
+    @property
+    def registers(self) -> range:
+        return range(self.start_register, self.start_register + self.amount)
+
+    def as_dict(self) -> Dict[int, bool]:
+        return dict(
+            zip(self.registers, map("1".__eq__, _get_bit_string(self.bits, self.amount)))
+        )
+
+    def changed(self, previous: "BooleanBits") -> List[int]:
+        """
+        Registers whose value differs from `previous`, a read of the same
+        registers.
+        """
+        if (previous.start_register, previous.amount) != (
+            self.start_register,
+            self.amount,
+        ):
+            raise ValueError("Can only compare reads of the same registers")
+        difference = self.bits ^ previous.bits
+        registers = []
+        while difference:
+            lowest = difference & -difference
+            registers.append(self.start_register + lowest.bit_length() - 1)
+            difference ^= lowest
+        return registers
+
+
+def boolean_bits_from_response(
+    start_register: int, amount: int, raw_data: bytes
+) -> BooleanBits:
+    if len(raw_data) < number_of_bytes_containing_booleans(amount):
+        raise ValueError(
+            f"Expected {number_of_bytes_containing_booleans(amount)} bytes of "
+            f"boolean data, got {len(raw_data)}"
+        )
+    bits = int.from_bytes(raw_data, "little") & ((1 << amount) - 1)
+    return BooleanBits(start_register, amount, bits)
+
+
+def numeric_array_from_response(
+    start_register: int, amount: int, raw_data: bytes
+) -> NumericArray:
+    size = get_numeric_value_size(start_register)
+    if len(raw_data) < amount * size:
+        raise ValueError(
+            f"Expected {amount * size} bytes of numeric data, got {len(raw_data)}"
+        )
+    values = array.array(NUMERIC_TYPECODES[get_register_table(start_register)])
+    values.frombytes(raw_data[: amount * size])
+    if sys.byteorder == "little":
+        values.byteswap()
+    return NumericArray(start_register, values)
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+import pytest
+import structlog
+
+from enron_modbus.async_transports import read_request_frame
+
+
+@pytest.fixture(autouse=True, scope="session")
+def quiet_logging():
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+    )
+
+
+@pytest.fixture
+def serve_slow_slave_async():
+    """
+    Serve a simulated slave over RTU over TCP, answering the n-th request after
+    delays[n] seconds. Call from a running event loop.
+    """
+
+    async def serve(slave, delays):
+        async def handle(reader, writer):
+            number = 0
+            try:
+                while True:
+                    frame = await read_request_frame(reader)
+                    delay = delays[number] if number < len(delays) else 0
+                    number += 1
+                    await asyncio.sleep(delay)
+                    writer.write(slave.handle_frame(frame))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        return server, server.sockets[0].getsockname()[1]
+
+    return serve
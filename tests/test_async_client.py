@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from enron_modbus.async_client import AsyncEnronModbusClient
+from enron_modbus.async_transports import AsyncTcpTransport
+from enron_modbus.retry import RetryPolicy
+from enron_modbus.simulator import SimulatedBus, SimulatedSlave, SimulatorServer
+from enron_modbus.transports import TransportTimeoutError
+
+
+def test_iter_history_stopped_early_leaves_no_response_behind(serve_slow_slave_async):
+    async def run():
+        slave = SimulatedSlave(1)
+        slave.tables.set(3001, 100)
+        slave.history[701] = [bytes([index]) * 8 for index in range(10)]
+        # The prefetched read of record 1 is still on the bus when iteration stops.
+        server, port = await serve_slow_slave_async(slave, [0, 0.2])
+        client = AsyncEnronModbusClient(AsyncTcpTransport("127.0.0.1", port, timeout=1))
+        async with server, client:
+            records = client.iter_history(1, 701, 0, 10, table_size=10)
+            async for record in records:
+                break
+            await records.aclose()
+            return record, await client.read_numerics(1, 3001, 1)
+
+    record, values = asyncio.run(run())
+    assert record.index == 0
+    assert values == {3001: 100}
+
+
+def test_shared_write_fallback_and_retries_run_on_the_async_client():
+    async def run():
+        slave = SimulatedSlave(1, supports_multiple_writes=False)
+        simulator = SimulatorServer(SimulatedBus({1: slave}))
+        port = await simulator.serve_tcp()
+        client = AsyncEnronModbusClient(
+            AsyncTcpTransport("127.0.0.1", port, timeout=1),
+            hot_path_logging=False,
+            retry_policy=RetryPolicy(initial_timeout=0.1),
+        )
+        async with client:
+            await client.write_numerics(1, {3001: 1, 3002: 2})
+            # Concurrent requests take turns on the bus.
+            values = await asyncio.gather(
+                client.read_numerics(1, 3001, 2),
+                client.read_numeric(1, 3002),
+            )
+            simulator.bus.drop_rate = 1.0
+            with pytest.raises(TransportTimeoutError):
+                await client.read_numeric(1, 3001)
+        await simulator.close()
+        return client.multiple_write_unsupported, values
+
+    unsupported, values = asyncio.run(run())
+    assert unsupported == {(1, 0x10)}
+    assert values == [{3001: 1, 3002: 2}, 2]
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from enron_modbus import async_transports, messages
+from enron_modbus.async_client import AsyncEnronModbusClient
+from enron_modbus.async_transports import AsyncTcpTransport
+from enron_modbus.retry import RetryPolicy
+from enron_modbus.simulator import SimulatedSlave
+from enron_modbus.transports import TransportTimeoutError
+
+
+def test_late_response_is_not_read_as_next_response(serve_slow_slave_async):
+    async def run():
+        slave = SimulatedSlave(1)
+        slave.tables.set(3001, 100)
+        slave.tables.set(3002, 111)
+        server, port = await serve_slow_slave_async(slave, [0.2])
+        client = AsyncEnronModbusClient(AsyncTcpTransport("127.0.0.1", port, timeout=0.1))
+        async with server, client:
+            with pytest.raises(TransportTimeoutError):
+                await client.read_numeric(1, 3001)
+            # The late response to 3001 arrives in the meantime.
+            await asyncio.sleep(0.2)
+            return await client.read_numerics(1, 3002, 1)
+
+    assert asyncio.run(run()) == {3002: 111}
+
+
+def test_cancelled_read_response_is_not_read_as_next_response(serve_slow_slave_async):
+    async def run():
+        slave = SimulatedSlave(1)
+        slave.tables.set(3001, 100)
+        slave.tables.set(3002, 111)
+        server, port = await serve_slow_slave_async(slave, [0.2])
+        client = AsyncEnronModbusClient(AsyncTcpTransport("127.0.0.1", port, timeout=1))
+        async with server, client:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.read_numeric(1, 3001), 0.1)
+            await asyncio.sleep(0.2)
+            return await client.read_numerics(1, 3002, 1)
+
+    assert asyncio.run(run()) == {3002: 111}
+
+
+@pytest.mark.parametrize("hot_path_logging", [True, False])
+def test_async_transport_hot_path_logging(
+    monkeypatch, serve_slow_slave_async, hot_path_logging
+):
+    calls = []
+
+    class RecordingLogger:
+        def __getattr__(self, level):
+            return lambda event, **kw: calls.append((level, event))
+
+    async def run():
+        slave = SimulatedSlave(1)
+        slave.tables.set(3001, 100)
+        server, port = await serve_slow_slave_async(slave, [])
+        transport = AsyncTcpTransport(
+            "127.0.0.1", port, hot_path_logging=hot_path_logging
+        )
+        async with server:
+            await transport.connect()
+            monkeypatch.setattr(async_transports, "LOG", RecordingLogger())
+            await transport.send(messages.NumericReadRequest(1, 3001, 1).to_bytes())
+            assert await transport.recv(256)
+            monkeypatch.undo()
+            await transport.disconnect()
+
+    asyncio.run(run())
+    assert bool(calls) == hot_path_logging
+
+
+def test_retry_answered_twice_leaves_no_response_behind(serve_slow_slave_async):
+    async def run():
+        slave = SimulatedSlave(1)
+        slave.tables.set(3001, 100)
+        slave.tables.set(3002, 111)
+        # The first attempt is answered late, during the retry, and the retry too.
+        server, port = await serve_slow_slave_async(slave, [0.15])
+        policy = RetryPolicy(max_attempts=2, initial_timeout=0.1)
+        client = AsyncEnronModbusClient(
+            AsyncTcpTransport("127.0.0.1", port), retry_policy=policy
+        )
+        async with server, client:
+            first = await client.read_numerics(1, 3001, 1)
+            await asyncio.sleep(0.05)
+            return first, await client.read_numerics(1, 3002, 1)
+
+    assert asyncio.run(run()) == ({3001: 100}, {3002: 111})
@@ -0,0 +1,69 @@
+import threading
+
+from enron_modbus.cache import CachedEnronModbusClient
+
+
+class FakeClient:
+    def __init__(self):
+        self.values = {3001: 1}
+
+    def read_numerics(self, slave_address, start_register, amount):
+        return {
+            register: self.values[register]
+            for register in range(start_register, start_register + amount)
+        }
+
+    def write_numeric(self, slave_address, register, value):
+        self.values[register] = value
+
+
+class InterleavingLock:
+    """
+    A lock running `before_acquire` once before it is next acquired, to let
+    another thread in at that point.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.before_acquire = None
+
+    def __enter__(self):
+        hook, self.before_acquire = self.before_acquire, None
+        if hook:
+            hook()
+        self.lock.acquire()
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+def test_read_racing_a_write_does_not_cache_the_old_value():
+    cache = CachedEnronModbusClient(FakeClient(), default_ttl=60)
+    cache._client_lock = InterleavingLock()
+
+    def read_in_other_thread():
+        reader = threading.Thread(target=cache.read_numeric, args=(1, 3001))
+        reader.start()
+        reader.join()
+
+    # A read gets the client just before the write does.
+    cache._client_lock.before_acquire = read_in_other_thread
+    cache.write_numeric(1, 3001, 2)
+    assert cache.read_numeric(1, 3001) == 2
+
+
+def test_failed_write_invalidates():
+    client = FakeClient()
+    cache = CachedEnronModbusClient(client, default_ttl=60)
+    assert cache.read_numeric(1, 3001) == 1
+
+    def fail(slave_address, register, value):
+        client.values[register] = value
+        raise TimeoutError
+
+    client.write_numeric = fail
+    try:
+        cache.write_numeric(1, 3001, 2)
+    except TimeoutError:
+        pass
+    assert cache.read_numeric(1, 3001) == 2
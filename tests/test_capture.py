@@ -0,0 +1,101 @@
+import pytest
+
+from enron_modbus import messages
+from enron_modbus.capture import (
+    FILE_MAGIC,
+    CaptureFormatError,
+    CaptureWriter,
+    CapturingTransport,
+    ReplayMismatchError,
+    ReplayTransport,
+    iter_records,
+    replay_frames,
+)
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.simulator import LoopbackTransport, SimulatedSlave
+from enron_modbus.transports import TransportTimeoutError
+
+
+def poll(client):
+    values = [client.read_numerics(1, 3001, 3), client.read_booleans(1, 1001, 4)]
+    with pytest.raises(TransportTimeoutError):
+        client.read_numeric(2, 3001)
+    values.append(client.read_numeric(1, 3002))
+    return values
+
+
+def record_capture(path):
+    slave = SimulatedSlave(1)
+    for offset in range(3):
+        slave.tables.set(3001 + offset, offset + 10)
+    slave.tables.set(1002, True)
+    loopback = LoopbackTransport(chunk_size=3)
+    loopback.add_slave(slave)
+    transport = CapturingTransport(loopback, CaptureWriter.open(path))
+    client = EnronModbusClient(transport, hot_path_logging=False)
+    client.connect()
+    values = poll(client)
+    client.disconnect()
+    transport.writer.close()
+    return values
+
+
+def test_replay_transport_answers_like_the_capture(tmp_path):
+    path = tmp_path / "bus.capture"
+    values = record_capture(path)
+
+    client = EnronModbusClient(ReplayTransport(path), hot_path_logging=False)
+    client.connect()
+    assert poll(client) == values
+    client.disconnect()
+
+
+def test_replay_transport_rejects_other_requests(tmp_path):
+    path = tmp_path / "bus.capture"
+    record_capture(path)
+    client = EnronModbusClient(ReplayTransport(path), hot_path_logging=False)
+    client.connect()
+
+    with pytest.raises(ReplayMismatchError):
+        client.read_numerics(1, 3001, 2)
+    client.disconnect()
+
+    lenient = EnronModbusClient(
+        ReplayTransport(path, strict=False), hot_path_logging=False
+    )
+    lenient.connect()
+    # The first recorded response answers whatever was asked first.
+    assert lenient.read_numerics(1, 3001, 2) == {3001: 10, 3002: 11}
+    lenient.disconnect()
+
+
+def test_replay_frames_decodes_each_exchange(tmp_path):
+    path = tmp_path / "bus.capture"
+    record_capture(path)
+
+    exchanges = list(replay_frames(path))
+
+    assert [exchange.request for exchange in exchanges] == [
+        messages.NumericReadRequest(1, 3001, 3),
+        messages.BooleanReadRequest(1, 1001, 4),
+        messages.NumericReadRequest(2, 3001, 1),
+        messages.NumericReadRequest(1, 3002, 1),
+    ]
+    assert exchanges[0].response.raw_data == bytes.fromhex("000a000b000c")
+    assert isinstance(exchanges[2].error, TransportTimeoutError)
+    assert exchanges[2].response is None
+    assert exchanges[3].error is None
+
+
+def test_capture_cut_short_ends_at_the_last_complete_record(tmp_path):
+    path = tmp_path / "bus.capture"
+    record_capture(path)
+    data = path.read_bytes()
+    records = list(iter_records(data))
+
+    assert list(iter_records(data[:-1])) == records[:-1]
+    with pytest.raises(CaptureFormatError):
+        list(iter_records(b"NOTACAPT" + data[len(FILE_MAGIC) :]))
+    # Appending to an existing capture doesn't start it again.
+    CaptureWriter.open(path).close()
+    assert path.read_bytes() == data
@@ -0,0 +1,103 @@
+import pytest
+
+from enron_modbus import messages
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.simulator import LoopbackTransport, SimulatedSlave
+
+
+class RecordingTransport(LoopbackTransport):
+    def __init__(self, *slaves):
+        super().__init__()
+        self.requests = []
+        for slave in slaves:
+            self.add_slave(slave)
+
+    def send(self, data):
+        self.requests.append(
+            messages.StandardRequestFactory.make_request_from_bytes(data)
+        )
+        super().send(data)
+
+    def sent(self):
+        """(function code, start register, amount) of each request sent."""
+        requests, self.requests = self.requests, []
+        return [
+            (
+                request.FUNCTION_CODE,
+                getattr(request, "start_register", getattr(request, "register", None)),
+                len(getattr(request, "values", [None])),
+            )
+            for request in requests
+        ]
+
+
+class BusySlave(SimulatedSlave):
+    def handle(self, request):
+        if isinstance(request, messages.NumericMultipleWriteRequest):
+            return messages.ExceptionResponse(
+                self.slave_address, request.FUNCTION_CODE, messages.SLAVE_DEVICE_BUSY
+            )
+        return super().handle(request)
+
+
+def make_client(slave):
+    transport = RecordingTransport(slave)
+    client = EnronModbusClient(transport, hot_path_logging=False)
+    client.connect()
+    return client, transport
+
+
+def test_write_numerics_splits_runs_into_multiple_writes():
+    slave = SimulatedSlave(1)
+    client, transport = make_client(slave)
+    values = {3001 + offset: offset for offset in range(130)}
+    values[3200] = 7
+    values.update({7001 + offset: offset / 2 for offset in range(70)})
+
+    client.write_numerics(1, values)
+
+    assert transport.sent() == [
+        (0x10, 3001, 123),
+        (0x10, 3124, 7),
+        (0x06, 3200, 1),
+        (0x10, 7001, 61),
+        (0x10, 7062, 9),
+    ]
+    assert all(slave.tables.get(register) == value for register, value in values.items())
+
+
+def test_write_booleans_uses_force_multiple():
+    slave = SimulatedSlave(1)
+    client, transport = make_client(slave)
+    values = {1001 + offset: offset % 3 == 0 for offset in range(20)}
+
+    client.write_booleans(1, values)
+
+    assert transport.sent() == [(0x0F, 1001, 20)]
+    assert client.read_booleans(1, 1001, 20) == values
+
+
+def test_slave_without_multiple_writes_gets_single_writes_from_then_on():
+    slave = SimulatedSlave(1, supports_multiple_writes=False)
+    client, transport = make_client(slave)
+
+    client.write_numerics(1, {3001: 1, 3002: 2})
+    assert transport.sent() == [(0x10, 3001, 2), (0x06, 3001, 1), (0x06, 3002, 1)]
+    assert client.multiple_write_unsupported == {(1, 0x10)}
+
+    client.write_numerics(1, {3001: 3, 3002: 4})
+    assert transport.sent() == [(0x06, 3001, 1), (0x06, 3002, 1)]
+    client.write_booleans(1, {1001: True, 1002: True})
+    assert transport.sent()[0] == (0x0F, 1001, 2)
+    assert client.read_numerics(1, 3001, 2) == {3001: 3, 3002: 4}
+
+
+def test_other_multiple_write_exceptions_are_raised():
+    client, transport = make_client(BusySlave(1))
+
+    with pytest.raises(messages.SlaveExceptionError) as error:
+        client.write_numerics(1, {3001: 1, 3002: 2})
+
+    assert error.value.exception_code == messages.SLAVE_DEVICE_BUSY
+    assert transport.sent() == [(0x10, 3001, 2)]
+    assert not client.multiple_write_unsupported
@@ -0,0 +1,78 @@
+import pytest
+
+from enron_modbus import messages, state
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.connection import EnronModbusConnection
+from enron_modbus.simulator import LoopbackTransport, SimulatedSlave
+
+
+def make_slave():
+    slave = SimulatedSlave(1)
+    for offset in range(5):
+        slave.tables.set(7001 + offset, offset + 0.5)
+    return slave
+
+
+def test_response_fed_byte_by_byte_is_parsed_once_complete():
+    request = messages.NumericReadRequest(1, 7001, 5)
+    response = make_slave().handle_frame(request.to_bytes())
+    connection = EnronModbusConnection(hot_path_logging=False)
+    connection.send(request)
+
+    assert connection.bytes_needed() == messages.MINIMAL_RESPONSE_SIZE
+    needed = []
+    for byte in response[:-1]:
+        connection.receive_data(bytes([byte]))
+        needed.append(connection.bytes_needed())
+        assert connection.next_event() is state.NEED_DATA
+    # The byte count, the third byte, tells the frame length.
+    assert needed[:3] == [4, 3, len(response) - 3]
+    connection.receive_data(response[-1:])
+
+    event = connection.next_event()
+    assert event.raw_data == response[3:-2]
+    assert connection.buffered == 0
+
+
+def test_receive_buffer_is_written_in_place():
+    request = messages.NumericReadRequest(1, 7001, 5)
+    response = make_slave().handle_frame(request.to_bytes())
+    connection = EnronModbusConnection(hot_path_logging=False)
+    buffer = connection.buffer
+    connection.send(request)
+
+    position = 0
+    while position < len(response):
+        with connection.get_receive_buffer() as view:
+            size = min(len(view), 3)
+            view[:size] = response[position : position + size]
+        connection.commit_received(size)
+        position += size
+
+    assert connection.buffer is buffer
+    assert connection.next_event().raw_data == response[3:-2]
+
+
+def test_complete_frame_with_bad_crc_raises_and_clears_the_buffer():
+    request = messages.NumericReadRequest(1, 7001, 5)
+    response = bytearray(make_slave().handle_frame(request.to_bytes()))
+    response[-1] ^= 0xFF
+    connection = EnronModbusConnection(hot_path_logging=False)
+    connection.send(request)
+    connection.receive_data(bytes(response))
+
+    with pytest.raises(messages.InvalidCrcError):
+        connection.next_event()
+    assert connection.buffered == 0
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7])
+def test_client_reads_partial_responses(chunk_size):
+    transport = LoopbackTransport(chunk_size=chunk_size)
+    transport.add_slave(make_slave())
+    client = EnronModbusClient(transport, hot_path_logging=False)
+
+    assert client.read_numerics(1, 7001, 5) == {
+        7001 + offset: offset + 0.5 for offset in range(5)
+    }
+    assert client.read_numeric(1, 7003) == 2.5
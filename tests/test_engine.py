@@ -0,0 +1,132 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from enron_modbus import messages, utils
+from enron_modbus.engine import EnginePort, SelectorEngine, TcpEnginePort
+from enron_modbus.simulator import SimulatedBus, SimulatedSlave
+from enron_modbus.transports import TransportException, TransportTimeoutError
+
+
+def serve_once(slave, answer=True):
+    """
+    Accept one RTU over TCP connection, read one request, answer it if `answer`
+    and close the connection.
+    """
+    server = socket.create_server(("127.0.0.1", 0))
+
+    def run():
+        conn, _ = server.accept()
+        with conn:
+            frame = conn.recv(256)
+            if answer:
+                conn.sendall(slave.handle_frame(frame))
+
+    threading.Thread(target=run, daemon=True).start()
+    return server, server.getsockname()[1]
+
+
+def test_port_closed_by_peer_is_dropped_and_fails_requests():
+    slave = SimulatedSlave(1)
+    slave.tables.set(3001, 100)
+    server, port_number = serve_once(slave)
+    engine = SelectorEngine()
+    with server:
+        port = engine.add_tcp_port("127.0.0.1", port_number)
+        engine.start()
+        try:
+            request = messages.NumericReadRequest(1, 3001, 1)
+            assert port.submit(request).result(1).raw_data
+            # The peer has closed the connection, an idle engine must not spin.
+            time.sleep(0.1)
+            started = time.process_time()
+            time.sleep(0.3)
+            assert time.process_time() - started < 0.1
+            with pytest.raises(TransportException):
+                port.submit(request).result(0.1)
+        finally:
+            engine.stop(1)
+            engine.close()
+
+
+def test_request_in_flight_fails_when_peer_closes():
+    server, port_number = serve_once(SimulatedSlave(1), answer=False)
+    engine = SelectorEngine()
+    with server:
+        port = engine.add_tcp_port("127.0.0.1", port_number, timeout=5)
+        engine.start()
+        try:
+            started = time.monotonic()
+            with pytest.raises(TransportException):
+                port.submit(messages.NumericReadRequest(1, 3001, 1)).result(1)
+            assert time.monotonic() - started < 1
+        finally:
+            engine.stop(1)
+            engine.close()
+
+
+def test_engine_port_without_all_methods_cannot_be_made():
+    class IncompletePort(EnginePort):
+        def open(self):
+            pass
+
+    with pytest.raises(TypeError):
+        IncompletePort("incomplete")
+
+
+def serve_late_answers(bus, hold_first):
+    """
+    Serve `bus` over RTU over TCP. With `hold_first` the first request is only
+    answered right before the second, otherwise after 0.15s.
+    """
+    server = socket.create_server(("127.0.0.1", 0))
+
+    def run():
+        conn, _ = server.accept()
+        with conn:
+            first = conn.recv(256)
+            if not hold_first:
+                time.sleep(0.15)
+                conn.sendall(bus.handle_frame(first))
+            second = conn.recv(256)
+            if hold_first:
+                conn.sendall(bus.handle_frame(first))
+            conn.sendall(bus.handle_frame(second))
+            conn.recv(256)
+
+    threading.Thread(target=run, daemon=True).start()
+    return server, server.getsockname()[1]
+
+
+def run_late_answer(hold_first, second_request):
+    bus = SimulatedBus.with_slaves([1, 2])
+    bus.slaves[1].tables.set(3001, 100)
+    bus.slaves[1].tables.set(3002, 111)
+    bus.slaves[2].tables.set(3001, 200)
+    server, port_number = serve_late_answers(bus, hold_first)
+    engine = SelectorEngine()
+    with server:
+        port = engine.add_port(
+            TcpEnginePort(
+                "late", 0.1, host="127.0.0.1", port=port_number, frame_silence=0.1
+            )
+        )
+        engine.start()
+        try:
+            with pytest.raises(TransportTimeoutError):
+                port.submit(messages.NumericReadRequest(1, 3001, 1)).result(1)
+            response = port.submit(second_request).result(1)
+            return utils.map_numeric_response(3001, 1, response.raw_data)[3001]
+        finally:
+            engine.stop(1)
+            engine.close()
+
+
+def test_late_answer_to_another_slave_is_not_taken_as_the_response():
+    assert run_late_answer(True, messages.NumericReadRequest(2, 3001, 1)) == 200
+
+
+def test_late_answer_in_the_quiet_window_after_a_timeout_is_dropped():
+    assert run_late_answer(False, messages.NumericReadRequest(1, 3002, 1)) == 111
@@ -0,0 +1,76 @@
+import math
+
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.events import (
+    EVENT_RECORD_STRUCT,
+    EventRecord,
+    decode_events,
+    encode_event,
+)
+from enron_modbus.simulator import LoopbackTransport, SimulatedSlave
+from enron_modbus.transports import TransportTimeoutError
+
+
+def make_event(slave_address, number):
+    return EventRecord(slave_address, 1, 7001, 1_700_000_000 + number, number, number + 1)
+
+
+def make_client(*slaves):
+    transport = LoopbackTransport()
+    for slave in slaves:
+        transport.add_slave(slave)
+    client = EnronModbusClient(transport, hot_path_logging=False)
+    client.connect()
+    return client
+
+
+def test_empty_event_slot_decodes_to_nan_timestamp():
+    raw_data = encode_event(make_event(1, 0)) + bytes(EVENT_RECORD_STRUCT.size)
+    first, empty = decode_events(1, raw_data)
+    assert first == make_event(1, 0)
+    assert math.isnan(empty.timestamp)
+    assert (empty.status, empty.register, empty.new_value) == (0, 0, 0)
+
+
+def test_iter_events_acknowledges_each_consumed_batch():
+    slave = SimulatedSlave(1, events_per_read=10)
+    slave.events = [encode_event(make_event(1, number)) for number in range(25)]
+    slave.events[12] = bytes(EVENT_RECORD_STRUCT.size)
+    client = make_client(slave)
+
+    records = list(client.iter_events(1))
+
+    assert len(records) == 25
+    assert math.isnan(records[12].timestamp)
+    assert records[24] == make_event(1, 24)
+    assert slave.events == []
+
+
+def test_iter_events_reads_a_batch_not_consumed_again():
+    slave = SimulatedSlave(1, events_per_read=10)
+    slave.events = [encode_event(make_event(1, number)) for number in range(15)]
+    client = make_client(slave)
+
+    for record in client.iter_events(1):
+        break
+    assert len(slave.events) == 15
+
+    assert list(client.iter_events(1, max_batches=1))[0] == record
+    assert len(slave.events) == 5
+
+
+def test_drain_events_reports_failing_slave_and_reads_the_others():
+    slaves = [SimulatedSlave(1), SimulatedSlave(3)]
+    for slave in slaves:
+        slave.events = [encode_event(make_event(slave.slave_address, 0))]
+    client = make_client(*slaves)
+    errors = []
+
+    records = list(
+        client.drain_events([1, 2, 3], on_error=lambda *error: errors.append(error))
+    )
+
+    assert records == [make_event(1, 0), make_event(3, 0)]
+    [(slave_address, error)] = errors
+    assert slave_address == 2
+    assert isinstance(error, TransportTimeoutError)
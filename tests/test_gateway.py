@@ -0,0 +1,131 @@
+import asyncio
+import gc
+
+from enron_modbus import messages
+from enron_modbus.async_client import AsyncEnronModbusClient
+from enron_modbus.async_transports import AsyncTcpTransport
+from enron_modbus.gateway import GatewayServer
+from enron_modbus.simulator import SimulatedBus, SimulatorServer
+from enron_modbus.transports import MBAP_HEADER
+
+
+async def start_gateway(latency):
+    bus = SimulatedBus.with_slaves([1], latency=latency)
+    for offset in range(10):
+        bus.slaves[1].tables.set(3001 + offset, offset)
+    simulator = SimulatorServer(bus)
+    bus_port = await simulator.serve_tcp()
+    client = AsyncEnronModbusClient(
+        AsyncTcpTransport("127.0.0.1", bus_port, timeout=2), hot_path_logging=False
+    )
+    await client.connect()
+    gateway = GatewayServer(client, cache_ttl=0)
+    port = await gateway.serve_tcp(modbus_tcp=True)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    return simulator, client, gateway, reader, writer
+
+
+def send_read(writer, transaction_id, register):
+    pdu = messages.NumericReadRequest(1, register, 1).to_bytes()[1:-2]
+    writer.write(MBAP_HEADER.pack(transaction_id, 0, len(pdu) + 1, 1) + pdu)
+
+
+async def read_response(reader):
+    header = await asyncio.wait_for(reader.readexactly(MBAP_HEADER.size), 2)
+    transaction_id, _, length, _ = MBAP_HEADER.unpack(header)
+    return transaction_id, await reader.readexactly(length - 1)
+
+
+def test_pipelined_requests_survive_garbage_collection():
+    async def run():
+        simulator, client, gateway, reader, writer = await start_gateway(0.02)
+        for transaction_id in range(5):
+            send_read(writer, transaction_id, 3001 + transaction_id)
+        await asyncio.sleep(0.01)
+        gc.collect()
+        responses = dict([await read_response(reader) for _ in range(5)])
+        writer.close()
+        await gateway.close()
+        await client.disconnect()
+        await simulator.close()
+        return responses, gateway._tasks
+
+    responses, tasks = asyncio.run(run())
+    assert sorted(responses) == [0, 1, 2, 3, 4]
+    assert not tasks
+
+
+def test_close_answers_waiting_clients():
+    async def run():
+        simulator, client, gateway, reader, writer = await start_gateway(0.5)
+        # One request on the bus and one queued behind it.
+        send_read(writer, 1, 3001)
+        send_read(writer, 2, 3002)
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(gateway.close(), 1)
+        responses = dict([await read_response(reader) for _ in range(2)])
+        at_eof = await asyncio.wait_for(reader.read(), 1) == b""
+        writer.close()
+        await client.disconnect()
+        await simulator.close()
+        return responses, at_eof
+
+    responses, at_eof = asyncio.run(run())
+    failed = bytes([0x83, messages.GATEWAY_TARGET_FAILED_TO_RESPOND])
+    assert responses == {1: failed, 2: failed}
+    assert at_eof
+
+
+def read_frame(register):
+    return messages.NumericReadRequest(1, register, 1).to_bytes()
+
+
+def test_failed_write_drops_cached_reads():
+    async def run():
+        simulator, client, gateway, reader, writer = await start_gateway(0)
+        writer.close()
+        client.transport.timeout = 0.1
+        gateway.cache_ttl = 60
+        slave = simulator.bus.slaves[1]
+        before = await gateway.handle_frame(read_frame(3001))
+
+        simulator.bus.drop_rate = 1.0
+        write = messages.NumericWriteRequest(1, 3001, 42).to_bytes()
+        assert await gateway.handle_frame(write) is None
+        simulator.bus.drop_rate = 0.0
+        slave.tables.set(3001, 42)
+        after = await gateway.handle_frame(read_frame(3001))
+
+        await gateway.close()
+        await client.disconnect()
+        await simulator.close()
+        return before, after, slave.handle_frame(read_frame(3001))
+
+    before, after, expected = asyncio.run(run())
+    assert before != expected
+    assert after == expected
+
+
+def test_reads_are_not_merged_across_a_write():
+    async def run():
+        simulator, client, gateway, reader, writer = await start_gateway(0.05)
+        writer.close()
+        slave = simulator.bus.slaves[1]
+        old = slave.handle_frame(read_frame(3001))
+        requests = [
+            read_frame(3005),
+            read_frame(3001),
+            messages.NumericWriteRequest(1, 3001, 42).to_bytes(),
+            read_frame(3001),
+        ]
+        tasks = [asyncio.ensure_future(gateway.handle_frame(r)) for r in requests]
+        responses = await asyncio.gather(*tasks)
+        await gateway.close()
+        await client.disconnect()
+        await simulator.close()
+        return old, responses, slave.handle_frame(read_frame(3001))
+
+    old, responses, new = asyncio.run(run())
+    assert old != new
+    assert responses[1] == old
+    assert responses[3] == new
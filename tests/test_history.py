@@ -0,0 +1,42 @@
+import math
+
+from enron_modbus.history import HistoryRecord, HistorySchema, timestamp_to_date_and_time
+
+SCHEMA = HistorySchema([7101, 3101])
+
+
+def make_record(timestamp, value):
+    return SCHEMA.record_struct.pack(*timestamp_to_date_and_time(timestamp), value, 7)
+
+
+def test_records_not_written_yet_decode_to_nan():
+    empty = bytes(SCHEMA.record_size)
+    records = [
+        HistoryRecord(701, 0, make_record(1_700_000_000, 1.5)),
+        HistoryRecord(701, 1, empty),
+        HistoryRecord(701, 2, make_record(1_700_003_600, 2.5)),
+    ]
+    columns = SCHEMA.decode_records(records)
+    assert len(columns) == 3
+    assert columns.timestamps[0] == 1_700_000_000
+    assert math.isnan(columns.timestamps[1])
+    assert columns.timestamps[2] == 1_700_003_600
+    assert list(columns.items[7101]) == [1.5, 0.0, 2.5]
+    assert list(columns.indices) == [0, 1, 2]
+
+    timestamp, values = SCHEMA.decode_record(empty)
+    assert math.isnan(timestamp)
+    assert values == {7101: 0.0, 3101: 0}
+
+
+def test_nan_time_decodes_to_nan_in_both_decoders():
+    date, _ = timestamp_to_date_and_time(1_700_000_000)
+    records = [
+        SCHEMA.record_struct.pack(date, math.nan, 1.5, 7),
+        SCHEMA.record_struct.pack(math.nan, math.nan, 1.5, 7),
+        SCHEMA.record_struct.pack(date, math.inf, 1.5, 7),
+    ]
+    columns = SCHEMA.decode(records)
+    assert all(math.isnan(timestamp) for timestamp in columns.timestamps)
+    for record in records:
+        assert math.isnan(SCHEMA.decode_record(record)[0])
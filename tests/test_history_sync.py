@@ -0,0 +1,121 @@
+import sqlite3
+
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.history import HistoryReadoutError, HistorySchema
+from enron_modbus.history_sync import (
+    HistoryDevice,
+    HistorySync,
+    HistoryTableConfig,
+    SqliteHistoryStore,
+)
+from enron_modbus.simulator import HistoryRing, LoopbackTransport, SimulatedSlave
+from enron_modbus.transports import TransportTimeoutError
+
+SCHEMA = HistorySchema([7101, 3101])
+HOURLY = HistoryTableConfig(701, 7001, 10, initial_records=4, schema=SCHEMA)
+DAILY = HistoryTableConfig(702, 7002, 10, initial_records=4, schema=SCHEMA)
+
+
+class DyingTransport(LoopbackTransport):
+    """
+    Answers the first `answers` requests, then nothing.
+    """
+
+    def __init__(self, answers):
+        super().__init__()
+        self.answers = answers
+        self.sent = 0
+
+    def send(self, data):
+        self.sent += 1
+        if self.sent > self.answers:
+            self._pending = b""
+        else:
+            super().send(data)
+
+
+class FailingStore(SqliteHistoryStore):
+    def store_records(self, *args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def make_slave():
+    slave = SimulatedSlave(1)
+    for table, register in ((701, 7001), (702, 7002)):
+        slave.history[table] = HistoryRing.synthetic(SCHEMA, 10, 6)
+        slave.history_index_registers[register] = table
+        slave.tables.set(register, slave.history[table].current_index)
+    return slave
+
+
+def test_slave_dying_during_readout_skips_its_other_tables(tmp_path):
+    # The index of table 701 is read, its first record read times out.
+    transport = DyingTransport(answers=1)
+    transport.add_slave(make_slave())
+    client = EnronModbusClient(transport, hot_path_logging=False)
+    client.connect()
+    sync = HistorySync(client, SqliteHistoryStore(tmp_path / "history.db"))
+
+    results = sync.sync([HistoryDevice(1, [HOURLY, DAILY])])
+
+    assert [result.table for result in results] == [701]
+    assert isinstance(results[0].error, HistoryReadoutError)
+    assert isinstance(results[0].error.error, TransportTimeoutError)
+    assert transport.sent == 2
+
+
+def test_sync_fetches_new_records_across_rollover(tmp_path):
+    transport = LoopbackTransport()
+    slave = transport.add_slave(make_slave())
+    client = EnronModbusClient(transport, hot_path_logging=False)
+    client.connect()
+    store = SqliteHistoryStore(tmp_path / "history.db")
+    sync = HistorySync(client, store, batch_size=3)
+    device = HistoryDevice(1, [HOURLY])
+
+    [result] = sync.sync([device])
+    assert (result.records, result.last_index, result.error) == (4, 5, None)
+
+    record = slave.history[701][0]
+    for _ in range(6):
+        slave.append_history(701, record)
+    [result] = sync.sync([device])
+    assert (result.records, result.last_index) == (6, 1)
+    [result] = sync.sync([device])
+    assert result.records == 0
+    indices = [record.index for record in store.iter_records(1, 701)]
+    assert indices == [2, 3, 4, 5, 6, 7, 8, 9, 0, 1]
+
+
+def test_records_not_written_yet_are_stored_without_timestamp(tmp_path):
+    transport = LoopbackTransport()
+    slave = transport.add_slave(make_slave())
+    slave.history[701] = HistoryRing.synthetic(SCHEMA, 10, 2)
+    slave.tables.set(7001, 1)
+    client = EnronModbusClient(transport, hot_path_logging=False)
+    client.connect()
+    store = SqliteHistoryStore(tmp_path / "history.db")
+    config = HistoryTableConfig(701, 7001, 10, initial_records=4, schema=SCHEMA)
+
+    [result] = HistorySync(client, store).sync([HistoryDevice(1, [config])])
+
+    assert result.records == 4
+    rows = store.connection.execute(
+        "SELECT record_index, timestamp IS NULL FROM history_records ORDER BY id"
+    ).fetchall()
+    assert rows == [(8, 1), (9, 1), (0, 0), (1, 0)]
+
+
+def test_failed_commit_after_readout_error_keeps_the_readout_error(tmp_path):
+    # The index and two records of table 701 are read, then the slave dies.
+    transport = DyingTransport(answers=3)
+    transport.add_slave(make_slave())
+    client = EnronModbusClient(transport, hot_path_logging=False)
+    client.connect()
+    sync = HistorySync(client, FailingStore(tmp_path / "history.db"))
+
+    results = sync.sync([HistoryDevice(1, [HOURLY, DAILY])])
+
+    assert [result.table for result in results] == [701]
+    assert isinstance(results[0].error, HistoryReadoutError)
+    assert isinstance(results[0].error.error, TransportTimeoutError)
@@ -0,0 +1,91 @@
+import attr
+import pytest
+
+from enron_modbus import messages
+
+
+@pytest.mark.parametrize(
+    "request_, encoded",
+    [
+        (
+            messages.BooleanMultipleWriteRequest(1, 1001, [True] * 9),
+            "010f03e9000902ff0140b5",
+        ),
+        (
+            messages.NumericMultipleWriteRequest(1, 3001, [1, 2]),
+            "01100bb9000204000100029b80",
+        ),
+        (
+            messages.NumericMultipleWriteRequest(1, 7001, [1.5]),
+            "01101b590001043fc000008412",
+        ),
+    ],
+)
+def test_multiple_write_request_encoding(request_, encoded):
+    assert request_.to_bytes().hex() == encoded
+    assert type(request_).from_bytes(bytes.fromhex(encoded)) == request_
+
+
+def test_multiple_write_amounts_fit_one_request():
+    assert messages.get_max_multiple_write_amount(1001) == 1968
+    assert messages.get_max_multiple_write_amount(3001) == 123
+    assert messages.get_max_multiple_write_amount(7001) == 61
+
+
+REQUESTS = [
+    messages.BooleanReadRequest(1, 1001, 20),
+    messages.BooleanWriteRequest(2, 1005, True),
+    messages.BooleanWriteRequest(2, 1005, False),
+    messages.NumericReadRequest(3, 5001, 4),
+    messages.NumericWriteRequest(4, 3001, -2),
+    messages.NumericWriteRequest(4, 5001, 70000),
+    messages.NumericWriteRequest(4, 7001, 1.5),
+    messages.NumericMultipleWriteRequest(5, 5001, [1, -70000]),
+    messages.BooleanMultipleWriteRequest(5, 1001, [True, False, True]),
+    messages.HistoryRequest(6, 701, 12),
+    messages.EventRequest(7),
+]
+
+RESPONSES = [
+    messages.BooleanReadResponse(1, b"\x05\x01"),
+    messages.BooleanWriteResponse(2, 1005, True),
+    messages.NumericReadResponse(3, b"\x00\x01\x11\x70"),
+    messages.NumericWriteResponse(4, 7001, 1.5),
+    messages.NumericMultipleWriteResponse(5, 3001, 2),
+    messages.BooleanMultipleWriteResponse(5, 1001, 3),
+    messages.ExceptionResponse(6, 0x10, messages.ILLEGAL_FUNCTION),
+]
+
+
+@pytest.mark.parametrize("request_", REQUESTS, ids=repr)
+def test_request_round_trip(request_):
+    frame = request_.to_bytes()
+    assert messages.StandardRequestFactory.make_request_from_bytes(frame) == request_
+    assert type(request_).from_bytes(memoryview(frame)) == request_
+
+
+@pytest.mark.parametrize("response", RESPONSES, ids=repr)
+def test_response_round_trip(response):
+    frame = response.to_bytes()
+    assert messages.get_response_frame_length(frame[:4]) == len(frame)
+    assert messages.StandardResponseFactory.make_response_from_bytes(frame) == response
+    assert type(response).from_bytes(memoryview(frame)) == response
+
+
+def test_crc_is_checked_unless_verified_already():
+    frame = bytearray(messages.NumericReadRequest(1, 3001, 2).to_bytes())
+    frame[-1] ^= 0xFF
+
+    with pytest.raises(messages.InvalidCrcError):
+        messages.NumericReadRequest.from_bytes(bytes(frame))
+    assert messages.NumericReadRequest.from_bytes(
+        bytes(frame), verify_crc=False
+    ) == messages.NumericReadRequest(1, 3001, 2)
+
+
+@pytest.mark.parametrize("message", REQUESTS[:1] + RESPONSES[:1], ids=repr)
+def test_messages_are_frozen_and_slotted(message):
+    with pytest.raises(attr.exceptions.FrozenInstanceError):
+        message.slave_address = 9
+    assert not hasattr(message, "__dict__")
+    assert hash(message) == hash(type(message).from_bytes(message.to_bytes()))
@@ -0,0 +1,86 @@
+import pytest
+
+from enron_modbus import client as client_module
+from enron_modbus import messages
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.metrics import ClientMetrics, Histogram
+from enron_modbus.simulator import LoopbackTransport, SimulatedSlave
+from enron_modbus.transports import TransportTimeoutError
+
+
+def make_client(**kwargs):
+    slave = SimulatedSlave(1, supports_multiple_writes=False)
+    slave.tables.set(3001, 100)
+    transport = LoopbackTransport(chunk_size=4)
+    transport.add_slave(slave)
+    return EnronModbusClient(transport, **kwargs)
+
+
+def test_client_records_transactions_and_errors():
+    metrics = ClientMetrics()
+    client = make_client(metrics=metrics, hot_path_logging=False)
+
+    client.read_numeric(1, 3001)
+    client.read_numeric(1, 3001)
+    with pytest.raises(TransportTimeoutError):
+        client.read_numeric(2, 3001)
+    # Answered with an illegal function exception, then written one by one.
+    client.write_numerics(1, {3001: 100, 3002: 101})
+    metrics.record_error(1, 0x03, messages.InvalidCrcError())
+
+    key = (1, 0x03)
+    assert metrics.latency[key].count == 2
+    assert metrics.bytes_sent[key] == 2 * 8
+    # Address, function code, byte count, one 16 bit value and crc.
+    assert metrics.bytes_received[key] == 2 * 7
+    # The transport hands out four bytes at a time.
+    assert metrics.recv_calls[key] == 2 * 2
+    assert metrics.timeouts == {(2, 0x03): 1}
+    assert metrics.errors == {(1, 0x10): 1}
+    assert metrics.latency[(1, 0x06)].count == 2
+    assert metrics.crc_failures == {key: 1}
+
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.cumulative_counts() == [2, 3, 4]
+    assert histogram.sum == pytest.approx(2.65)
+
+
+def test_prometheus_export():
+    metrics = ClientMetrics(latency_buckets=(0.1, 1.0))
+    metrics.record_transaction(1, 3, 0.5, 8, 7, 2)
+    metrics.record_retry(1, 3)
+
+    lines = metrics.to_prometheus(prefix="bus").splitlines()
+
+    assert "# TYPE bus_request_duration_seconds histogram" in lines
+    assert 'bus_request_duration_seconds_bucket{slave="1",function="3",le="0.1"} 0' in lines
+    assert 'bus_request_duration_seconds_bucket{slave="1",function="3",le="1.0"} 1' in lines
+    assert 'bus_request_duration_seconds_bucket{slave="1",function="3",le="+Inf"} 1' in lines
+    assert 'bus_request_duration_seconds_count{slave="1",function="3"} 1' in lines
+    assert 'bus_bytes_received_total{slave="1",function="3"} 7' in lines
+    assert 'bus_retries_total{slave="1",function="3"} 1' in lines
+    assert "# TYPE bus_timeouts_total counter" in lines
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, level):
+        return lambda event, **kw: self.calls.append((level, event))
+
+
+@pytest.mark.parametrize("hot_path_logging", [True, False])
+def test_client_hot_path_logging(monkeypatch, hot_path_logging):
+    log = RecordingLogger()
+    monkeypatch.setattr(client_module, "LOG", log)
+    client = make_client(hot_path_logging=hot_path_logging)
+
+    assert client.read_numeric(1, 3001) == 100
+    assert bool(log.calls) == hot_path_logging
@@ -0,0 +1,63 @@
+import pytest
+
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.planner import ReadBlock, ReadPlanner
+from enron_modbus.simulator import LoopbackTransport, SimulatedSlave
+
+
+def test_plan_merges_small_gaps_and_splits_large_ones():
+    plan = ReadPlanner(max_gap=4).plan([3001, 3003, 3008, 3014, 3002])
+
+    assert plan.blocks == (ReadBlock(3000, 3001, 8), ReadBlock(3000, 3014, 1))
+    assert plan.registers == {3001, 3002, 3003, 3008, 3014}
+
+
+def test_plan_never_spans_tables():
+    plan = ReadPlanner(max_gap=1000).plan([7001, 1999, 3999, 5001, 1001])
+
+    assert [block.table for block in plan.blocks] == [1000, 3000, 5000, 7000]
+    assert plan.blocks[0] == ReadBlock(1000, 1001, 999)
+    assert plan.blocks[0].is_boolean and not plan.blocks[1].is_boolean
+
+
+def test_plan_keeps_blocks_within_max_frame_size():
+    planner = ReadPlanner(max_gap=10, max_frame_size=8)
+    plan = planner.plan(range(7001, 7006))
+
+    # Two floats of 4 bytes per response.
+    assert plan.blocks == (
+        ReadBlock(7000, 7001, 2),
+        ReadBlock(7000, 7003, 2),
+        ReadBlock(7000, 7005, 1),
+    )
+    assert planner.max_amount(1000) == 64
+    with pytest.raises(ValueError):
+        ReadPlanner(max_frame_size=2).plan([7001])
+
+
+class CountingTransport(LoopbackTransport):
+    requests = 0
+
+    def send(self, data):
+        self.requests += 1
+        super().send(data)
+
+
+def test_execute_reads_each_block_once_and_leaves_out_gap_registers():
+    slave = SimulatedSlave(1)
+    for offset in range(10):
+        slave.tables.set(3001 + offset, offset * 10)
+    slave.tables.set(1003, True)
+    transport = CountingTransport()
+    transport.add_slave(slave)
+    client = EnronModbusClient(transport, hot_path_logging=False)
+    plan = ReadPlanner().plan([3001, 3004, 3009, 1003, 1004])
+
+    assert plan.execute(client, 1) == {
+        3001: 0,
+        3004: 30,
+        3009: 80,
+        1003: True,
+        1004: False,
+    }
+    assert transport.requests == len(plan.blocks) == 2
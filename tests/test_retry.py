@@ -0,0 +1,135 @@
+import pytest
+
+from enron_modbus import messages, retry
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.metrics import ClientMetrics
+from enron_modbus.retry import RetryPolicy, SlaveUnavailableError
+from enron_modbus.simulator import LoopbackTransport, SimulatedSlave
+from enron_modbus.transports import TransportTimeoutError, get_character_time
+
+
+def test_timeout_follows_the_slave_turnaround():
+    policy = RetryPolicy(initial_timeout=1.0, min_timeout=0.01, max_timeout=5.0)
+    assert policy.get_timeout(1, 8, 7) == 1.0
+    assert policy.get_timeout(1, 8, 7, attempt=1) == 2.0
+    assert policy.get_timeout(1, 8, 7, attempt=5) == 5.0
+
+    policy.record_success(1, 0.1, 8, 7, attempt=0)
+    # First sample: smoothed 0.1 and variation 0.05.
+    assert policy.get_timeout(1, 8, 7) == pytest.approx(0.3)
+    # Slaves that never answered use the turnaround of the bus.
+    assert policy.get_timeout(2, 8, 7) == pytest.approx(0.3)
+
+    # Responses to retries are not timed.
+    policy.record_success(1, 2.0, 8, 7, attempt=1)
+    assert policy.get_timeout(1, 8, 7) == pytest.approx(0.3)
+
+
+def test_timeout_includes_the_time_on_the_wire():
+    policy = RetryPolicy(baudrate=9600, min_timeout=0.0)
+    policy.record_success(1, 0.0, 8, 7, attempt=0)
+
+    wire_time = policy.get_wire_time(8, 7)
+    assert wire_time > 15 * get_character_time(9600)
+    assert policy.get_timeout(1, 8, 7) == pytest.approx(wire_time)
+
+
+def test_failing_slave_is_backed_off(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(retry.time, "monotonic", lambda: now[0])
+    policy = RetryPolicy(failures_before_backoff=2, min_backoff=5.0, max_backoff=15.0)
+
+    policy.record_failure(1)
+    assert policy.get_attempts(1) == 3
+    policy.record_failure(1)
+    with pytest.raises(SlaveUnavailableError) as error:
+        policy.get_attempts(1)
+    assert error.value.retry_at == 1005.0
+    assert policy.get_attempts(2) == 3
+
+    # After the backoff a single attempt probes the slave.
+    now[0] = 1005.0
+    assert policy.get_attempts(1) == 1
+    policy.record_failure(1)
+    with pytest.raises(SlaveUnavailableError) as error:
+        policy.get_attempts(1)
+    assert error.value.retry_at == 1015.0
+    now[0] = 1015.0
+    policy.record_failure(1)
+    with pytest.raises(SlaveUnavailableError) as error:
+        policy.get_attempts(1)
+    assert error.value.retry_at == 1030.0
+
+    now[0] = 1030.0
+    policy.record_success(1, 0.1, 8, 7, attempt=0)
+    assert policy.get_attempts(1) == 3
+
+
+class DroppingTransport(LoopbackTransport):
+    """Leaves the first `drops` requests unanswered."""
+
+    def __init__(self, slave, drops):
+        super().__init__()
+        self.add_slave(slave)
+        self.drops = drops
+        self.timeouts = []
+
+    def set_timeout(self, timeout):
+        self.timeouts.append(timeout)
+
+    def send(self, data):
+        super().send(data)
+        if self.drops:
+            self.drops -= 1
+            self._pending = b""
+
+
+def make_client(drops, slave=None, **kwargs):
+    if slave is None:
+        slave = SimulatedSlave(1)
+        slave.tables.set(3001, 100)
+    transport = DroppingTransport(slave, drops)
+    metrics = ClientMetrics()
+    client = EnronModbusClient(
+        transport,
+        hot_path_logging=False,
+        metrics=metrics,
+        retry_policy=RetryPolicy(initial_timeout=0.5, **kwargs),
+    )
+    return client, transport, metrics
+
+
+def test_client_retries_timeouts_with_longer_timeouts():
+    client, transport, metrics = make_client(drops=2)
+
+    assert client.read_numeric(1, 3001) == 100
+    assert transport.timeouts == [0.5, 1.0, 2.0]
+    assert metrics.retries == {(1, 0x03): 2}
+    assert metrics.timeouts == {(1, 0x03): 2}
+
+
+def test_client_gives_up_and_backs_off_the_slave():
+    client, transport, metrics = make_client(
+        drops=6, max_attempts=2, failures_before_backoff=3
+    )
+
+    for _ in range(2):
+        with pytest.raises(TransportTimeoutError):
+            client.read_numeric(1, 3001)
+    assert len(transport.timeouts) == 4
+    # The third failed request in a row puts the slave in backoff.
+    with pytest.raises(TransportTimeoutError):
+        client.read_numeric(1, 3001)
+    with pytest.raises(SlaveUnavailableError):
+        client.read_numeric(1, 3001)
+    assert len(transport.timeouts) == 6
+
+
+def test_slave_exceptions_are_not_retried():
+    slave = SimulatedSlave(1, supports_multiple_writes=False)
+    client, transport, metrics = make_client(drops=0, slave=slave)
+
+    with pytest.raises(messages.SlaveExceptionError):
+        client.make_request(messages.NumericMultipleWriteRequest(1, 3001, [1, 2]))
+    assert len(transport.timeouts) == 1
+    assert not metrics.retries
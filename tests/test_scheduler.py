@@ -0,0 +1,80 @@
+import queue
+import time
+
+from enron_modbus.scheduler import PollJob, PollScheduler
+from enron_modbus.transports import TransportException
+
+
+class FakeClient:
+    """
+    Answers numeric reads with the slave address, after delays[slave_address]
+    seconds. The first `connect_failures` connects fail.
+    """
+
+    def __init__(self, delays=None, connect_failures=0):
+        self.delays = delays or {}
+        self.connect_failures = connect_failures
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        if self.connects <= self.connect_failures:
+            raise TransportException("Connection refused")
+
+    def disconnect(self):
+        pass
+
+    def read_numerics(self, slave_address, start_register, amount):
+        time.sleep(self.delays.get(slave_address, 0))
+        registers = range(start_register, start_register + amount)
+        return {register: slave_address for register in registers}
+
+
+def run_scheduler(client, jobs, results_wanted, reconnect_delay=1.0):
+    results = queue.Queue()
+    scheduler = PollScheduler(results.put)
+    scheduler.add_bus("bus", client).reconnect_delay = reconnect_delay
+    for job in jobs:
+        scheduler.add_job("bus", job)
+    scheduler.start()
+    try:
+        return [results.get(timeout=2) for _ in range(results_wanted)], scheduler
+    finally:
+        scheduler.stop(timeout=2)
+
+
+def test_due_jobs_run_by_priority_then_due_time():
+    jobs = [
+        PollJob(2, [7001], interval=10, priority=1),
+        PollJob(3, [7001], interval=10, priority=0),
+        PollJob(1, [7001], interval=10, priority=1),
+    ]
+    results, _ = run_scheduler(FakeClient(), jobs, 3)
+    assert [result.job.slave_address for result in results] == [3, 2, 1]
+    assert [result.values for result in results] == [{7001: 3}, {7001: 2}, {7001: 1}]
+
+
+def test_job_late_past_its_deadline_skips_cycles():
+    slow = PollJob(1, [7001], interval=10, priority=0)
+    fast = PollJob(2, [7001], interval=0.1, priority=1, deadline=0.05)
+    results, scheduler = run_scheduler(FakeClient({1: 0.3}), [slow, fast], 2)
+    assert results[0].job is slow
+    assert results[1].job is fast
+    assert results[1].missed_cycles >= 2
+    assert results[1].latency < fast.interval
+    assert scheduler.get_stats()["bus"].missed_cycles >= results[1].missed_cycles
+
+
+def test_connect_failure_fails_polls_and_reconnects_with_backoff():
+    client = FakeClient(connect_failures=2)
+    job = PollJob(1, [7001], interval=0.02, deadline=1)
+    results, scheduler = run_scheduler(client, [job], 12, reconnect_delay=0.05)
+
+    failed = [result for result in results if result.error is not None]
+    assert all(isinstance(result.error, TransportException) for result in failed)
+    # Polls between attempts fail without trying to connect.
+    assert len(failed) > client.connect_failures
+    assert results[-1].values == {7001: 1}
+    assert client.connects == 3
+    stats = scheduler.get_stats()["bus"]
+    assert (stats.connect_failures, stats.errors) == (2, len(failed))
@@ -0,0 +1,58 @@
+import asyncio
+import gc
+import importlib
+import sys
+
+import pytest
+
+from enron_modbus import messages
+from enron_modbus.simulator import SimulatedBus, SimulatorServer
+from enron_modbus.transports import MBAP_HEADER
+
+
+def test_modbus_tcp_responses_survive_garbage_collection_and_close_cancels_them():
+    async def run():
+        bus = SimulatedBus.with_slaves([1], latency=0.1)
+        server = SimulatorServer(bus)
+        port = await server.serve_tcp(modbus_tcp=True)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        pdu = messages.NumericReadRequest(1, 3001, 1).to_bytes()[1:-2]
+        for transaction_id in range(3):
+            writer.write(MBAP_HEADER.pack(transaction_id, 0, len(pdu) + 1, 1) + pdu)
+        await asyncio.sleep(0.05)
+        gc.collect()
+        responses = set()
+        for _ in range(3):
+            header = await asyncio.wait_for(reader.readexactly(MBAP_HEADER.size), 1)
+            transaction_id, _, length, _ = MBAP_HEADER.unpack(header)
+            await reader.readexactly(length - 1)
+            responses.add(transaction_id)
+
+        # A request still being answered when the server closes is cancelled.
+        writer.write(MBAP_HEADER.pack(3, 0, len(pdu) + 1, 1) + pdu)
+        await asyncio.sleep(0.05)
+        assert len(server._tasks) == 1
+        await server.close()
+        writer.close()
+        return responses, server._tasks
+
+    responses, tasks = asyncio.run(run())
+    assert responses == {0, 1, 2}
+    assert not tasks
+
+
+def test_simulator_imports_without_tty(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tty", None)
+    monkeypatch.delitem(sys.modules, "enron_modbus.simulator")
+    assert importlib.import_module("enron_modbus.simulator").SimulatorServer
+
+
+def test_corrupt_rate_is_rejected_for_modbus_tcp():
+    async def run():
+        server = SimulatorServer(SimulatedBus.with_slaves([1], corrupt_rate=0.5))
+        with pytest.raises(ValueError):
+            await server.serve_tcp(modbus_tcp=True)
+        await server.serve_tcp()
+        await server.close()
+
+    asyncio.run(run())
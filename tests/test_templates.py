@@ -0,0 +1,95 @@
+import asyncio
+
+from enron_modbus import messages
+from enron_modbus.async_client import AsyncEnronModbusClient
+from enron_modbus.async_transports import AsyncTcpTransport
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.planner import ReadPlanner
+from enron_modbus.simulator import (
+    LoopbackTransport,
+    SimulatedBus,
+    SimulatedSlave,
+    SimulatorServer,
+)
+from enron_modbus.templates import PollTemplate
+
+REGISTERS = [1001, 1003, 1010, 3001, 3004, 5002, 7001, 7003]
+
+
+def make_slave():
+    slave = SimulatedSlave(1)
+    slave.tables.set(1003, True)
+    slave.tables.set(1010, True)
+    slave.tables.set(3004, -7)
+    slave.tables.set(5002, 70000)
+    slave.tables.set(7003, 2.5)
+    return slave
+
+
+class FrameRecordingTransport(LoopbackTransport):
+    def __init__(self, slave):
+        super().__init__()
+        self.add_slave(slave)
+        self.frames = []
+
+    def send(self, data):
+        self.frames.append(data)
+        super().send(data)
+
+
+EXPECTED = {
+    1001: False,
+    1003: True,
+    1010: True,
+    3001: 0,
+    3004: -7,
+    5002: 70000,
+    7001: 0.0,
+    7003: 2.5,
+}
+
+
+def test_template_sends_the_frames_compiled_up_front(monkeypatch):
+    template = PollTemplate.compile(1, REGISTERS)
+    transport = FrameRecordingTransport(make_slave())
+    client = EnronModbusClient(transport, hot_path_logging=False)
+    plan = ReadPlanner().plan(REGISTERS)
+
+    assert [read.request.start_register for read in template.reads] == [
+        block.start_register for block in plan.blocks
+    ]
+    assert all(read.frame == read.request.to_bytes() for read in template.reads)
+
+    def fail(self):
+        raise AssertionError("request encoded again")
+
+    monkeypatch.setattr(messages.BooleanReadRequest, "to_bytes", fail)
+    monkeypatch.setattr(messages.NumericReadRequest, "to_bytes", fail)
+    for _ in range(2):
+        assert template.execute(client) == EXPECTED
+    assert transport.frames == [read.frame for read in template.reads] * 2
+
+
+def test_template_gives_the_same_values_as_the_plan():
+    client = EnronModbusClient(
+        FrameRecordingTransport(make_slave()), hot_path_logging=False
+    )
+    planner = ReadPlanner(max_gap=0)
+    template = PollTemplate.compile(1, REGISTERS, planner)
+
+    assert template.execute(client) == planner.read(client, 1, REGISTERS) == EXPECTED
+
+
+def test_template_on_the_async_client():
+    async def run():
+        simulator = SimulatorServer(SimulatedBus({1: make_slave()}))
+        port = await simulator.serve_tcp()
+        client = AsyncEnronModbusClient(
+            AsyncTcpTransport("127.0.0.1", port, timeout=1), hot_path_logging=False
+        )
+        async with client:
+            values = await PollTemplate.compile(1, REGISTERS).execute_async(client)
+        await simulator.close()
+        return values
+
+    assert asyncio.run(run()) == EXPECTED
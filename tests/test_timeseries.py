@@ -0,0 +1,17 @@
+import array
+
+from enron_modbus import utils
+from enron_modbus.timeseries import SampleStore
+
+
+def test_sample_store_takes_numeric_arrays_and_boolean_bits():
+    store = SampleStore(capacity=4)
+    store.add(1, utils.NumericArray(7001, array.array("f", [1.5, 2.5])), timestamp=10)
+    store.add(1, utils.NumericArray(3001, array.array("h", [-3])), timestamp=10)
+    store.add(1, utils.boolean_bits_from_response(1001, 2, b"\x02"), timestamp=10)
+    store.add(1, {7001: 3.5}, timestamp=20)
+    assert list(store[(1, 7001)]) == [(10, 1.5), (20, 3.5)]
+    assert list(store[(1, 7002)]) == [(10, 2.5)]
+    assert list(store[(1, 3001)]) == [(10, -3)]
+    assert list(store[(1, 1001)]) == [(10, 0)]
+    assert list(store[(1, 1002)]) == [(10, 1)]
@@ -0,0 +1,148 @@
+import socket
+import threading
+import time
+
+import pytest
+import serial
+
+from enron_modbus import messages, transports
+from enron_modbus.client import EnronModbusClient
+from enron_modbus.retry import RetryPolicy
+from enron_modbus.simulator import SimulatedSlave
+from enron_modbus.transports import TcpTransport, TransportTimeoutError
+
+
+def serve_slow_slave(slave, delays):
+    """
+    Serve `slave` over RTU over TCP on a thread, answering the n-th request after
+    delays[n]. Requests are assumed to arrive in one segment each.
+    """
+    server = socket.create_server(("127.0.0.1", 0))
+
+    def run():
+        conn, _ = server.accept()
+        with conn:
+            number = 0
+            while True:
+                frame = conn.recv(256)
+                if not frame:
+                    return
+                time.sleep(delays[number] if number < len(delays) else 0)
+                number += 1
+                conn.sendall(slave.handle_frame(frame))
+
+    threading.Thread(target=run, daemon=True).start()
+    return server, server.getsockname()[1]
+
+
+def test_tcp_transport_drops_late_response_once():
+    slave = SimulatedSlave(1)
+    slave.tables.set(3001, 100)
+    slave.tables.set(3002, 111)
+    server, port = serve_slow_slave(slave, [0.2])
+    transport = TcpTransport("127.0.0.1", port, timeout=0.1)
+    client = EnronModbusClient(transport)
+    with server:
+        client.connect()
+        with pytest.raises(TransportTimeoutError):
+            client.read_numeric(1, 3001)
+        assert transport._broken
+        time.sleep(0.2)
+        assert client.read_numerics(1, 3002, 1) == {3002: 111}
+        assert not transport._broken
+        assert client.read_numerics(1, 3001, 1) == {3001: 100}
+        client.disconnect()
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, level):
+        return lambda event, **kw: self.calls.append((level, event))
+
+
+@pytest.mark.parametrize("hot_path_logging", [True, False])
+def test_tcp_transport_hot_path_logging(monkeypatch, hot_path_logging):
+    log = RecordingLogger()
+    monkeypatch.setattr(transports, "LOG", log)
+    slave = SimulatedSlave(1)
+    slave.tables.set(3001, 100)
+    server, port = serve_slow_slave(slave, [])
+    transport = TcpTransport("127.0.0.1", port, hot_path_logging=hot_path_logging)
+    with server:
+        transport.connect()
+        log.calls.clear()
+        transport.send(messages.NumericReadRequest(1, 3001, 1).to_bytes())
+        assert transport.recv(256)
+        assert bool(log.calls) == hot_path_logging
+        transport.disconnect()
+
+
+def test_retry_answered_twice_leaves_no_response_behind():
+    slave = SimulatedSlave(1)
+    slave.tables.set(3001, 100)
+    slave.tables.set(3002, 111)
+    server, port = serve_slow_slave(slave, [0.15])
+    policy = RetryPolicy(max_attempts=2, initial_timeout=0.1)
+    client = EnronModbusClient(TcpTransport("127.0.0.1", port), retry_policy=policy)
+    with server:
+        client.connect()
+        assert client.read_numerics(1, 3001, 1) == {3001: 100}
+        time.sleep(0.05)
+        assert client.read_numerics(1, 3002, 1) == {3002: 111}
+        client.disconnect()
+
+
+def test_modbus_tcp_channel_forgets_transactions_when_closed():
+    server = socket.create_server(("127.0.0.1", 0))
+    channel = transports.ModbusTcpChannel("127.0.0.1", server.getsockname()[1])
+    pdu = messages.NumericReadRequest(1, 3001, 1).to_bytes()[1:-2]
+    with server:
+        channel.open()
+        abandoned = channel.submit(1, pdu)
+        waiting = channel.submit(1, pdu)
+        with pytest.raises(TransportTimeoutError):
+            channel.collect(abandoned, timeout=0.05)
+        assert channel.in_flight == 2
+
+        channel.close()
+        assert channel.in_flight == 0
+        with pytest.raises(transports.NotConnectedError):
+            channel.collect(waiting)
+        channel.open()
+        assert channel.in_flight == 0
+        channel.close()
+
+
+def make_loop_serial_transport(**kwargs):
+    transport = transports.SerialTransport("loop://", 9600, **kwargs)
+    transport.serial_port = serial.serial_for_url("loop://", timeout=transport.timeout)
+    return transport
+
+
+def test_serial_recv_returns_short_reply_after_frame_silence():
+    transport = make_loop_serial_transport(timeout=1)
+    reply = messages.ExceptionResponse(1, 0x03, messages.ILLEGAL_DATA_ADDRESS).to_bytes()
+    transport.serial_port.write(reply)
+
+    started = time.monotonic()
+    assert transport.recv(256) == reply
+    assert time.monotonic() - started < 0.1
+    transport.disconnect()
+
+
+def test_serial_recv_reads_a_frame_sent_in_bursts_until_silence():
+    transport = make_loop_serial_transport(timeout=1, frame_silence=0.05)
+    port = transport.serial_port
+
+    def send_later(delay, data):
+        time.sleep(delay)
+        port.write(data)
+
+    port.write(b"\x01\x02")
+    threading.Thread(target=send_later, args=(0.02, b"\x03\x04")).start()
+    threading.Thread(target=send_later, args=(0.2, b"\x05")).start()
+    assert transport.recv(256) == b"\x01\x02\x03\x04"
+    assert transport.recv(256) == b"\x05"
+    transport.disconnect()
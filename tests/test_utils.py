@@ -0,0 +1,11 @@
+from enron_modbus import utils
+
+
+def test_boolean_bits_compare_like_a_dict():
+    bits = utils.boolean_bits_from_response(3001, 3, b"\x05")
+    assert bits == {3001: True, 3002: False, 3003: True}
+    assert {3001: True, 3002: False, 3003: True} == bits
+    assert bits != {3001: True, 3002: False}
+    assert bits == utils.map_boolean_response(3001, 3, b"\x05")
+    assert bits == utils.BooleanBits(3001, 3, 0b101)
+    assert bits != utils.BooleanBits(3001, 3, 0b100)